@@ -1,4 +1,6 @@
 # Can't use -m or -c in main.c, would import from current working directory (user's home)
 from porcupine.__main__ import main
 
-main()
+# Processes started with multiprocessing import this file, and they must not start Porcupine
+if __name__ == "__main__":
+    main()
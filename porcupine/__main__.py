@@ -1,11 +1,13 @@
 import argparse
 import logging
 import sys
+import time
 from pathlib import Path
 
 from porcupine import __version__ as porcupine_version
 from porcupine import (
     _logs,
+    _profiling,
     _state,
     dirs,
     get_main_window,
@@ -68,6 +70,19 @@ def main() -> None:
         ),
     )
 
+    parser.add_argument(
+        "--profile-startup",
+        metavar="FILE",
+        nargs="?",
+        const=str(dirs.user_log_path / "startup_profile.json"),
+        help=(
+            "measure time and memory used by each plugin and other parts of"
+            " starting Porcupine, and write the results to FILE as JSON"
+            " (default: startup_profile.json in the log directory),"
+            " this makes starting Porcupine slower"
+        ),
+    )
+
     plugingroup = parser.add_argument_group("plugin loading options")
     plugingroup.add_argument(
         "--no-plugins",
@@ -87,8 +102,19 @@ def main() -> None:
             " multiple plugin names can be given comma-separated"
         ),
     )
+    plugingroup.add_argument(
+        "--no-lazy-plugins",
+        action="store_false",
+        dest="lazy_plugins",
+        help=(
+            "set up all plugins before showing the main window, even if they would"
+            " normally be loaded later to make Porcupine start faster"
+        ),
+    )
 
     args_parsed_in_first_step, junk = parser.parse_known_args()
+    if args_parsed_in_first_step.profile_startup is not None:
+        _profiling.start_tracking_memory()
 
     dirs.user_cache_path.mkdir(parents=True, exist_ok=True)
     (dirs.user_config_path / "plugins").mkdir(parents=True, exist_ok=True)
@@ -98,13 +124,14 @@ def main() -> None:
         verbose_loggers=(args_parsed_in_first_step.verbose_logger or []),
     )
 
-    settings.init_enough_for_using_disabled_plugins_list()
+    with _profiling.measure("core", "settings (disabled plugins)"):
+        settings.init_enough_for_using_disabled_plugins_list()
     if args_parsed_in_first_step.use_plugins:
         if args_parsed_in_first_step.without_plugins:
             disable_list = args_parsed_in_first_step.without_plugins.split(",")
         else:
             disable_list = []
-        pluginloader.import_plugins(disable_list)
+        pluginloader.import_plugins(disable_list, lazy=args_parsed_in_first_step.lazy_plugins)
 
         bad_disables = set(disable_list) - {info.name for info in pluginloader.plugin_infos}
         if bad_disables:
@@ -137,8 +164,10 @@ def main() -> None:
     # Prevent showing up a not-ready-yet root window to user
     get_main_window().withdraw()
 
-    settings.init_the_rest_after_initing_enough_for_using_disabled_plugins_list()
-    menubar._init()
+    with _profiling.measure("core", "settings"):
+        settings.init_the_rest_after_initing_enough_for_using_disabled_plugins_list()
+    with _profiling.measure("core", "menubar"):
+        menubar._init()
     pluginloader.run_setup_functions(args.shuffle_plugins)
 
     tabmanager = get_tab_manager()
@@ -156,6 +185,17 @@ def main() -> None:
             tabmanager.open_file(Path(path_string))
 
     get_main_window().deiconify()
+    shown = time.perf_counter()
+    get_main_window().after_idle(
+        lambda: _profiling.add_step("core", "first mainloop iteration", shown, time.perf_counter())
+    )
+
+    def startup_done() -> None:
+        _profiling.log_timeline()
+        if args.profile_startup is not None:
+            _profiling.write_json(Path(args.profile_startup))
+
+    pluginloader.load_deferred_plugins(startup_done)
     try:
         get_main_window().mainloop()
     finally:
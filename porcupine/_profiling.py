@@ -0,0 +1,104 @@
+"""Measure what happens when Porcupine starts, see --profile-startup."""
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import json
+import logging
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Iterator
+
+import porcupine
+
+log = logging.getLogger(__name__)
+
+# This module is imported early, so this is close enough to when Porcupine started
+_start_time = time.perf_counter()
+
+
+@dataclasses.dataclass
+class StartupStep:
+    category: str  # "import" or "setup" for plugins, something else for other things
+    name: str
+    start: float  # milliseconds since Porcupine started
+    duration: float  # milliseconds
+    allocated: int | None  # bytes, None if memory isn't being tracked
+
+
+steps: list[StartupStep] = []
+
+
+def start_tracking_memory() -> None:
+    # This makes everything slower, so it's only done with --profile-startup
+    tracemalloc.start()
+
+
+def _get_memory_usage() -> int | None:
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return None
+
+
+@contextlib.contextmanager
+def measure(category: str, name: str) -> Iterator[None]:
+    memory_before = _get_memory_usage()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        memory_after = _get_memory_usage()
+        if memory_before is None or memory_after is None:
+            allocated = None
+        else:
+            allocated = memory_after - memory_before
+        add_step(category, name, start, end, allocated)
+
+
+def add_step(
+    category: str, name: str, start: float, end: float, allocated: int | None = None
+) -> None:
+    steps.append(
+        StartupStep(
+            category=category,
+            name=name,
+            start=(start - _start_time) * 1000,
+            duration=(end - start) * 1000,
+            allocated=allocated,
+        )
+    )
+
+
+def get_plugin_steps(plugin_name: str) -> list[StartupStep]:
+    return [
+        step for step in steps if step.category in {"import", "setup"} and step.name == plugin_name
+    ]
+
+
+def describe_step(step: StartupStep) -> str:
+    result = f"{step.duration:.1f} milliseconds"
+    if step.allocated is not None:
+        result += f", {step.allocated / 1024:.0f} KiB allocated"
+    return result
+
+
+def log_timeline() -> None:
+    lines = [
+        f"{step.start:8.1f}ms  {step.category} {step.name} ({describe_step(step)})"
+        for step in sorted(steps, key=(lambda step: step.start))
+    ]
+    log.info("startup timeline, relative to starting Porcupine:\n" + "\n".join(lines))
+
+
+def write_json(path: Path) -> None:
+    result = {
+        "porcupine_version": porcupine.__version__,
+        "steps": [dataclasses.asdict(step) for step in steps],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as file:
+        json.dump(result, file, indent=4)
+        file.write("\n")
+    log.info(f"wrote startup profile to {path}")
@@ -21,6 +21,7 @@ if {[tk windowingsystem] == "aqua"} {
 
 event add "<<Menubar:File/New File>>" <$control_ish-n>
 event add "<<Menubar:File/Open>>" <$control_ish-o>
+event add "<<Menubar:File/Quick Open>>" <$control_ish-p>
 event add "<<Menubar:File/Save>>" <$control_ish-s>
 event add "<<Menubar:File/Save As>>" <$control_ish-S>   ;# uppercase S means you need to hold down shift
 event add "<<Menubar:File/Close>>" <$control_ish-w>
@@ -48,6 +49,9 @@ event add "<<Run:Repeat3>>" <F8>
 # gotoline plugin
 event add "<<Menubar:Edit/Go to Line>>" <$control_ish-l>
 
+# go_to_symbol plugin
+event add "<<Menubar:Edit/Go to Symbol>>" <$control_ish-t>
+
 # google search plugin
 event add "<<Menubar:Tools/Search selected text on Google>>" <$control_ish-g>
 
@@ -57,6 +61,9 @@ event add "<<Menubar:View/Toggle Full Screen>>" <F11>
 # find plugin
 event add "<<Menubar:Edit/Find and Replace>>" <$control_ish-f>
 
+# find_in_project plugin
+event add "<<Menubar:Edit/Find in Project>>" <$control_ish-F>
+
 # fold plugin
 event add "<<Menubar:Edit/Fold>>" <$alt_ish-f>
 
@@ -8,16 +8,19 @@ import argparse
 import dataclasses
 import enum
 import importlib.machinery
+import importlib.util
 import logging
 import pkgutil
 import random
+import re
 import time
 import traceback
-from typing import Any, Iterable, List, Sequence
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Sequence
 
 import toposort
 
-from porcupine import get_main_window
+from porcupine import _profiling, get_main_window, get_tab_manager, tabs
 from porcupine.plugins import __path__ as plugin_paths
 from porcupine.settings import global_settings
 
@@ -33,6 +36,8 @@ class Status(enum.Enum):
 
         The plugin hasn't been set up successfully yet, but no errors
         preventing the setup have occurred.
+        Plugins that set ``load_when`` (see :class:`PluginInfo`) have this status
+        until they get set up.
 
     .. data:: ACTIVE
 
@@ -114,6 +119,24 @@ class PluginInfo:
           ``Traceback (most recent call last):``.
         * If *status* is ``CIRCULAR_DEPENDENCY_ERROR``, then *error* is a
           user-readable one-line message.
+
+    The *load_when* string comes from a ``load_when = "..."`` line in the plugin's
+    source code, and it tells when the plugin should be imported and set up.
+    The line is found without importing the plugin, so the value must be
+    a string literal on a line of its own. These values are supported:
+
+        * ``"startup"`` (the default): before the main window is shown.
+        * ``"idle"``: soon after the main window is shown.
+        * ``"filetab"``: when the first :class:`porcupine.tabs.FileTab` is opened.
+        * ``"filetype:Python"``: when a tab with the given filetype is opened.
+        * ``"event:<<Foo>>"``: when the ``<<Foo>>`` virtual event is generated on
+          the main window. The event is generated again after setting up the plugin.
+
+    Plugins that aren't loaded on startup are still imported soon after the
+    main window is shown, so that loading them later is fast.
+    If a plugin must be set up before another plugin that loads on startup,
+    then it also loads on startup, regardless of *load_when*.
+    Plugins with a ``setup_argument_parser()`` function must load on startup.
     """
 
     name: str
@@ -121,12 +144,17 @@ class PluginInfo:
     status: Status
     module: Any | None  # you have to check for None, otherwise mypy won't complain
     error: str | None
+    load_when: str = "startup"
 
 
 _mutable_plugin_infos: list[PluginInfo] = []
 plugin_infos: Sequence[PluginInfo] = _mutable_plugin_infos  # changing content is mypy error
 _dependencies: dict[PluginInfo, set[PluginInfo]] = {}
 
+# Regex instead of importing or ast-parsing, because this runs for every
+# plugin on every startup and must be fast
+_LOAD_WHEN_REGEX = re.compile(r'^load_when = "([^"\n]*)"', flags=re.MULTILINE)
+
 
 def _run_setup_argument_parser_function(info: PluginInfo, parser: argparse.ArgumentParser) -> None:
     assert info.status == Status.LOADING
@@ -153,7 +181,8 @@ def _import_plugin(info: PluginInfo) -> None:
     start = time.perf_counter()
 
     try:
-        info.module = importlib.import_module(f"porcupine.plugins.{info.name}")
+        with _profiling.measure("import", info.name):
+            info.module = importlib.import_module(f"porcupine.plugins.{info.name}")
         setup_before = set(getattr(info.module, "setup_before", []))
         setup_after = set(getattr(info.module, "setup_after", []))
     except Exception:
@@ -188,7 +217,8 @@ def _run_setup_and_set_status(info: PluginInfo) -> None:
         start = time.perf_counter()
         try:
             log.debug(f"calling porcupine.plugins.{info.name}.setup()")
-            info.module.setup()
+            with _profiling.measure("setup", info.name):
+                info.module.setup()
         except Exception:
             log.exception(f"{info.name}.setup() doesn't work")
             info.status = Status.SETUP_FAILED
@@ -220,8 +250,39 @@ def _did_plugin_come_with_porcupine(finder: object) -> bool:
     return isinstance(finder, importlib.machinery.FileFinder) and finder.path == plugin_paths[-1]
 
 
+def _read_load_when(name: str) -> str:
+    spec = importlib.util.find_spec(f"porcupine.plugins.{name}")
+    if spec is None or spec.origin is None or not spec.has_location:
+        return "startup"
+
+    try:
+        source = Path(spec.origin).read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        # Importing will likely fail too, and it shows a better error message
+        return "startup"
+
+    match = _LOAD_WHEN_REGEX.search(source)
+    if match is None:
+        return "startup"
+
+    load_when = match.group(1)
+    if (
+        load_when in {"startup", "idle", "filetab"}
+        or (load_when.startswith("filetype:") and load_when != "filetype:")
+        or (load_when.startswith("event:<<") and load_when.endswith(">>"))
+    ):
+        return load_when
+
+    log.warning(f"plugin {name} has load_when = {load_when!r}, loading it on startup instead")
+    return "startup"
+
+
+def _is_deferred(info: PluginInfo) -> bool:
+    return info.status == Status.LOADING and info.load_when != "startup"
+
+
 # undocumented on purpose, don't use in plugins
-def import_plugins(disabled_on_command_line: list[str]) -> None:
+def import_plugins(disabled_on_command_line: list[str], *, lazy: bool = False) -> None:
     assert not _mutable_plugin_infos and not _dependencies
     _mutable_plugin_infos.extend(
         PluginInfo(
@@ -246,20 +307,43 @@ def import_plugins(disabled_on_command_line: list[str]) -> None:
         if info.name in disabled_on_command_line:
             info.status = Status.DISABLED_ON_COMMAND_LINE
             continue
+        if lazy:
+            info.load_when = _read_load_when(info.name)
+            if info.load_when != "startup":
+                continue  # imported in load_deferred_plugins()
         _import_plugin(info)
 
+    # Plugins loaded on startup may need to be set up after deferred plugins.
+    # Importing a plugin can reveal more dependencies, hence the loop.
+    while True:
+        needed_on_startup = {
+            dep
+            for info in plugin_infos
+            if info.status == Status.LOADING and info.module is not None
+            for dep in _dependencies[info]
+            if dep.status == Status.LOADING and dep.module is None
+        }
+        if not needed_on_startup:
+            break
+        for info in needed_on_startup:
+            log.info(f"loading {info.name} on startup, because another plugin depends on it")
+            info.load_when = "startup"
+            _import_plugin(info)
+
 
 # undocumented on purpose, don't use in plugins
 # TODO: document what setup_argument_parser() function in a plugin does
 def run_setup_argument_parser_functions(parser: argparse.ArgumentParser) -> None:
     for info in plugin_infos:
-        if info.status == Status.LOADING:
+        if info.status == Status.LOADING and info.module is not None:
             _run_setup_argument_parser_function(info, parser)
 
 
 # undocumented on purpose, don't use in plugins
 def run_setup_functions(shuffle: bool) -> None:
-    imported_infos = [info for info in plugin_infos if info.status == Status.LOADING]
+    imported_infos = [
+        info for info in plugin_infos if info.status == Status.LOADING and not _is_deferred(info)
+    ]
 
     # the toposort will partially work even if there's a circular
     # dependency, the CircularDependencyError is raised after doing
@@ -268,7 +352,7 @@ def run_setup_functions(shuffle: bool) -> None:
     try:
         toposort_result: Iterable[Iterable[PluginInfo]] = toposort.toposort(_dependencies)
         for infos in toposort_result:
-            load_list = [info for info in infos if info.status == Status.LOADING]
+            load_list = [info for info in infos if info in imported_infos]
             if shuffle:
                 # for plugin developers wanting to make sure that the
                 # dependencies specified in setup_before and setup_after
@@ -294,6 +378,155 @@ def run_setup_functions(shuffle: bool) -> None:
     get_main_window().event_generate("<<PluginsLoaded>>")
 
 
+def _import_deferred_plugin(info: PluginInfo) -> None:
+    assert _is_deferred(info) and info.module is None
+    _import_plugin(info)
+    if info.status == Status.LOADING and hasattr(info.module, "setup_argument_parser"):
+        info.status = Status.SETUP_FAILED
+        info.error = (
+            f"The plugin has load_when = {info.load_when!r} and a setup_argument_parser()"
+            " function. Plugins with setup_argument_parser() must load on startup."
+        )
+        log.error(f"plugin {info.name}: {info.error}")
+
+
+def _find_deferred_dependencies(info: PluginInfo) -> set[PluginInfo]:
+    result = {info}
+    todo = [info]
+    while todo:
+        for dep in _dependencies[todo.pop()]:
+            if _is_deferred(dep) and dep not in result:
+                result.add(dep)
+                todo.append(dep)
+    return result
+
+
+def _setup_deferred_plugin(info: PluginInfo, reason: str) -> None:
+    if not _is_deferred(info):
+        return
+
+    # Import only this plugin and what it needs, other deferred plugins wait for
+    # their own load_when. Importing a plugin can reveal more dependencies, hence
+    # the loop. If a plugin that isn't imported yet has setup_before pointing at
+    # one of these, the warning below is shown when that plugin gets set up.
+    while True:
+        needed = _find_deferred_dependencies(info)
+        not_imported = [dep for dep in needed if dep.module is None]
+        if not not_imported:
+            break
+        for dep in not_imported:
+            _import_deferred_plugin(dep)
+    if not _is_deferred(info):  # importing failed
+        return
+
+    try:
+        loading_order = toposort.toposort_flatten(
+            {i: _dependencies[i] & needed for i in needed}, sort=False
+        )
+    except toposort.CircularDependencyError as e:
+        log.error(f"circular dependency when loading {info.name}")
+        parts = ", ".join(f"{a} depends on {b}" for a, b in e.data.items())
+        for dep in needed:
+            dep.status = Status.CIRCULAR_DEPENDENCY_ERROR
+            dep.error = f"Circular dependency error: {parts}"
+        return
+
+    for dep in loading_order:
+        already_set_up = [
+            other.name
+            for other, other_must_setup_after_these in _dependencies.items()
+            if other.status in {Status.ACTIVE, Status.SETUP_FAILED}
+            and dep in other_must_setup_after_these
+        ]
+        if already_set_up:
+            log.warning(
+                f"plugin {dep.name} should be set up before {', '.join(already_set_up)},"
+                f" but it has load_when = {dep.load_when!r}"
+            )
+
+        log.info(f"setting up plugin {dep.name} (load_when = {dep.load_when!r}, reason: {reason})")
+        _run_setup_and_set_status(dep)
+
+    if any(dep.status == Status.ACTIVE for dep in loading_order):
+        get_main_window().event_generate("<<PluginsLoaded>>")
+
+
+def _add_trigger(info: PluginInfo) -> None:
+    if info.load_when == "filetab":
+        get_tab_manager().add_filetab_callback(
+            lambda tab: _setup_deferred_plugin(info, "a FileTab was opened")
+        )
+
+    elif info.load_when.startswith("filetype:"):
+        filetype_name = info.load_when.split(":", 1)[1]
+
+        def check_filetype(tab: tabs.FileTab) -> None:
+            try:
+                current_filetype = tab.settings.get("filetype_name", Optional[str])
+            except KeyError:
+                # filetypes plugin disabled
+                return
+            if current_filetype == filetype_name:
+                _setup_deferred_plugin(info, f"a {filetype_name} file was opened")
+
+        def on_new_filetab(tab: tabs.FileTab) -> None:
+            check_filetype(tab)
+            tab.bind(
+                "<<TabSettingChanged:filetype_name>>", (lambda event: check_filetype(tab)), add=True
+            )
+
+        get_tab_manager().add_filetab_callback(on_new_filetab)
+
+    elif info.load_when.startswith("event:"):
+        event_name = info.load_when.split(":", 1)[1]
+
+        def on_event(event: object) -> str | None:
+            if not _is_deferred(info):
+                return None
+            _setup_deferred_plugin(info, f"{event_name} was generated")
+            # Generate again, so that the newly set up plugin sees it
+            get_main_window().event_generate(event_name)
+            return "break"
+
+        get_main_window().bind(event_name, on_event, add=True)
+
+
+def _load_next_deferred_plugin(when_done: Callable[[], object]) -> None:
+    # One plugin per call, so that the GUI stays responsive between them
+    deferred = [info for info in plugin_infos if _is_deferred(info)]
+    not_imported = [info for info in deferred if info.module is None]
+    idle_infos = [info for info in deferred if info.load_when == "idle"]
+
+    if not_imported:
+        _import_deferred_plugin(not_imported[0])
+    elif idle_infos:
+        _setup_deferred_plugin(idle_infos[0], "main window is ready")
+    else:
+        when_done()
+        return
+
+    get_main_window().after_idle(_load_next_deferred_plugin, when_done)
+
+
+def _start_loading_deferred_plugins(when_done: Callable[[], object]) -> None:
+    for info in plugin_infos:
+        if _is_deferred(info):
+            _add_trigger(info)
+    _load_next_deferred_plugin(when_done)
+
+
+# undocumented on purpose, don't use in plugins
+def load_deferred_plugins(when_done: Callable[[], object]) -> None:
+    """Call this after showing the main window.
+
+    Plugins with ``load_when`` are loaded in the Tk idle loop after this returns.
+    Plugins waiting for a trigger (e.g. ``load_when = "filetab"``) are imported,
+    but not necessarily set up, when *when_done* gets called.
+    """
+    # Let the window show up before doing anything slow
+    get_main_window().after_idle(_start_loading_deferred_plugins, when_done)
+
+
 def can_setup_while_running(info: PluginInfo) -> bool:
     """
     Returns whether the plugin can be set up now, without having to
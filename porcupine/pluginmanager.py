@@ -10,7 +10,7 @@ from functools import partial
 from tkinter import ttk
 from typing import List
 
-from porcupine import get_main_window, pluginloader, textutils, utils
+from porcupine import _profiling, get_main_window, pluginloader, textutils, utils
 from porcupine.settings import global_settings
 
 log = logging.getLogger(__name__)
@@ -158,7 +158,8 @@ class PluginDialogContent:
             message = "Will be disabled upon restart"
         else:
             message = {
-                # it should be impossible to get here with LOADING status
+                # plugins with load_when can be LOADING for a long time
+                pluginloader.Status.LOADING: "Not loaded yet",
                 pluginloader.Status.ACTIVE: "Active",
                 pluginloader.Status.DISABLED_BY_SETTINGS: "Disabled",
                 pluginloader.Status.DISABLED_ON_COMMAND_LINE: "Disabled on command line",
@@ -200,6 +201,10 @@ class PluginDialogContent:
                 # get rid of single newlines
                 text = re.sub(r"(.)\n(.)", r"\1 \2", text)
 
+            for step in _profiling.get_plugin_steps(info.name):
+                what = "Importing" if step.category == "import" else "Calling setup()"
+                text += f"\n\n{what} took {_profiling.describe_step(step)}."
+
             self._title_label.config(text=info.name)
             self._set_description(text)
 
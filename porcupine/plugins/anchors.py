@@ -8,6 +8,7 @@ import time
 import tkinter
 
 from porcupine import get_tab_manager, menubar, settings, tabs
+from porcupine.plugins import underlines
 from porcupine.plugins.linenumbers import LineNumbers
 from porcupine.settings import global_settings
 
@@ -56,8 +57,8 @@ class AnchorManager:
     # See underlines.py and langserver.py
     def add_from_underlines(self) -> None:
         anchors = self.clean_duplicates_and_get_anchor_dict()
-        for start in self.tab_textwidget.tag_ranges("underline:diagnostics")[::2]:
-            lineno = self._get_line_number(str(start))
+        for underline in underlines.get_underlines(self.tab_textwidget, "diagnostics"):
+            lineno = self._get_line_number(underline.start)
             if lineno not in anchors:
                 anchors[lineno] = self.add_anchor(lineno)
         self.linenumbers.do_update()
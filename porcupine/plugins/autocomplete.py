@@ -31,7 +31,7 @@ setup_before = ["autoindent", "tabs2spaces"]
 log = logging.getLogger(__name__)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Completion:
     display_text: str
     replace_start: str
@@ -41,13 +41,13 @@ class Completion:
     documentation: str
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Request(utils.EventDataclass):
     id: int
     cursor_pos: str
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Response(utils.EventDataclass):
     id: int
     completions: List[Completion]
@@ -380,7 +380,7 @@ class AutoCompleter:
 
     # this might not run for all requests if e.g. langserver not configured
     def receive_completions(self, response: Response) -> None:
-        log.debug(f"receiving completions: {response}")
+        log.debug(f"receiving completions: {response!r}")
 
         if response.id != self._waiting_for_response_id:
             return
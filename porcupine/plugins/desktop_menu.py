@@ -85,4 +85,4 @@ def add_checkbox_to_settings() -> None:
 
 def setup() -> None:
     if shutil.which(XDG_DESKTOP_MENU):
-        add_checkbox_to_settings()
+        settings.add_custom_widgets(add_checkbox_to_settings)
@@ -59,7 +59,7 @@ def get_path(item_id: str) -> Path | None:
     return Path(path)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class FolderRefreshed(utils.EventDataclass):
     project_id: str
     folder_id: str
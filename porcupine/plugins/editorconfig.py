@@ -8,8 +8,10 @@ from __future__ import annotations
 
 import configparser
 import dataclasses
+import functools
 import logging
 import re
+import stat
 from functools import partial
 from pathlib import Path
 
@@ -105,7 +107,10 @@ def parse_file(path: Path) -> tuple[list[Section], bool]:
     return (result, is_root)
 
 
-def glob_match(glob: str, string: str) -> bool:
+# Each section glob gets compiled only once. The cache is big because it's
+# cleared only when Porcupine restarts and most projects have few globs anyway.
+@functools.lru_cache(maxsize=1000)
+def _compile_glob(glob: str) -> tuple[re.Pattern[str], list[range]]:
     ranges = []
     regex = ""
 
@@ -171,7 +176,12 @@ def glob_match(glob: str, string: str) -> bool:
             regex += re.escape(glob[0])
             glob = glob[1:]
 
-    match = re.fullmatch(regex, string)
+    return (re.compile(regex), ranges)
+
+
+def glob_match(glob: str, string: str) -> bool:
+    regex, ranges = _compile_glob(glob)
+    match = regex.fullmatch(string)
     if match is None:
         return False
 
@@ -180,36 +190,70 @@ def glob_match(glob: str, string: str) -> bool:
     return all(integer in ranke for integer, ranke in zip(integers, ranges))
 
 
-def get_config(path: Path) -> dict[str, str]:
-    assert path.is_absolute()
+# Keys are paths of .editorconfig files. Editing the file changes mtime or
+# size, and then the file is parsed again.
+_parsed_files: dict[Path, tuple[tuple[int, int], list[Section], bool]] = {}
+
+# Keys are directories, values contain sections of all .editorconfig files
+# that affect files in the directory. This is cleared when files may have
+# changed, because creating an .editorconfig to a parent directory affects
+# all subdirectories.
+_directory_sections: dict[Path, list[Section]] = {}
+
+
+def clear_cache(junk: object = None) -> None:
+    _directory_sections.clear()
+
+
+def _parse_file_if_exists(path: Path) -> tuple[list[Section], bool]:
+    try:
+        stat_result = path.stat()
+    except OSError:
+        return ([], False)
+    if not stat.S_ISREG(stat_result.st_mode):
+        return ([], False)
+
+    cache_key = (stat_result.st_mtime_ns, stat_result.st_size)
+    cached = _parsed_files.get(path)
+    if cached is not None and cached[0] == cache_key:
+        return (cached[1], cached[2])
 
-    # last items in this list is considered the most important
-    # i.e. every item overrides ones before it
-    all_sections: list[Section] = []
+    sections, is_root = parse_file(path)
+    _parsed_files[path] = (cache_key, sections, is_root)
+    return (sections, is_root)
+
+
+# last items in the returned list are considered the most important
+# i.e. every item overrides ones before it
+def _get_sections(directory: Path) -> list[Section]:
+    try:
+        return _directory_sections[directory]
+    except KeyError:
+        pass
 
     # "When opening a file, EditorConfig plugins look for a file named
     # .editorconfig in the directory of the opened file and in every parent
     # directory. A search for .editorconfig files will stop if the root
-    # filepath is reached or ..."
-    for parent in path.parents:
-        if not (parent / ".editorconfig").is_file():
-            continue
-        sections, is_root = parse_file(parent / ".editorconfig")
-
-        # "Properties from matching EditorConfig sections are applied in the order
-        # they were read, so properties in closer files take precedence."
-        #
-        # I think those sentences contradict each other. To me it seems that
-        # "closer" means the file with a longer path, so that the file taking
-        # the most precedence is the one in the same directory with the source
-        # file. That gets parsed first, so anything after that should go to the
-        # beginning of all_sections.
-        all_sections[0:0] = sections
-
-        # "A search for .editorconfig files will stop if ... or an EditorConfig
-        # file with root=true is found."
-        if is_root:
-            break
+    # filepath is reached or an EditorConfig file with root=true is found."
+    sections, is_root = _parse_file_if_exists(directory / ".editorconfig")
+
+    # "Properties from matching EditorConfig sections are applied in the order
+    # they were read, so properties in closer files take precedence."
+    #
+    # I think those sentences contradict each other. To me it seems that
+    # "closer" means the file with a longer path, so that the file taking
+    # the most precedence is the one in the same directory with the source
+    # file. So sections of the parent directory go first.
+    if not is_root and directory.parent != directory:
+        sections = _get_sections(directory.parent) + sections
+
+    _directory_sections[directory] = sections
+    return sections
+
+
+def get_config(path: Path) -> dict[str, str]:
+    assert path.is_absolute()
+    all_sections = _get_sections(path.parent)
 
     result: dict[str, str] = {}
     for section in all_sections:
@@ -357,4 +401,5 @@ def on_new_filetab(tab: tabs.FileTab) -> None:
 
 
 def setup() -> None:
+    get_tab_manager().bind("<<FileSystemChanged>>", clear_cache, add=True)
     get_tab_manager().add_filetab_callback(on_new_filetab)
@@ -20,6 +20,7 @@ from porcupine.plugins.directory_tree import DirectoryTree, get_directory_tree,
 from porcupine.plugins.run.terminal import run_command
 
 setup_after = ["directory_tree"]
+load_when = "idle"
 log = logging.getLogger(__name__)
 
 if sys.platform == "win32":
@@ -3,7 +3,9 @@ from __future__ import annotations
 
 import argparse
 import fnmatch
+import functools
 import logging
+import os
 import re
 import sys
 import tkinter
@@ -13,7 +15,7 @@ from typing import Any, Dict, Optional
 
 import tomli
 from pygments import lexers
-from pygments.util import ClassNotFound
+from pygments.lexer import LexerMeta
 
 from porcupine import (
     dirs,
@@ -30,6 +32,87 @@ log = logging.getLogger(__name__)
 FileType = Dict[str, Any]
 filetypes: dict[str, FileType] = {}
 
+_SPECIAL_GLOB_CHARS = ("*", "?", "[")
+
+
+class _FiletypeMatcher:
+    """Finds matching filetypes without looping through all patterns every time.
+
+    Most patterns are like "Makefile" or "*.py", and they go to dicts. The
+    remaining patterns are merged into one regex, so that paths that don't
+    match any of them (the common case) are rejected quickly.
+    """
+
+    def __init__(self, filetypes: dict[str, FileType]) -> None:
+        self._exact_names: dict[str, set[str]] = {}
+        self._suffixes: dict[str, set[str]] = {}
+        self._regexes: dict[str, re.Pattern[str]] = {}
+        self._shebang_regexes: dict[str, re.Pattern[str]] = {}
+
+        for name, filetype in filetypes.items():
+            other_patterns = []
+            for pattern in filetype["filename_patterns"]:
+                # Matching "*/" + pattern with fnmatch means that "Makefile"
+                # must be the last part of the path, and "*.py" must be at
+                # the end of the last part.
+                rest = pattern[1:] if pattern.startswith("*") else pattern
+                if "/" in pattern or any(char in rest for char in _SPECIAL_GLOB_CHARS):
+                    other_patterns.append(pattern)
+                elif pattern.startswith("*") and rest.startswith("."):
+                    self._suffixes.setdefault(os.path.normcase(rest), set()).add(name)
+                elif not pattern.startswith("*"):
+                    self._exact_names.setdefault(os.path.normcase(pattern), set()).add(name)
+                else:
+                    other_patterns.append(pattern)
+
+            if other_patterns:
+                # This is what fnmatch.fnmatch() does
+                self._regexes[name] = re.compile(
+                    "|".join(
+                        fnmatch.translate(os.path.normcase("*/" + pattern))
+                        for pattern in other_patterns
+                    )
+                )
+
+            self._shebang_regexes[name] = re.compile(filetype["shebang_regex"])
+
+        self._combined_regex = re.compile(
+            "|".join(regex.pattern for regex in self._regexes.values()) or "(?!)"
+        )
+        # Matching filetypes are sorted like in filetypes.toml, because the last one wins
+        self._order = {name: index for index, name in enumerate(filetypes.keys())}
+
+    def match_path(self, filepath: Path) -> list[str]:
+        basename = os.path.normcase(filepath.name)
+        names = set(self._exact_names.get(basename, ()))
+
+        # "foo.tar.gz" has suffixes ".tar.gz" and ".gz"
+        for index, char in enumerate(basename):
+            if char == ".":
+                names.update(self._suffixes.get(basename[index:], ()))
+
+        full_path = os.path.normcase(filepath.as_posix())
+        if self._combined_regex.match(full_path):
+            names.update(name for name, regex in self._regexes.items() if regex.match(full_path))
+
+        return sorted(names, key=self._order.__getitem__)
+
+    def match_shebang(self, shebang_line: str) -> list[str]:
+        return [
+            name
+            for name, regex in self._shebang_regexes.items()
+            if regex.search(shebang_line) is not None
+        ]
+
+
+_matcher: _FiletypeMatcher | None = None
+
+
+# Looking up a lexer scans all of pygments, and the result depends only on the file name
+@functools.lru_cache(maxsize=256)
+def _find_lexer_class_for_filename(filename: str) -> LexerMeta | None:
+    return lexers.find_lexer_class_for_filename(filename)
+
 
 # Sometimes dynamic typing is awesome
 def merge_settings(default: object, user: object) -> Any:
@@ -100,6 +183,9 @@ def load_filetypes() -> None:
         assert "filetype_name" not in filetype
         filetype["filetype_name"] = name
 
+    global _matcher
+    _matcher = _FiletypeMatcher(filetypes)
+
 
 def set_filedialog_kwargs() -> None:
     filedialog_kwargs["filetypes"] = [
@@ -137,28 +223,19 @@ def get_filetype_from_matches(
 
 def guess_filetype_from_path(filepath: Path) -> FileType | None:
     assert filepath.is_absolute()
+    assert _matcher is not None
     return get_filetype_from_matches(
-        {
-            name: filetype
-            for name, filetype in filetypes.items()
-            if any(
-                fnmatch.fnmatch(filepath.as_posix(), "*/" + pat)
-                for pat in filetype["filename_patterns"]
-            )
-        },
-        str(filepath),
+        {name: filetypes[name] for name in _matcher.match_path(filepath)}, str(filepath)
     )
 
 
 def guess_filetype_from_shebang(content_start: str) -> FileType | None:
+    assert _matcher is not None
     shebang_line = content_start.split("\n")[0]
-    matches = {}
-
-    for name, filetype in filetypes.items():
-        if re.search(filetype["shebang_regex"], shebang_line) is not None:
-            matches[name] = filetype
-
-    return get_filetype_from_matches(matches, f"shebang {shebang_line!r}")
+    return get_filetype_from_matches(
+        {name: filetypes[name] for name in _matcher.match_shebang(shebang_line)},
+        f"shebang {shebang_line!r}",
+    )
 
 
 # TODO: take content as argument
@@ -186,17 +263,16 @@ def guess_filetype(filepath: Path) -> FileType:
             return filetype
 
     # if nothing else works, create a new filetype automagically based on pygments
-    try:
-        lexer = lexers.get_lexer_for_filename(filepath)
-    except ClassNotFound:
+    lexer_class = _find_lexer_class_for_filename(filepath.name)
+    if lexer_class is None:
         if shebang_line is None:
             return filetypes["Plain Text"]  # give up
-        lexer = lexers.guess_lexer(shebang_line)
-        if isinstance(lexer, lexers.TextLexer):
+        lexer_class = type(lexers.guess_lexer(shebang_line))
+        if issubclass(lexer_class, lexers.TextLexer):
             return filetypes["Plain Text"]  # give up
 
     return {
-        "pygments_lexer": type(lexer).__module__ + "." + type(lexer).__name__,
+        "pygments_lexer": lexer_class.__module__ + "." + lexer_class.__name__,
         "langserver": None,
     }
 
@@ -0,0 +1,409 @@
+"""Find and replace text in all files of a project.
+
+Available in Edit/Find in Project. Files ignored by git are not searched. The
+results show up in a new tab as they are found, and double-clicking a result
+opens the file.
+
+When replacing, files that are opened in Porcupine are changed in the editor
+and you can save them yourself. Other files are changed on disk directly.
+Replacing is not possible when there are too many matches to show them all.
+"""
+from __future__ import annotations
+
+import collections
+import dataclasses
+import logging
+import mmap
+import multiprocessing
+import re
+import tkinter
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from tkinter import messagebox, ttk
+from typing import Deque
+
+from porcupine import get_tab_manager, menubar, tabs, textutils, utils
+from porcupine.plugins import jump_to_definition
+
+log = logging.getLogger(__name__)
+
+# Each process gets this many files at a time
+CHUNK_SIZE = 100
+
+# Searching stops when this many matches are found, and then replacing is disabled
+MAX_MATCHES = 5000
+
+
+@dataclasses.dataclass
+class _Match:
+    line: int
+    column: int
+    length: int  # in characters, like column
+    line_text: str
+
+
+@dataclasses.dataclass
+class _FileMatches:
+    path: Path
+    matches: list[_Match]
+
+
+# Same regex is used for searching files and replacing text in tabs. With
+# re.ASCII, \b and ignoring case work the same for bytes and strings.
+def _build_regex(query: str, *, full_words: bool, ignore_case: bool) -> str:
+    regex = re.escape(query)
+    if full_words:
+        regex = r"\b" + regex + r"\b"
+    if ignore_case:
+        regex = "(?i)" + regex
+    return "(?a)" + regex
+
+
+def _find_matches(content: bytes, regex: re.Pattern[bytes]) -> list[_Match]:
+    result = []
+    line = 1
+    line_start = 0
+    for match in regex.finditer(content):
+        line += content.count(b"\n", line_start, match.start())
+        line_start = content.rfind(b"\n", 0, match.start()) + 1
+        line_end = content.find(b"\n", match.start())
+        if line_end == -1:
+            line_end = len(content)
+
+        # Columns are in characters, not in utf-8 bytes
+        column = len(content[line_start : match.start()].decode("utf-8", errors="replace"))
+        length = len(match.group().decode("utf-8", errors="replace"))
+        line_text = content[line_start:line_end].decode("utf-8", errors="replace")
+        result.append(_Match(line, column, length, line_text))
+    return result
+
+
+# Runs in a separate process, so that searching doesn't freeze Porcupine
+def _search_files(paths: list[Path], regex: re.Pattern[bytes]) -> list[_FileMatches]:
+    result = []
+    for path in paths:
+        try:
+            with path.open("rb") as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    # Most files don't match, so check that quickly without copying the content
+                    if content.find(b"\0", 0, 1024) != -1 or regex.search(content) is None:
+                        continue
+                    matches = _find_matches(content[:], regex)
+        except (OSError, ValueError):
+            # ValueError happens when trying to mmap an empty file
+            continue
+        result.append(_FileMatches(path, matches))
+    return result
+
+
+# Runs in a thread. Returns the number of replaced matches.
+def _replace_in_file(path: Path, regex: re.Pattern[bytes], replacement: bytes) -> int:
+    content = path.read_bytes()
+    new_content, count = regex.subn((lambda match: replacement), content)
+    if count:
+        with utils.backup_open(path, "wb") as file:
+            file.write(new_content)
+    return count
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Forking a process that has Tk and threads is asking for trouble.
+        # On Windows, sys.executable can be Porcupine.exe, which must not be used.
+        context = multiprocessing.get_context("spawn")
+        context.set_executable(str(utils.python_executable))
+        _pool = ProcessPoolExecutor(mp_context=context)
+    return _pool
+
+
+class FindInProjectTab(tabs.Tab):
+    def __init__(self, manager: tabs.TabManager, project_root: Path) -> None:
+        super().__init__(manager)
+        self.project_root = project_root
+        self.title_choices = [f"Find in {project_root.name}", f"Find in {project_root}"]
+
+        # Incremented when searching starts or is cancelled, so that old results are ignored
+        self._search_id = 0
+        self._futures: Deque[Future[list[_FileMatches]]] = collections.deque()
+        self._match_count = 0
+        self._searched_count = 0
+        self._total_count = 0
+        self._file_count = 0
+        self._too_many_matches = False
+        self._regex = ""
+
+        self._items: dict[str, tuple[Path, _Match]] = {}  # keys are treeview item ids
+
+        entry_frame = ttk.Frame(self, padding=5)
+        entry_frame.pack(fill="x")
+        entry_frame.grid_columnconfigure(1, weight=1)
+
+        self.full_words_var = tkinter.BooleanVar()
+        self.ignore_case_var = tkinter.BooleanVar()
+
+        ttk.Label(entry_frame, text="Find:").grid(row=0, column=0, sticky="w")
+        self.find_entry = ttk.Entry(entry_frame, font="TkFixedFont")
+        self.find_entry.grid(row=0, column=1, sticky="we", padx=5)
+        ttk.Checkbutton(entry_frame, text="Full words only", variable=self.full_words_var).grid(
+            row=0, column=2, sticky="w"
+        )
+        self.find_button = ttk.Button(entry_frame, text="Find", command=self.start_search)
+        self.find_button.grid(row=0, column=3, sticky="we", padx=(5, 0))
+
+        ttk.Label(entry_frame, text="Replace with:").grid(row=1, column=0, sticky="w")
+        self.replace_entry = ttk.Entry(entry_frame, font="TkFixedFont")
+        self.replace_entry.grid(row=1, column=1, sticky="we", padx=5)
+        ttk.Checkbutton(entry_frame, text="Ignore case", variable=self.ignore_case_var).grid(
+            row=1, column=2, sticky="w"
+        )
+        self.replace_all_button = ttk.Button(
+            entry_frame, text="Replace all", command=self.replace_all, state="disabled"
+        )
+        self.replace_all_button.grid(row=1, column=3, sticky="we", padx=(5, 0))
+
+        status_frame = ttk.Frame(self, padding=(5, 0))
+        status_frame.pack(fill="x")
+        self.statuslabel = ttk.Label(status_frame)
+        self.statuslabel.pack(side="left", fill="x", expand=True)
+        self.cancel_button = ttk.Button(status_frame, text="Cancel", command=self.cancel)
+
+        self.treeview = ttk.Treeview(self, show="tree", selectmode="browse")
+        self.treeview.pack(side="left", fill="both", expand=True)
+        scrollbar = ttk.Scrollbar(self, command=self.treeview.yview)
+        scrollbar.pack(side="left", fill="y")
+        self.treeview.config(yscrollcommand=scrollbar.set)
+
+        self.find_entry.bind("<Return>", (lambda event: self.start_search()), add=True)
+        self.replace_entry.bind("<Return>", (lambda event: self.replace_all()), add=True)
+        self.find_entry.bind("<Escape>", (lambda event: self.cancel()), add=True)
+        self.treeview.bind("<Return>", self._open_selected, add=True)
+        self.treeview.bind("<Double-Button-1>", self._open_selected, add=True)
+        self.bind("<<TabSelected>>", (lambda event: self.find_entry.focus()), add=True)
+        self.bind("<Destroy>", (lambda event: self._stop_searching()), add=True)
+
+    def equivalent(self, other: tabs.Tab) -> bool:  # override
+        return isinstance(other, FindInProjectTab) and other.project_root == self.project_root
+
+    def _update_status(self) -> None:
+        if self._futures:
+            self.statuslabel.config(
+                text=(
+                    f"Searched {self._searched_count}/{self._total_count} files."
+                    f" Found {self._match_count} matches in {self._file_count} files so far."
+                )
+            )
+            self.cancel_button.pack(side="right")
+        else:
+            self.cancel_button.pack_forget()
+
+        # When there are too many matches, only some of them are shown, and
+        # replacing only those or all of them would be confusing
+        if self._match_count and not self._futures and not self._too_many_matches:
+            self.replace_all_button.config(state="normal")
+        else:
+            self.replace_all_button.config(state="disabled")
+
+    def start_search(self) -> None:
+        self.cancel()
+        self.treeview.delete(*self.treeview.get_children())
+        self._items.clear()
+        self._match_count = 0
+        self._file_count = 0
+        self._too_many_matches = False
+
+        query = self.find_entry.get()
+        if not query:
+            self.statuslabel.config(text="Type something to find.")
+            return
+        self._regex = _build_regex(
+            query, full_words=self.full_words_var.get(), ignore_case=self.ignore_case_var.get()
+        )
+
+        search_id = self._search_id
+        self.statuslabel.config(text="Listing files...")
+        utils.run_in_thread(
+            partial(utils.list_project_files, self.project_root),
+            partial(self._files_listed, search_id),
+            check_interval_ms=25,
+        )
+
+    def _files_listed(self, search_id: int, success: bool, result: str | list[Path]) -> None:
+        if search_id != self._search_id or not self.winfo_exists():
+            return
+        if isinstance(result, str):
+            log.error(f"listing files in {self.project_root} failed:\n{result}")
+            self.statuslabel.config(text="Listing files failed.")
+            return
+
+        paths = sorted(result)
+        regex = re.compile(self._regex.encode("utf-8"))
+        pool = _get_pool()
+        for start in range(0, len(paths), CHUNK_SIZE):
+            self._futures.append(
+                pool.submit(_search_files, paths[start : start + CHUNK_SIZE], regex)
+            )
+
+        self._searched_count = 0
+        self._total_count = len(paths)
+        self._check_futures(search_id)
+
+    # Results are shown in the order of the files, even if they're found in a different order
+    def _check_futures(self, search_id: int) -> None:
+        if search_id != self._search_id:
+            return
+
+        while self._futures and self._futures[0].done():
+            future = self._futures.popleft()
+            try:
+                file_matches_list = future.result()
+            except Exception:
+                log.exception("searching files failed")
+                self.cancel()
+                self.statuslabel.config(text="Searching failed.")
+                return
+
+            self._searched_count = min(self._searched_count + CHUNK_SIZE, self._total_count)
+            for file_matches in file_matches_list:
+                self._add_file_matches(file_matches)
+            if self._match_count >= MAX_MATCHES:
+                self._too_many_matches = True
+                self.cancel()
+                self.statuslabel.config(
+                    text=(
+                        f"Found too many matches. Showing the first {self._match_count}."
+                        " To replace, search for something more specific."
+                    )
+                )
+                return
+
+        self._update_status()
+        if self._futures:
+            self.after(50, self._check_futures, search_id)
+        elif self._match_count == 0:
+            self.statuslabel.config(text="Found no matches :(")
+        else:
+            self.statuslabel.config(
+                text=f"Found {self._match_count} matches in {self._file_count} files."
+            )
+
+    def _add_file_matches(self, file_matches: _FileMatches) -> None:
+        file_item = self.treeview.insert(
+            "", "end", text=str(file_matches.path.relative_to(self.project_root)), open=True
+        )
+        matches = file_matches.matches[: MAX_MATCHES - self._match_count]
+        for match in matches:
+            item_id = self.treeview.insert(
+                file_item, "end", text=f"{match.line}: {match.line_text.strip()}"
+            )
+            self._items[item_id] = (file_matches.path, match)
+
+        self._file_count += 1
+        self._match_count += len(matches)
+
+    def _stop_searching(self) -> None:
+        self._search_id += 1
+        for future in self._futures:
+            future.cancel()
+        self._futures.clear()
+
+    def cancel(self) -> None:
+        self._stop_searching()
+        self._update_status()
+        self.statuslabel.config(text="")
+
+    def _open_selected(self, junk_event: object) -> str:
+        selection = self.treeview.selection()
+        if selection and selection[0] in self._items:
+            path, match = self._items[selection[0]]
+            jump_to_definition.show_location_range(
+                jump_to_definition.LocationRange(
+                    file_path=str(path),
+                    start=f"{match.line}.{match.column}",
+                    end=f"{match.line}.{match.column + match.length}",
+                )
+            )
+        return "break"
+
+    def replace_all(self) -> None:
+        if str(self.replace_all_button["state"]) == "disabled":
+            return
+
+        paths = list(dict.fromkeys(path for path, match in self._items.values()))
+        replacement = self.replace_entry.get()
+        if not messagebox.askyesno(
+            "Replace all",
+            f"Replace {self._match_count} matches in {len(paths)} files with {replacement!r}?",
+            detail=(
+                "Files that are opened in Porcupine will be changed in the editor, and you can"
+                " undo the changes there. Other files will be changed on disk directly."
+            ),
+            parent=self.winfo_toplevel(),
+        ):
+            return
+
+        open_tabs = {
+            tab.path: tab
+            for tab in self.master.tabs()
+            if isinstance(tab, tabs.FileTab) and tab.path is not None
+        }
+        str_regex = re.compile(self._regex)
+        bytes_regex = re.compile(self._regex.encode("utf-8"))
+
+        disk_paths = []
+        for path in paths:
+            tab = open_tabs.get(path)
+            if tab is None:
+                disk_paths.append(path)
+            else:
+                old_text = tab.textwidget.get("1.0", "end - 1 char")
+                new_text = str_regex.sub((lambda match: replacement), old_text)
+                textutils.replace_text_with_diff(tab.textwidget, new_text)
+
+        def replace_on_disk() -> None:
+            for path in disk_paths:
+                try:
+                    _replace_in_file(path, bytes_regex, replacement.encode("utf-8"))
+                except OSError:
+                    log.exception(f"replacing in {path} failed")
+
+        def done(success: bool, result: str | None) -> None:
+            if not success:
+                log.error(f"replacing failed:\n{result}")
+            if self.winfo_exists():
+                self.start_search()  # show what's left
+
+        self.cancel()
+        self.statuslabel.config(text="Replacing...")
+        utils.run_in_thread(replace_on_disk, done)
+
+
+def find_in_project(tab: tabs.FileTab) -> None:
+    assert tab.path is not None
+    try:
+        selected_text: str | None = tab.textwidget.get("sel.first", "sel.last")
+    except tkinter.TclError:
+        selected_text = None
+
+    find_tab = get_tab_manager().add_tab(
+        FindInProjectTab(get_tab_manager(), utils.find_project_root(tab.path))
+    )
+    assert isinstance(find_tab, FindInProjectTab)
+    if selected_text is not None and "\n" not in selected_text:
+        find_tab.find_entry.delete(0, "end")
+        find_tab.find_entry.insert(0, selected_text)
+    find_tab.find_entry.select_range(0, "end")
+    find_tab.find_entry.focus_set()
+
+
+def setup() -> None:
+    menubar.get_menu("Edit").add_command(
+        label="Find in Project", command=(lambda: find_in_project(menubar.get_filetab()))
+    )
+    menubar.set_enabled_based_on_tab(
+        "Edit/Find in Project", (lambda tab: isinstance(tab, tabs.FileTab) and tab.path is not None)
+    )
@@ -10,6 +10,7 @@ from porcupine import get_tab_manager, utils
 from porcupine.plugins.directory_tree import DirectoryTree, get_directory_tree, get_path
 
 setup_after = ["directory_tree", "filemanager"]
+load_when = "idle"
 
 log = logging.getLogger(__name__)
 
@@ -0,0 +1,190 @@
+"""Jump to a function or class anywhere in the project by typing a part of its name.
+
+Available in Edit/Go to Symbol. Unlike jump_to_definition, this doesn't need
+a langserver. Definitions are found with tree-sitter in the background when
+Go to Symbol is first used in a project, and they are updated when files are
+saved or change on disk. Typing "gtl" finds e.g. ``get_tab_label``.
+"""
+from __future__ import annotations
+
+import time
+import tkinter
+from functools import partial
+from pathlib import Path
+from tkinter import ttk
+
+from porcupine import get_main_window, get_tab_manager, menubar, tabs, utils
+from porcupine.plugins import jump_to_definition
+
+from .index import ProjectIndex, Symbol
+
+# guess_filetype_from_path() must work in the indexing thread
+setup_after = ["filetypes"]
+
+# <<FileSystemChanged>> happens whenever the Porcupine window gets focus and
+# after every save, and a rescan lists and stats all files of the project
+RESCAN_DELAY_MS = 500
+MIN_RESCAN_INTERVAL = 10  # seconds
+
+_indexes: dict[Path, ProjectIndex] = {}
+_rescan_timeout: str | None = None
+_unhandled_changes = 0  # <<FileSystemChanged>> events since last rescan
+_last_rescan_time: float | None = None
+
+
+def get_project_index(project_root: Path) -> ProjectIndex:
+    if project_root not in _indexes:
+        _indexes[project_root] = ProjectIndex(project_root)
+        _indexes[project_root].request_rescan()
+    return _indexes[project_root]
+
+
+class _SymbolPopup:
+    def __init__(self, project_index: ProjectIndex) -> None:
+        self._index = project_index
+        self._symbols: dict[str, Symbol] = {}  # keys are treeview item ids
+
+        self.window = tkinter.Toplevel()
+        self.window.title(f"Go to Symbol in {project_index.project_root.name}")
+        self.window.transient(get_main_window())
+
+        content_frame = ttk.Frame(self.window, padding=10)
+        content_frame.pack(fill="both", expand=True)
+
+        self._query_var = tkinter.StringVar()
+        self._query_var.trace_add("write", self._update_results)
+        self._entry = ttk.Entry(content_frame, textvariable=self._query_var)
+        self._entry.pack(fill="x")
+
+        self._treeview = ttk.Treeview(
+            content_frame, columns=("kind", "location"), show="tree", selectmode="browse"
+        )
+        self._treeview.column("#0", width=250)
+        self._treeview.column("kind", width=80, stretch=False)
+        self._treeview.column("location", width=350)
+        self._treeview.pack(fill="both", expand=True, pady=(5, 0))
+
+        self._status_label = ttk.Label(content_frame)
+        self._status_label.pack(fill="x")
+
+        for widget in [self._entry, self._treeview]:
+            widget.bind("<Return>", self._open_selected, add=True)
+            widget.bind("<Escape>", (lambda event: self.window.destroy()), add=True)
+        self._entry.bind("<Down>", partial(self._move_selection, 1), add=True)
+        self._entry.bind("<Up>", partial(self._move_selection, -1), add=True)
+        self._treeview.bind("<Double-Button-1>", self._open_selected, add=True)
+
+        self._entry.focus_set()
+        self._update_status()
+
+    # While indexing, show new symbols as they are found
+    def _update_status(self) -> None:
+        if not self.window.winfo_exists():
+            return
+
+        if self._index.indexing:
+            self._status_label.config(text="Finding symbols...")
+            self._update_results()
+            self.window.after(500, self._update_status)
+        else:
+            self._status_label.config(text="")
+            self._update_results()
+
+    def _update_results(self, *junk: object) -> None:
+        old_selection = self._treeview.selection()
+        old_symbol = self._symbols.get(old_selection[0]) if old_selection else None
+
+        self._treeview.delete(*self._treeview.get_children())
+        self._symbols.clear()
+        for symbol in self._index.search(self._query_var.get()):
+            location = f"{symbol.path.relative_to(self._index.project_root)}:{symbol.line}"
+            item_id = self._treeview.insert(
+                "", "end", text=symbol.name, values=(symbol.kind, location)
+            )
+            self._symbols[item_id] = symbol
+            if symbol == old_symbol:
+                self._treeview.selection_set(item_id)
+
+        children = self._treeview.get_children()
+        if children and not self._treeview.selection():
+            self._treeview.selection_set(children[0])
+        if self._treeview.selection():
+            self._treeview.see(self._treeview.selection()[0])
+
+    def _move_selection(self, step: int, junk_event: object) -> str:
+        children = list(self._treeview.get_children())
+        selection = self._treeview.selection()
+        if children and selection:
+            index = children.index(selection[0]) + step
+            self._treeview.selection_set(children[max(0, min(index, len(children) - 1))])
+            self._treeview.see(self._treeview.selection()[0])
+        return "break"
+
+    def _open_selected(self, junk_event: object) -> str:
+        selection = self._treeview.selection()
+        if selection:
+            symbol = self._symbols[selection[0]]
+            self.window.destroy()
+            jump_to_definition.show_location_range(
+                jump_to_definition.LocationRange(
+                    file_path=str(symbol.path),
+                    start=f"{symbol.line}.{symbol.column}",
+                    end=f"{symbol.line}.{symbol.column + len(symbol.name)}",
+                )
+            )
+        return "break"
+
+
+def go_to_symbol() -> None:
+    tab = get_tab_manager().select()
+    assert isinstance(tab, tabs.FileTab) and tab.path is not None
+    _SymbolPopup(get_project_index(utils.find_project_root(tab.path)))
+
+
+def on_save(tab: tabs.FileTab, junk: object) -> None:
+    global _unhandled_changes
+    assert tab.path is not None
+    # Projects are indexed only after using Go to Symbol in them. Opening a
+    # file outside any project would otherwise index e.g. the home folder.
+    project_index = _indexes.get(utils.find_project_root(tab.path))
+    if project_index is not None:
+        project_index.request_file_update(tab.path)
+
+    # Saving generated a <<FileSystemChanged>> just before this, and this handles it
+    _unhandled_changes = max(0, _unhandled_changes - 1)
+
+
+def on_new_filetab(tab: tabs.FileTab) -> None:
+    tab.bind("<<AfterSave>>", partial(on_save, tab), add=True)
+
+
+def _rescan_if_needed() -> None:
+    global _rescan_timeout, _unhandled_changes, _last_rescan_time
+    _rescan_timeout = None
+    if _unhandled_changes > 0:
+        _unhandled_changes = 0
+        _last_rescan_time = time.monotonic()
+        for project_index in _indexes.values():
+            project_index.request_rescan()
+
+
+# Files may have changed outside Porcupine, e.g. git checkout
+def rescan_all_projects(junk: object) -> None:
+    global _rescan_timeout, _unhandled_changes
+    _unhandled_changes += 1
+    if _rescan_timeout is None:
+        delay_ms = RESCAN_DELAY_MS
+        if _last_rescan_time is not None:
+            next_allowed = _last_rescan_time + MIN_RESCAN_INTERVAL
+            delay_ms = max(delay_ms, round((next_allowed - time.monotonic()) * 1000))
+        _rescan_timeout = get_main_window().after(delay_ms, _rescan_if_needed)
+
+
+def setup() -> None:
+    get_tab_manager().add_filetab_callback(on_new_filetab)
+    get_tab_manager().bind("<<FileSystemChanged>>", rescan_all_projects, add=True)
+
+    menubar.get_menu("Edit").add_command(label="Go to Symbol", command=go_to_symbol)
+    menubar.set_enabled_based_on_tab(
+        "Edit/Go to Symbol", (lambda tab: isinstance(tab, tabs.FileTab) and tab.path is not None)
+    )
@@ -0,0 +1,387 @@
+"""Find function and class definitions in all files of a project.
+
+Definitions are found with the same tree-sitter queries that the highlight
+plugin uses: anything highlighted as Token.Name.Function or Token.Name.Class
+when it is defined is a symbol. Symbols are saved to an sqlite database in the
+cache directory, so that only changed files are parsed when Porcupine starts.
+"""
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import heapq
+import logging
+import os
+import queue
+import re
+import sqlite3
+import stat
+import threading
+from functools import partial
+from pathlib import Path
+from typing import Callable
+
+import tree_sitter
+import tree_sitter_languages
+
+from porcupine import dirs, utils
+from porcupine.plugins import filetypes
+from porcupine.plugins.highlight import tree_sitter_highlighter
+
+log = logging.getLogger(__name__)
+
+# Files bigger than this are probably generated, and not worth parsing
+MAX_FILE_SIZE = 1_000_000
+
+# How many files to parse before saving to the database and showing the new symbols
+BATCH_SIZE = 500
+
+MAX_RESULTS = 100
+
+_CAPTURE_KINDS = {"Token.Name.Function": "function", "Token.Name.Class": "class"}
+
+
+@dataclasses.dataclass(frozen=True)
+class Symbol:
+    name: str
+    kind: str  # "function" or "class"
+    path: Path
+    line: int  # starts at 1, like in Tk text indexes
+    column: int
+
+
+class _SymbolFinder:
+    def __init__(self, language_name: str) -> None:
+        config = tree_sitter_highlighter.load_yml_config(language_name)
+        language = tree_sitter_languages.get_language(language_name)
+        self._parser = tree_sitter.Parser()
+        self._parser.set_language(language)
+
+        # All queries of the highlighter combined. Only names of things being
+        # defined are needed, but other captures don't hurt.
+        self._query = language.query("\n".join(config.queries.values()))
+
+    def find_symbols(self, path: Path, content: bytes) -> list[Symbol]:
+        tree = self._parser.parse(content)
+        result = []
+        for node, capture_name in self._query.captures(tree.root_node):
+            kind = _CAPTURE_KINDS.get(capture_name)
+            if kind is None:
+                continue
+
+            # tree-sitter columns are in utf-8 bytes, Tk wants characters
+            row, byte_column = node.start_point
+            line_start = node.start_byte - byte_column
+            column = len(content[line_start : node.start_byte].decode("utf-8", errors="replace"))
+            name = node.text.decode("utf-8", errors="replace")
+            if "\n" not in name:  # newlines would mess up searching
+                result.append(Symbol(name, kind, path, row + 1, column))
+
+        return list(dict.fromkeys(result))
+
+
+# Only used in the indexing thread. None means that the language has no symbols to find.
+_finders: dict[str, _SymbolFinder | None] = {}
+
+
+def _get_finder(path: Path) -> _SymbolFinder | None:
+    filetype = filetypes.guess_filetype_from_path(path)
+    if filetype is None:
+        return None
+    language_name = filetype.get("tree_sitter_language_name")
+    if language_name is None:
+        return None
+
+    if language_name not in _finders:
+        try:
+            config = tree_sitter_highlighter.load_yml_config(language_name)
+        except FileNotFoundError:
+            _finders[language_name] = None
+        else:
+            if any(
+                "@" + capture_name in query
+                for query in config.queries.values()
+                for capture_name in _CAPTURE_KINDS
+            ):
+                _finders[language_name] = _SymbolFinder(language_name)
+            else:
+                _finders[language_name] = None
+
+    return _finders[language_name]
+
+
+# All indexing happens in this thread, one thing at a time. It's a daemon
+# thread, so quitting Porcupine doesn't wait until a huge project is indexed.
+# If that happens in the middle of writing, sqlite rolls back the unfinished write.
+_work_queue: queue.Queue[Callable[[], object]] = queue.Queue()
+_worker_thread: threading.Thread | None = None
+
+
+def _worker() -> None:
+    while True:
+        work = _work_queue.get()
+        try:
+            work()
+        except Exception:
+            log.exception("indexing symbols failed")
+
+
+def _run_in_worker(work: Callable[[], object]) -> None:
+    global _worker_thread
+    if _worker_thread is None:
+        _worker_thread = threading.Thread(target=_worker, name="symbol_indexer", daemon=True)
+        _worker_thread.start()
+    _work_queue.put(work)
+
+
+# Must be a function, so that it updates when tests change the dirs object
+def _get_database_path(project_root: Path) -> Path:
+    # Change the number after v when you make incompatible changes
+    digest = hashlib.sha1(str(project_root).encode("utf-8")).hexdigest()[:16]
+    return dirs.user_cache_path / "symbol_index_v1" / f"{project_root.name}-{digest}.sqlite3"
+
+
+def _find_matching_names(names_blob: str, query: str) -> list[str]:
+    escaped = [re.escape(char) for char in query]
+    regexes = [
+        "\n" + "".join(escaped) + "\n",  # exact match
+        "\n" + "".join(escaped),  # prefix
+        "".join(escaped),  # substring
+        # "abc" becomes a[^b\n]*b[^c\n]*c, so that the regex engine never backtracks
+        escaped[0] + "".join(f"[^{char}\n]*{char}" for char in escaped[1:]),
+    ]
+
+    # Names are sorted by length in the blob, so the first matches are the best.
+    # Dict is used as an ordered set.
+    result: dict[str, None] = {}
+    for regex in regexes:
+        for match in re.finditer(regex, names_blob):
+            start = names_blob.rfind("\n", 0, match.start() + 1) + 1
+            end = names_blob.find("\n", match.end() - 1)
+            result[names_blob[start:end]] = None
+            if len(result) >= MAX_RESULTS:
+                return list(result)
+    return list(result)
+
+
+class ProjectIndex:
+    """Symbols of one project.
+
+    Methods whose names start with ``request_`` are called from the Tk
+    thread. They tell the indexing thread what to do.
+    """
+
+    def __init__(self, project_root: Path) -> None:
+        self.project_root = project_root
+        self.indexing = False
+
+        # The lock is needed for everything except _file_stats and _connection.
+        # Keys of _symbols_by_name are lowercase names.
+        self._lock = threading.Lock()
+        self._symbols_by_name: dict[str, list[Symbol]] = {}
+        self._symbols_by_path: dict[Path, list[Symbol]] = {}
+
+        # Searching is done with regexes on a string that has all names, one per
+        # line and shortest first. It is much faster than looping through the names.
+        self._names_blob = "\n"
+        self._names_changed = False
+
+        self._file_stats: dict[Path, tuple[int, int]] = {}  # (mtime_ns, size)
+        self._connection: sqlite3.Connection | None = None
+        self._rescan_requested = False
+
+    def request_rescan(self) -> None:
+        if not self._rescan_requested:
+            self._rescan_requested = True
+            self.indexing = True
+            _run_in_worker(self.rescan)
+
+    def request_file_update(self, path: Path) -> None:
+        _run_in_worker(partial(self.update_file, path))
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is not None:
+            return self._connection
+
+        database_path = _get_database_path(self.project_root)
+        database_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self._connection = self._open_database(database_path)
+        except sqlite3.DatabaseError:
+            log.warning(f"recreating broken symbol database: {database_path}", exc_info=True)
+            self._file_stats.clear()
+            database_path.unlink()
+            self._connection = self._open_database(database_path)
+        return self._connection
+
+    def _open_database(self, database_path: Path) -> sqlite3.Connection:
+        connection = sqlite3.connect(database_path, check_same_thread=False)
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INT, size INT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS symbols"
+                " (path TEXT, name TEXT, kind TEXT, line INT, column INT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS symbols_by_path ON symbols (path)")
+
+        # Load everything that was found last time
+        for relative, mtime_ns, size in connection.execute("SELECT * FROM files"):
+            self._file_stats[self.project_root / relative] = (mtime_ns, size)
+
+        symbols_by_path: dict[Path, list[Symbol]] = {}
+        for relative, name, kind, line, column in connection.execute("SELECT * FROM symbols"):
+            path = self.project_root / relative
+            symbols_by_path.setdefault(path, []).append(Symbol(name, kind, path, line, column))
+        with self._lock:
+            for path, symbols in symbols_by_path.items():
+                self._set_symbols(path, symbols)
+            self._update_names_blob()
+
+        return connection
+
+    # Lock must be held
+    def _set_symbols(self, path: Path, symbols: list[Symbol]) -> None:
+        for symbol in self._symbols_by_path.pop(path, []):
+            key = symbol.name.lower()
+            remaining = [s for s in self._symbols_by_name.get(key, []) if s.path != path]
+            if remaining:
+                self._symbols_by_name[key] = remaining
+            elif key in self._symbols_by_name:
+                del self._symbols_by_name[key]
+                self._names_changed = True
+
+        if symbols:
+            self._symbols_by_path[path] = symbols
+        for symbol in symbols:
+            key = symbol.name.lower()
+            if key not in self._symbols_by_name:
+                self._symbols_by_name[key] = []
+                self._names_changed = True
+            self._symbols_by_name[key].append(symbol)
+
+    # Lock must be held
+    def _update_names_blob(self) -> None:
+        if self._names_changed:
+            names = sorted(self._symbols_by_name.keys(), key=(lambda name: (len(name), name)))
+            self._names_blob = "\n" + "\n".join(names) + "\n"
+            self._names_changed = False
+
+    def _index_file(self, path: Path, finder: _SymbolFinder, stat_result: os.stat_result) -> None:
+        symbols = []
+        if stat_result.st_size <= MAX_FILE_SIZE:
+            try:
+                symbols = finder.find_symbols(path, path.read_bytes())
+            except OSError:
+                log.debug(f"can't read {path}", exc_info=True)
+
+        with self._lock:
+            self._set_symbols(path, symbols)
+        self._file_stats[path] = (stat_result.st_mtime_ns, stat_result.st_size)
+
+        relative = path.relative_to(self.project_root).as_posix()
+        connection = self._connect()
+        connection.execute("DELETE FROM symbols WHERE path = ?", [relative])
+        connection.executemany(
+            "INSERT INTO symbols VALUES (?, ?, ?, ?, ?)",
+            [(relative, s.name, s.kind, s.line, s.column) for s in symbols],
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+            [relative, stat_result.st_mtime_ns, stat_result.st_size],
+        )
+
+    def _forget_file(self, path: Path) -> None:
+        with self._lock:
+            self._set_symbols(path, [])
+        del self._file_stats[path]
+
+        relative = path.relative_to(self.project_root).as_posix()
+        connection = self._connect()
+        connection.execute("DELETE FROM symbols WHERE path = ?", [relative])
+        connection.execute("DELETE FROM files WHERE path = ?", [relative])
+
+    def _commit(self) -> None:
+        self._connect().commit()
+        with self._lock:
+            self._update_names_blob()
+
+    # Runs in the indexing thread. Only files whose size or modification time changed are parsed.
+    def rescan(self) -> None:
+        self._rescan_requested = False
+        self._connect()
+
+        found_paths = set()
+        parsed_count = 0
+        for path in utils.list_project_files(self.project_root):
+            finder = _get_finder(path)
+            if finder is None:
+                continue
+            try:
+                stat_result = path.stat()
+            except OSError:
+                continue
+            if not stat.S_ISREG(stat_result.st_mode):
+                continue
+
+            found_paths.add(path)
+            if self._file_stats.get(path) != (stat_result.st_mtime_ns, stat_result.st_size):
+                self._index_file(path, finder, stat_result)
+                parsed_count += 1
+                if parsed_count % BATCH_SIZE == 0:
+                    self._commit()
+
+        for path in self._file_stats.keys() - found_paths:
+            self._forget_file(path)
+        self._commit()
+
+        log.debug(f"parsed {parsed_count} files in {self.project_root}")
+        self.indexing = self._rescan_requested
+
+    # Runs in the indexing thread
+    def update_file(self, path: Path) -> None:
+        finder = _get_finder(path)
+        if finder is None or self.project_root not in path.parents:
+            return
+
+        try:
+            stat_result = path.stat()
+        except OSError:
+            stat_result = None
+
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            self._index_file(path, finder, stat_result)
+        elif path in self._file_stats:
+            self._forget_file(path)
+        self._commit()
+
+    def search(self, query: str) -> list[Symbol]:
+        """Return symbols whose names contain the characters of *query* in order.
+
+        Exact matches come first, then names that start with the query, then
+        names containing it, and then other matches. Shorter names come first
+        within each group. Case is ignored.
+        """
+        query = "".join(query.lower().split())
+        if not query:
+            return []
+
+        with self._lock:
+            names_blob = self._names_blob
+        matching_names = _find_matching_names(names_blob, query)
+
+        result: list[Symbol] = []
+        with self._lock:
+            for name in matching_names:
+                # Some names, like __init__, are defined in thousands of places
+                result.extend(
+                    heapq.nsmallest(
+                        MAX_RESULTS - len(result),
+                        self._symbols_by_name.get(name, []),
+                        key=(lambda s: (str(s.path), s.line, s.column)),
+                    )
+                )
+                if len(result) >= MAX_RESULTS:
+                    break
+        return result
@@ -26,6 +26,9 @@ log = logging.getLogger(__name__)
 # TODO: what other plugins need this?
 setup_after = ["filetypes"]
 
+# Importing pygments and tree-sitter is slow, and nothing to highlight before a file is opened
+load_when = "filetab"
+
 
 class HighlighterManager:
     def __init__(self, tab: tabs.FileTab) -> None:
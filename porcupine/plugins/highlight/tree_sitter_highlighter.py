@@ -39,6 +39,18 @@ def _strip_comments(query: str) -> str:
     return "".join(p for p in parts if not p.startswith("#"))
 
 
+# Also used by the go_to_symbol plugin
+def load_yml_config(language_name: str) -> YmlConfig:
+    token_mapping_path = TOKEN_MAPPING_DIR / (language_name + ".yml")
+    with token_mapping_path.open("r", encoding="utf-8") as file:
+        config = dacite.from_dict(YmlConfig, yaml.safe_load(file))
+
+    config.queries = {
+        node_type_name: _strip_comments(text) for node_type_name, text in config.queries.items()
+    }
+    return config
+
+
 class TreeSitterHighlighter(BaseHighlighter):
     def __init__(self, textwidget: tkinter.Text, language_name: str) -> None:
         super().__init__(textwidget)
@@ -48,14 +60,12 @@ class TreeSitterHighlighter(BaseHighlighter):
         self._parser.set_language(self._language)
         self._tree = self._parser.parse(self._get_file_content_for_tree_sitter())
 
-        token_mapping_path = TOKEN_MAPPING_DIR / (language_name + ".yml")
-        with token_mapping_path.open("r", encoding="utf-8") as file:
-            self._config = dacite.from_dict(YmlConfig, yaml.safe_load(file))
+        self._config = load_yml_config(language_name)
 
         # Pseudo-optimization: "pre-compile" queries when the highlighter starts.
         # Also makes the highlighter fail noticably if any query contain syntax errors.
         self._queries = {
-            node_type_name: self._language.query(_strip_comments(text))
+            node_type_name: self._language.query(text)
             for node_type_name, text in self._config.queries.items()
         }
 
@@ -162,7 +172,7 @@ class TreeSitterHighlighter(BaseHighlighter):
         if not changes.change_list:
             return
 
-        if len(changes.change_list) >= 2:
+        if len(changes.change_list) >= 2 or changes.whole_document_replaced:
             # slow, but doesn't happen very often in normal editing
             self._tree = self._parser.parse(self._get_file_content_for_tree_sitter())
         else:
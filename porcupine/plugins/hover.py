@@ -7,7 +7,7 @@ from porcupine import get_main_window, get_tab_manager, tabs, textutils, utils
 
 
 # Data of request is a text widget location. Use event.data_string to access it.
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Response(utils.EventDataclass):
     location: str
     text: str
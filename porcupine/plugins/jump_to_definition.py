@@ -17,20 +17,20 @@ from porcupine.plugins import rightclick_menu
 log = logging.getLogger(__name__)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Request(utils.EventDataclass):
     file_path: str  # not pathlib.Path because json
     location: str
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class LocationRange:
     file_path: str  # not pathlib.Path because json
     start: str
     end: str
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Response(utils.EventDataclass):
     location_ranges: List[LocationRange]
 
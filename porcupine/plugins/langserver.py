@@ -3,6 +3,7 @@
 # TODO: error reporting in gui somehow
 from __future__ import annotations
 
+import collections
 import dataclasses
 import itertools
 import logging
@@ -14,9 +15,11 @@ import signal
 import subprocess
 import sys
 import threading
+import time
+import tkinter
 from functools import partial
 from pathlib import Path
-from typing import IO, Any, Iterator, Optional
+from typing import IO, Any, Callable, Iterator, List, Optional
 from urllib.request import url2pathname
 
 if sys.platform != "win32":
@@ -150,6 +153,57 @@ def get_completion_item_doc(item: lsp.CompletionItem) -> str:
     return result
 
 
+# this is "open to interpretation", as the lsp spec says
+# TODO: use textEdit when available (need to find langserver that
+#       gives completions with textEdit for that to work)
+def _get_word_before_cursor(textwidget: tkinter.Text, cursor_pos: str) -> str:
+    before_cursor = textwidget.get(f"{cursor_pos} linestart", cursor_pos)
+    match = re.fullmatch(r".*?(\w*)", before_cursor)
+    assert match is not None
+    return match.group(1)
+
+
+# If the items came from the langserver when the word was shorter, give the
+# old word as requested_word. The items are then filtered like the
+# autocomplete plugin filters them.
+def _create_completions(
+    items: list[lsp.CompletionItem], cursor_pos: str, word: str, requested_word: str | None = None
+) -> list[autocomplete.Completion]:
+    # The word can't contain newlines, so this doesn't need tab.textwidget.index()
+    line, column = map(int, cursor_pos.split("."))
+    replace_start = f"{line}.{column - len(word)}"
+
+    result = []
+    for item in items:
+        filter_text = item.filterText or item.insertText or item.label
+        if requested_word is not None:
+            typed_after_request = word[len(requested_word) :].lower()
+            if typed_after_request not in filter_text[len(requested_word) :].lower():
+                continue
+        result.append(
+            autocomplete.Completion(
+                display_text=item.label,
+                replace_start=replace_start,
+                replace_end=cursor_pos,
+                replace_text=item.insertText or item.label,
+                # TODO: is slicing necessary here?
+                filter_text=filter_text[len(word) :],
+                documentation=get_completion_item_doc(item),
+            )
+        )
+    return result
+
+
+@dataclasses.dataclass
+class _CompletionCache:
+    # Where the word being completed starts
+    line: int
+    column: int
+    # The word when the langserver was asked, and the items it gave, sorted
+    word: str
+    items: List[lsp.CompletionItem]
+
+
 def exit_code_string(exit_code: int) -> str:
     if exit_code >= 0:
         return f"exited with code {exit_code}"
@@ -246,6 +300,252 @@ def _substitute_python_venv_recursively(obj: object, venv: Path | None) -> Any:
     return obj
 
 
+# Langservers often send diagnostics many times in a row when the user types
+# quickly, and we show only the last ones
+DIAGNOSTICS_DELAY_MS = 100
+
+# How many didChange notifications to remember for each tab
+MAX_REMEMBERED_CHANGES = 200
+
+
+# The version of the document that the diagnostics are for was added in LSP
+# 3.15, and sansio-lsp-client doesn't know about it yet
+class _PublishDiagnostics(lsp.PublishDiagnostics):
+    version: Optional[int] = None
+
+
+class _Client(lsp.Client):
+    def _handle_request(self, request: lsp.Request) -> lsp.Event:
+        if request.method == "textDocument/publishDiagnostics":
+            return _PublishDiagnostics.parse_obj(request.params)
+        return super()._handle_request(request)
+
+
+class _DiagnosticsStore:
+    """Shows the diagnostics of one tab as underlines.
+
+    The langserver computes diagnostics for some version of the file, but the
+    user may have typed more after that version was sent to the langserver.
+    To show the diagnostics in the right place, we remember what changes were
+    sent, and move the diagnostics through the changes the langserver hadn't
+    seen yet.
+    """
+
+    def __init__(self, tab: tabs.FileTab) -> None:
+        self._tab = tab
+        self._sent_changes: list[tuple[int, list[textutils.Change]]] = []  # (version, changes)
+        self._diagnostics: list[lsp.Diagnostic] | None = None  # None if nothing to show
+        self._unseen_changes: list[textutils.Change] = []
+        self._timeout: str | None = None
+
+    def document_opened(self) -> None:
+        self._sent_changes.clear()
+
+    def changes_sent(self, version: int, changes: list[textutils.Change]) -> None:
+        self._sent_changes.append((version, changes))
+        del self._sent_changes[:-MAX_REMEMBERED_CHANGES]
+        if self._diagnostics is not None:
+            self._unseen_changes.extend(changes)
+
+    def diagnostics_received(self, diagnostics: list[lsp.Diagnostic], version: int | None) -> None:
+        self._diagnostics = diagnostics
+        if version is None:
+            # Langserver didn't say what version the diagnostics are for.
+            # Assume it has seen everything we have sent.
+            self._unseen_changes = []
+        else:
+            self._unseen_changes = [
+                change
+                for sent_version, changes in self._sent_changes
+                if sent_version > version
+                for change in changes
+            ]
+            # Older versions won't be needed, diagnostics don't come in the wrong order
+            self._sent_changes = [item for item in self._sent_changes if item[0] > version]
+
+        if self._timeout is None:
+            self._timeout = self._tab.after(DIAGNOSTICS_DELAY_MS, self._show)
+
+    def _show(self) -> None:
+        self._timeout = None
+        if self._diagnostics is None:
+            return
+
+        underline_list = []
+        # error red underlines should be shown over orange warning underlines
+        for diagnostic in sorted(
+            self._diagnostics,
+            key=(lambda diagn: diagn.severity or lsp.DiagnosticSeverity.WARNING),
+            reverse=True,
+        ):
+            start = (diagnostic.range.start.line + 1, diagnostic.range.start.character)
+            end = (diagnostic.range.end.line + 1, diagnostic.range.end.character)
+            for change in self._unseen_changes:
+                start = textutils.move_position(start, change)
+                end = textutils.move_position(end, change, is_end=True)
+            if start >= end and diagnostic.range.start != diagnostic.range.end:
+                # The text that the diagnostic was about has been deleted
+                continue
+
+            underline_list.append(
+                underlines.Underline(
+                    start=f"{start[0]}.{start[1]}",
+                    end=f"{end[0]}.{end[1]}",
+                    tooltip_text=_get_diagnostic_string(diagnostic),
+                    # TODO: there are plenty of other severities than ERROR and WARNING
+                    color=(
+                        "red" if diagnostic.severity == lsp.DiagnosticSeverity.ERROR else "orange"
+                    ),
+                )
+            )
+
+        self._diagnostics = None
+        self._unseen_changes = []
+        underlines.set_underlines(
+            self._tab.textwidget,
+            underlines.Underlines(id="diagnostics", underline_list=underline_list),
+        )
+
+    def forget(self) -> None:
+        if self._timeout is not None:
+            self._tab.after_cancel(self._timeout)
+            self._timeout = None
+        self._diagnostics = None
+        self._unseen_changes = []
+
+
+# How many hover results to remember for each tab
+HOVER_CACHE_SIZE = 50
+
+
+@dataclasses.dataclass
+class _PendingRequest:
+    method: str  # "hover" or "definition"
+    tab: tabs.FileTab
+    version: int  # document version when the request was sent
+    position: str  # Tk text index
+    location: str  # where to show a hover
+    start_time: float
+    cancelled: bool = False
+
+
+class _RequestStats:
+    def __init__(self) -> None:
+        self.sent = 0
+        self.deduplicated = 0
+        self.cancelled = 0
+        self.from_cache = 0
+        self.responses = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def __str__(self) -> str:
+        average = self.total_time / self.responses if self.responses else 0
+        return (
+            f"{self.sent} sent, {self.deduplicated} deduplicated, {self.cancelled} cancelled,"
+            f" {self.from_cache} from cache, {self.responses} responses"
+            f" (average {average * 1000:.0f}ms, max {self.max_time * 1000:.0f}ms)"
+        )
+
+
+class _RequestManager:
+    """Sends hover and jump to definition requests without flooding the langserver.
+
+    Only the latest request of each kind matters for each tab. An older
+    request still waiting for a response is cancelled when a request for a
+    different position is sent. Sending the same request again (same
+    document version and position) does nothing, because we're already
+    waiting for the response. Hover results are cached until the document
+    changes.
+    """
+
+    def __init__(self, lsp_client: lsp.Client, log: logging.LoggerAdapter[logging.Logger]) -> None:
+        self._lsp_client = lsp_client
+        self._log = log
+        self._pending: dict[lsp.Id, _PendingRequest] = {}
+        self._latest: dict[tuple[str, tabs.FileTab], lsp.Id] = {}
+        # For each tab: the document version, and results for positions of that version
+        self._hover_cache: dict[tabs.FileTab, tuple[int, collections.OrderedDict[str, str]]] = {}
+        self.stats = {"hover": _RequestStats(), "definition": _RequestStats()}
+
+    def get_cached_hover(self, tab: tabs.FileTab, version: int, position: str) -> str | None:
+        if tab not in self._hover_cache:
+            return None
+        cache_version, results = self._hover_cache[tab]
+        if cache_version != version or position not in results:
+            return None
+
+        results.move_to_end(position)
+        self.stats["hover"].from_cache += 1
+        return results[position]
+
+    def add_hover_to_cache(
+        self, tab: tabs.FileTab, version: int, position: str, hover_text: str
+    ) -> None:
+        if tab not in self._hover_cache or self._hover_cache[tab][0] != version:
+            self._hover_cache[tab] = (version, collections.OrderedDict())
+        results = self._hover_cache[tab][1]
+        results[position] = hover_text
+        while len(results) > HOVER_CACHE_SIZE:
+            results.popitem(last=False)
+
+    def send(
+        self,
+        method: str,
+        tab: tabs.FileTab,
+        version: int,
+        position: str,
+        send_request: Callable[[], lsp.Id],
+        *,
+        location: str = "",
+    ) -> None:
+        stats = self.stats[method]
+
+        old_id = self._latest.get((method, tab))
+        if old_id is not None:
+            old = self._pending[old_id]
+            if (old.version, old.position) == (version, position):
+                old.location = location
+                stats.deduplicated += 1
+                return
+
+            # sansio-lsp-client can only cancel the request that was sent last
+            self._lsp_client._send_notification("$/cancelRequest", {"id": old_id})
+            old.cancelled = True
+            stats.cancelled += 1
+
+        request_id = send_request()
+        self._pending[request_id] = _PendingRequest(
+            method, tab, version, position, location, time.perf_counter()
+        )
+        self._latest[method, tab] = request_id
+        stats.sent += 1
+
+    # Returns None if the response is not for a request sent with this class
+    def response_received(self, request_id: lsp.Id) -> _PendingRequest | None:
+        request = self._pending.pop(request_id, None)
+        if request is None:
+            return None
+
+        elapsed = time.perf_counter() - request.start_time
+        stats = self.stats[request.method]
+        stats.responses += 1
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+        self._log.debug(f"{request.method} response took {elapsed * 1000:.0f}ms")
+
+        if self._latest.get((request.method, request.tab)) == request_id:
+            del self._latest[request.method, request.tab]
+        return request
+
+    def forget_tab(self, tab: tabs.FileTab) -> None:
+        self._hover_cache.pop(tab, None)
+        for request in self._pending.values():
+            if request.tab == tab:
+                request.cancelled = True
+        self._latest = {key: value for key, value in self._latest.items() if key[1] != tab}
+
+
 @dataclasses.dataclass
 class LangServerConfig:
     command: str
@@ -266,11 +566,13 @@ class LangServer:
         self._config = config
         self._project_root = project_root
 
-        self._lsp_client = lsp.Client(trace="verbose", root_uri=project_root.as_uri())
+        self._lsp_client = _Client(trace="verbose", root_uri=project_root.as_uri())
 
         self._autocompletion_requests: dict[lsp.Id, tuple[tabs.FileTab, autocomplete.Request]] = {}
-        self._jump2def_requests: dict[lsp.Id, tabs.FileTab] = {}
-        self._hover_requests: dict[lsp.Id, tuple[tabs.FileTab, str]] = {}
+        self._requests = _RequestManager(self._lsp_client, log)
+        self._document_versions: dict[tabs.FileTab, int] = {}
+        self._completion_caches: dict[tabs.FileTab, _CompletionCache] = {}
+        self._diagnostics: dict[tabs.FileTab, _DiagnosticsStore] = {}
 
         self._version_counter = itertools.count()
         self.tabs_opened: set[tabs.FileTab] = set()
@@ -370,12 +672,14 @@ class LangServer:
         config = tab.settings.get("langserver", Optional[LangServerConfig])
         assert tab.path is not None
 
+        self._diagnostics[tab].document_opened()
+        self._document_versions[tab] = next(self._version_counter)
         self._lsp_client.did_open(
             lsp.TextDocumentItem(
                 uri=tab.path.as_uri(),
                 languageId=config.language_id,
                 text=tab.textwidget.get("1.0", "end - 1 char"),
-                version=next(self._version_counter),
+                version=self._document_versions[tab],
             )
         )
 
@@ -435,38 +739,25 @@ class LangServer:
                 self.log.debug(f"Completion sent to closed tab: {lsp_event}")
                 return
 
-            # this is "open to interpretation", as the lsp spec says
-            # TODO: use textEdit when available (need to find langserver that
-            #       gives completions with textEdit for that to work)
-            before_cursor = tab.textwidget.get(f"{req.cursor_pos} linestart", req.cursor_pos)
-            match = re.fullmatch(r".*?(\w*)", before_cursor)
-            assert match is not None
-            prefix_len = len(match.group(1))
-
             assert lsp_event.completion_list is not None
+            word = _get_word_before_cursor(tab.textwidget, req.cursor_pos)
+            items = sorted(
+                lsp_event.completion_list.items, key=(lambda item: item.sortText or item.label)
+            )
+
+            # If the list is incomplete, the langserver must be asked again when the user types more
+            if lsp_event.completion_list.isIncomplete:
+                self._completion_caches.pop(tab, None)
+            else:
+                line, column = map(int, req.cursor_pos.split("."))
+                self._completion_caches[tab] = _CompletionCache(
+                    line, column - len(word), word, items
+                )
+
             tab.event_generate(
                 "<<AutoCompletionResponse>>",
                 data=autocomplete.Response(
-                    id=req.id,
-                    completions=[
-                        autocomplete.Completion(
-                            display_text=item.label,
-                            replace_start=tab.textwidget.index(
-                                f"{req.cursor_pos} - {prefix_len} chars"
-                            ),
-                            replace_end=req.cursor_pos,
-                            replace_text=item.insertText or item.label,
-                            # TODO: is slicing necessary here?
-                            filter_text=(item.filterText or item.insertText or item.label)[
-                                prefix_len:
-                            ],
-                            documentation=get_completion_item_doc(item),
-                        )
-                        for item in sorted(
-                            lsp_event.completion_list.items,
-                            key=(lambda item: item.sortText or item.label),
-                        )
-                    ],
+                    id=req.id, completions=_create_completions(items, req.cursor_pos, word)
                 ),
             )
             return
@@ -483,39 +774,33 @@ class LangServer:
                 return
             [tab] = matching_tabs
 
-            tab.event_generate(
-                "<<SetUnderlines>>",
-                data=underlines.Underlines(
-                    id="diagnostics",
-                    underline_list=[
-                        underlines.Underline(
-                            start=_position_lsp2tk(diagnostic.range.start),
-                            end=_position_lsp2tk(diagnostic.range.end),
-                            tooltip_text=_get_diagnostic_string(diagnostic),
-                            # TODO: there are plenty of other severities than ERROR and WARNING
-                            color=(
-                                "red"
-                                if diagnostic.severity == lsp.DiagnosticSeverity.ERROR
-                                else "orange"
-                            ),
-                        )
-                        for diagnostic in sorted(
-                            lsp_event.diagnostics,
-                            # error red underlines should be shown over orange warning underlines
-                            key=(lambda diagn: diagn.severity or lsp.DiagnosticSeverity.WARNING),
-                            reverse=True,
-                        )
-                    ],
-                ),
-            )
+            # Newer langservers can tell which version of the file the diagnostics are for
+            assert isinstance(lsp_event, _PublishDiagnostics)
+            self._diagnostics[tab].diagnostics_received(lsp_event.diagnostics, lsp_event.version)
             return
 
+        if isinstance(lsp_event, lsp.ResponseError):
+            request = (
+                None
+                if lsp_event.message_id is None
+                else self._requests.response_received(lsp_event.message_id)
+            )
+            if request is not None and request.cancelled:
+                self.log.debug(f"{request.method} request was cancelled: {lsp_event.message}")
+                return
+            if request is not None:
+                self.log.warning(f"{request.method} request failed: {lsp_event.message}")
+                return
+
         if isinstance(lsp_event, lsp.Definition):
             assert lsp_event.message_id is not None  # TODO: fix in sansio-lsp-client
-            requesting_tab = self._jump2def_requests.pop(lsp_event.message_id)
+            request = self._requests.response_received(lsp_event.message_id)
+            assert request is not None
 
-            if requesting_tab in get_tab_manager().tabs():
-                requesting_tab.event_generate(
+            if request.cancelled:
+                self.log.debug("not jumping to definition, newer request was sent")
+            elif request.tab in get_tab_manager().tabs():
+                request.tab.event_generate(
                     "<<JumpToDefinitionResponse>>",
                     data=jump_to_definition.Response(
                         [
@@ -534,15 +819,22 @@ class LangServer:
 
         if isinstance(lsp_event, lsp.Hover):
             assert lsp_event.message_id is not None  # TODO: fix in sansio-lsp-client
-            requesting_tab, location = self._hover_requests.pop(lsp_event.message_id)
+            request = self._requests.response_received(lsp_event.message_id)
+            assert request is not None
 
-            if requesting_tab in get_tab_manager().tabs():
-                requesting_tab.textwidget.event_generate(
-                    "<<HoverResponse>>",
-                    data=hover.Response(location, _get_hover_string(lsp_event.contents)),
-                )
-            else:
+            if request.tab not in self.tabs_opened:
                 self.log.debug("not showing hover, tab was closed")
+                return
+
+            hover_text = _get_hover_string(lsp_event.contents)
+            # Even if a newer request was sent, the user may come back to this location
+            self._requests.add_hover_to_cache(
+                request.tab, request.version, request.position, hover_text
+            )
+            if not request.cancelled:
+                request.tab.textwidget.event_generate(
+                    "<<HoverResponse>>", data=hover.Response(request.location, hover_text)
+                )
             return
 
         # str(lsp_event) or just lsp_event won't show the type
@@ -555,6 +847,7 @@ class LangServer:
     def open_tab(self, tab: tabs.FileTab) -> None:
         assert tab not in self.tabs_opened
         self.tabs_opened.add(tab)
+        self._diagnostics[tab] = _DiagnosticsStore(tab)
         self.log.debug("tab opened")
         if self._lsp_client.state == lsp.ClientState.NORMAL:
             self._send_tab_opened_message(tab)
@@ -567,10 +860,16 @@ class LangServer:
             return
 
         self.tabs_opened.remove(tab)
+        self._diagnostics.pop(tab).forget()
+        self._completion_caches.pop(tab, None)
+        self._requests.forget_tab(tab)
+        self._document_versions.pop(tab, None)
         self.log.debug("tab closed")
 
         if may_shutdown and not self.tabs_opened:
             self.log.info("no more open tabs, shutting down")
+            for method, stats in self._requests.stats.items():
+                self.log.info(f"{method} requests: {stats}")
             self._is_shutting_down_cleanly = True
             self._get_removed_from_langservers()
 
@@ -589,6 +888,9 @@ class LangServer:
 
         assert tab.path is not None
         request = event.data_class(autocomplete.Request)
+        if self._complete_from_cache(tab, request):
+            return
+
         lsp_id = self._lsp_client.completion(
             text_document_position=lsp.TextDocumentPosition(
                 textDocument=lsp.TextDocumentIdentifier(uri=tab.path.as_uri()),
@@ -604,29 +906,90 @@ class LangServer:
         assert lsp_id not in self._autocompletion_requests
         self._autocompletion_requests[lsp_id] = (tab, request)
 
+    # When the user keeps typing the same word, the previous completions can be filtered
+    def _complete_from_cache(self, tab: tabs.FileTab, request: autocomplete.Request) -> bool:
+        cache = self._completion_caches.get(tab)
+        if cache is None:
+            return False
+
+        word = _get_word_before_cursor(tab.textwidget, request.cursor_pos)
+        line, column = map(int, request.cursor_pos.split("."))
+        if (line, column - len(word)) != (cache.line, cache.column) or not word.startswith(
+            cache.word
+        ):
+            return False
+
+        self.log.debug(f"completing {word!r} from cached completions of {cache.word!r}")
+        tab.event_generate(
+            "<<AutoCompletionResponse>>",
+            data=autocomplete.Response(
+                id=request.id,
+                completions=_create_completions(
+                    cache.items, request.cursor_pos, word, requested_word=cache.word
+                ),
+            ),
+        )
+        return True
+
+    def _forget_cached_completions(self, tab: tabs.FileTab, changes: textutils.Changes) -> None:
+        cache = self._completion_caches.get(tab)
+        if cache is None:
+            return
+
+        # Typing the word that is being completed is fine, anything else isn't
+        for change in changes.change_list:
+            if not (
+                change.start[0] == change.old_end[0] == change.new_end[0] == cache.line
+                and change.start[1] >= cache.column
+            ):
+                del self._completion_caches[tab]
+                return
+
     def request_jump_to_definition(self, tab: tabs.FileTab) -> None:
         self.log.info(f"Jump to definition requested: {tab.path} {self._lsp_client.state}")
         if tab.path is not None and self._lsp_client.state == lsp.ClientState.NORMAL:
-            request_id = self._lsp_client.definition(
-                lsp.TextDocumentPosition(
-                    textDocument=lsp.TextDocumentIdentifier(uri=tab.path.as_uri()),
-                    position=_position_tk2lsp(tab.textwidget.index("insert")),
-                )
+            position = tab.textwidget.index("insert")
+            text_document_position = lsp.TextDocumentPosition(
+                textDocument=lsp.TextDocumentIdentifier(uri=tab.path.as_uri()),
+                position=_position_tk2lsp(position),
+            )
+            self._requests.send(
+                "definition",
+                tab,
+                self._document_versions[tab],
+                position,
+                partial(self._lsp_client.definition, text_document_position),
             )
-            self._jump2def_requests[request_id] = tab
 
     def request_hover(self, tab: tabs.FileTab, location: str) -> None:
-        self.log.info(f"Hover requested: {tab.path} {self._lsp_client.state}")
-        if tab.path is not None and self._lsp_client.state == lsp.ClientState.NORMAL:
-            request_id = self._lsp_client.hover(
-                lsp.TextDocumentPosition(
-                    textDocument=lsp.TextDocumentIdentifier(uri=tab.path.as_uri()),
-                    position=_position_tk2lsp(location),
-                )
+        self.log.debug(f"Hover requested: {tab.path} {self._lsp_client.state}")
+        if tab.path is None or self._lsp_client.state != lsp.ClientState.NORMAL:
+            return
+
+        version = self._document_versions[tab]
+        position = tab.textwidget.index(location)
+        cached_text = self._requests.get_cached_hover(tab, version, position)
+        if cached_text is not None:
+            tab.textwidget.event_generate(
+                "<<HoverResponse>>", data=hover.Response(location, cached_text)
             )
-            self._hover_requests[request_id] = (tab, location)
+            return
+
+        text_document_position = lsp.TextDocumentPosition(
+            textDocument=lsp.TextDocumentIdentifier(uri=tab.path.as_uri()),
+            position=_position_tk2lsp(position),
+        )
+        self._requests.send(
+            "hover",
+            tab,
+            version,
+            position,
+            partial(self._lsp_client.hover, text_document_position),
+            location=location,
+        )
 
     def send_change_events(self, tab: tabs.FileTab, changes: textutils.Changes) -> None:
+        self._forget_cached_completions(tab, changes)
         if self._lsp_client.state != lsp.ClientState.NORMAL:
             # The langserver will receive the actual content of the file once
             # it starts.
@@ -635,12 +998,15 @@ class LangServer:
             )
             return
 
-        assert tab.path is not None
-        self._lsp_client.did_change(
-            text_document=lsp.VersionedTextDocumentIdentifier(
-                uri=tab.path.as_uri(), version=next(self._version_counter)
-            ),
-            content_changes=[
+        if changes.whole_document_replaced:
+            # Simpler and faster than sending a huge range
+            content_changes = [
+                lsp.TextDocumentContentChangeEvent.whole_document_change(
+                    tab.textwidget.get("1.0", "end - 1 char")
+                )
+            ]
+        else:
+            content_changes = [
                 lsp.TextDocumentContentChangeEvent(
                     range=lsp.Range(
                         start=_position_tk2lsp(change.start), end=_position_tk2lsp(change.old_end)
@@ -648,8 +1014,18 @@ class LangServer:
                     text=change.new_text,
                 )
                 for change in changes.change_list
-            ],
+            ]
+
+        assert tab.path is not None
+        version = next(self._version_counter)
+        self._document_versions[tab] = version
+        self._lsp_client.did_change(
+            text_document=lsp.VersionedTextDocumentIdentifier(
+                uri=tab.path.as_uri(), version=version
+            ),
+            content_changes=content_changes,
         )
+        self._diagnostics[tab].changes_sent(version, changes.change_list)
 
 
 # String in key is the command. Each project can have multiple langservers with
@@ -724,10 +1100,9 @@ def switch_langservers(
 
     if old is not new:
         global_log.info(f"Switching langservers: {old} --> {new}")
-        tab.event_generate(
-            "<<SetUnderlines>>", data=underlines.Underlines(id="diagnostics", underline_list=[])
+        underlines.set_underlines(
+            tab.textwidget, underlines.Underlines(id="diagnostics", underline_list=[])
         )
-
         if old is not None:
             old.forget_tab(tab)
         if new is not None:
@@ -37,6 +37,9 @@ from porcupine.settings import global_settings
 
 log = logging.getLogger(__name__)
 
+# ssl and urllib are slow to import, and nobody pastebins right at startup
+load_when = "idle"
+
 
 DPASTE_URL = "https://dpaste.com/api/v2/"
 TERMBIN_HOST_AND_PORT = ("termbin.com", 9999)
@@ -0,0 +1,293 @@
+"""
+Format the current file with black or isort.
+
+Available in Tools/Python/Black and Tools/Python/Isort. If some text is
+selected, only the selected lines are formatted.
+
+Tools/Python/Format runs the formatters listed in the ``formatters`` option
+of filetypes.toml. With ``format_on_save = true``, they also run when the
+file is saved. If they don't finish quickly, the file is saved without
+formatting, so that saving doesn't freeze Porcupine.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import os
+import subprocess
+import textwrap
+import threading
+from concurrent.futures import Future
+from functools import partial
+from pathlib import Path
+from tkinter import messagebox
+from typing import Any, List
+
+from porcupine import get_tab_manager, menubar, tabs, textutils, utils
+from porcupine.plugins import python_venv
+
+log = logging.getLogger(__name__)
+
+_WORKER_SCRIPT = Path(__file__).with_name("worker.py")
+
+# Saving waits for the formatters at most this long
+FORMAT_ON_SAVE_TIMEOUT = 1  # seconds
+
+
+class _Worker:
+    """A Python process that runs black and isort without importing them again each time.
+
+    Porcupine's own Python can't be used, because black and isort should
+    come from the project's venv.
+    """
+
+    def __init__(self, python: Path) -> None:
+        self._lock = threading.Lock()
+        self._process = subprocess.Popen(
+            [str(python), str(_WORKER_SCRIPT)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            **utils.subprocess_kwargs,
+        )
+
+    def run(self, tool: str, code: str, cwd: Path) -> dict[str, Any]:
+        assert self._process.stdin is not None
+        assert self._process.stdout is not None
+
+        request = json.dumps({"tool": tool, "code": code, "cwd": str(cwd)}) + "\n"
+        with self._lock:
+            self._process.stdin.write(request.encode("utf-8"))
+            self._process.stdin.flush()
+            response_line = self._process.stdout.readline()
+
+        if not response_line:
+            raise RuntimeError(f"worker process died with status {self._process.wait()}")
+        response: dict[str, Any] = json.loads(response_line)
+        return response
+
+    def kill(self) -> None:
+        self._process.kill()
+
+
+# One for each Python interpreter
+_workers: dict[Path, _Worker] = {}
+_workers_lock = threading.Lock()
+
+
+def _run_in_worker(python: Path, tool: str, code: str, cwd: Path) -> dict[str, Any]:
+    with _workers_lock:
+        if python not in _workers:
+            _workers[python] = _Worker(python)
+        worker = _workers[python]
+
+    try:
+        return worker.run(tool, code, cwd)
+    except (OSError, ValueError, RuntimeError):
+        # Maybe the Python is too old, or the worker crashed. Start a new Python just for this.
+        log.warning(f"running {tool} in a worker process failed", exc_info=True)
+        with _workers_lock:
+            if _workers.get(python) is worker:
+                del _workers[python]
+        worker.kill()
+
+    # run in subprocess just to make sure that it can't crash porcupine
+    #
+    # FIXME: file must not be named black.py or similar
+    result = subprocess.run(
+        [str(python), "-m", tool, "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        input=code.encode("utf-8"),
+        **utils.subprocess_kwargs,
+    )
+    return {
+        "status": result.returncode,
+        "stdout": result.stdout.decode("utf-8"),
+        "stderr": result.stderr.decode("utf-8", errors="replace"),
+    }
+
+
+# Formatters don't like indented code, so when formatting selected lines,
+# the indentation common to all lines is removed and then added back
+def _dedent(code: str) -> tuple[str, str]:
+    indents = [line[: len(line) - len(line.lstrip())] for line in code.splitlines() if line.strip()]
+    prefix = os.path.commonprefix(indents) if indents else ""
+    return (prefix, textwrap.dedent(code))
+
+
+@dataclasses.dataclass
+class _FormatResult:
+    new_text: str
+    diff: list[tuple[int, int, int, int]]
+
+
+@dataclasses.dataclass
+class _ToolError:
+    tool: str
+    stderr: str
+
+
+# Runs in a thread. Lines start_line <= lineno < end_line (starting at 0) are formatted.
+def _format(
+    python: Path, tools: list[str], old_text: str, start_line: int, end_line: int, cwd: Path
+) -> _FormatResult | _ToolError:
+    old_lines = old_text.split("\n")
+    prefix, code = _dedent("".join(line + "\n" for line in old_lines[start_line:end_line]))
+
+    # Output of each tool goes to the next tool
+    for tool in tools:
+        result = _run_in_worker(python, tool, code, cwd)
+        if result["status"] != 0:
+            return _ToolError(tool, result["stderr"])
+        code = result["stdout"]
+
+    if code and not code.endswith("\n"):
+        code += "\n"
+    formatted_lines = textwrap.indent(code, prefix).split("\n")[:-1]
+    new_lines = old_lines[:start_line] + formatted_lines + old_lines[end_line:]
+
+    # Diffing a big file takes a while, so it's not done in the Tk thread
+    return _FormatResult("\n".join(new_lines), textutils.diff_lines(old_lines, new_lines))
+
+
+def _find_python(tab: tabs.FileTab) -> Path | None:
+    return python_venv.find_python(None if tab.path is None else utils.find_project_root(tab.path))
+
+
+# set cwd so that black/isort finds its config in pyproject.toml
+def _get_cwd(tab: tabs.FileTab) -> Path:
+    return Path.home() if tab.path is None else tab.path.parent
+
+
+def _count_lines(text: str) -> int:
+    return text.count("\n") + (0 if text.endswith("\n") else 1)
+
+
+def format_code(tab: tabs.FileTab, tools: list[str], *, selection_only: bool = False) -> None:
+    """Run formatters, such as ``["isort", "black"]``, in a separate thread.
+
+    If *selection_only* is True and some text is selected, only the selected
+    lines are formatted. The result is applied to the text widget with
+    :func:`porcupine.textutils.replace_text_with_diff`. If the text changed
+    while the formatters were running, the result is thrown away.
+    """
+    python = _find_python(tab)
+    if python is None:
+        messagebox.showerror(
+            "Can't find a Python installation", f"You need to install Python to run {tools[0]}."
+        )
+        return
+
+    before = tab.textwidget.get("1.0", "end - 1 char")
+    if selection_only and tab.textwidget.tag_ranges("sel"):
+        start_line = int(tab.textwidget.index("sel.first").split(".")[0]) - 1
+        end_line = int(tab.textwidget.index("sel.last - 1 char").split(".")[0])
+    else:
+        start_line = 0
+        end_line = _count_lines(before)
+
+    def done(success: bool, result: str | _FormatResult | _ToolError) -> None:
+        if isinstance(result, _FormatResult):
+            # Don't lose what the user typed while the tools were running
+            if (
+                tab.textwidget.winfo_exists()
+                and tab.textwidget.get("1.0", "end - 1 char") == before
+                and result.new_text != before
+            ):
+                textutils.replace_text_with_diff(tab.textwidget, result.new_text, diff=result.diff)
+        elif isinstance(result, _ToolError):
+            messagebox.showerror(
+                f"Running {result.tool} failed",
+                utils.tkinter_safe_string(result.stderr, hide_unsupported_chars=True),
+            )
+        else:
+            log.error(f"running {', '.join(tools)} failed:\n{result}")
+            messagebox.showerror("Formatting failed", result)
+
+    utils.run_in_thread(
+        partial(_format, python, tools, before, start_line, end_line, _get_cwd(tab)),
+        done,
+        check_interval_ms=10,
+    )
+
+
+def format_with_tool(tool: str, tab: tabs.FileTab) -> None:
+    format_code(tab, [tool], selection_only=True)
+
+
+def format_with_configured_tools(tab: tabs.FileTab) -> None:
+    tools = tab.settings.get("formatters", List[str])
+    if tools:
+        format_code(tab, tools, selection_only=True)
+    else:
+        messagebox.showerror(
+            "No formatters",
+            "No formatters are configured for this file type.",
+            detail="You can set them in filetypes.toml. Go to Settings → Config Files.",
+        )
+
+
+def _format_in_daemon_thread(
+    python: Path, tools: list[str], text: str, cwd: Path
+) -> Future[_FormatResult | _ToolError]:
+    future: Future[_FormatResult | _ToolError] = Future()
+
+    def thread_target() -> None:
+        try:
+            future.set_result(_format(python, tools, text, 0, _count_lines(text), cwd))
+        except Exception as e:
+            future.set_exception(e)
+
+    # Daemon, so that a formatter that never finishes doesn't prevent quitting Porcupine
+    threading.Thread(target=thread_target, daemon=True).start()
+    return future
+
+
+# Formatting happens before saving, so that the file is saved only once. The
+# formatters run in the worker processes, and usually they are fast enough.
+def on_save(tab: tabs.FileTab, junk: object) -> None:
+    tools = tab.settings.get("formatters", List[str])
+    if not tools or not tab.settings.get("format_on_save", bool):
+        return
+
+    python = _find_python(tab)
+    if python is None:
+        log.warning(f"can't find a Python installation, not formatting {tab.path} on save")
+        return
+
+    before = tab.textwidget.get("1.0", "end - 1 char")
+    future = _format_in_daemon_thread(python, tools, before, _get_cwd(tab))
+    try:
+        result = future.result(timeout=FORMAT_ON_SAVE_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        log.warning(
+            f"running {', '.join(tools)} took more than {FORMAT_ON_SAVE_TIMEOUT} seconds,"
+            f" saving {tab.path} without formatting"
+        )
+        return
+    except Exception:
+        log.exception(f"running {', '.join(tools)} failed")
+        return
+
+    if isinstance(result, _ToolError):
+        log.warning(f"running {result.tool} failed, saving {tab.path} without formatting")
+    elif result.new_text != before:
+        textutils.replace_text_with_diff(tab.textwidget, result.new_text, diff=result.diff)
+
+
+def on_new_filetab(tab: tabs.FileTab) -> None:
+    tab.settings.add_option("formatters", [], List[str])
+    tab.settings.add_option("format_on_save", False)
+    tab.bind("<<BeforeSave>>", partial(on_save, tab), add=True)
+
+
+def setup() -> None:
+    get_tab_manager().add_filetab_callback(on_new_filetab)
+    menubar.add_filetab_command("Tools/Python/Black", partial(format_with_tool, "black"))
+    menubar.add_filetab_command("Tools/Python/Isort", partial(format_with_tool, "isort"))
+    menubar.add_filetab_command("Tools/Python/Format", format_with_configured_tools)
@@ -0,0 +1,72 @@
+"""Runs black or isort many times without importing them again every time.
+
+Porcupine starts this with the Python of the project's venv, so this file
+must not import anything from Porcupine. Porcupine sends a JSON object on
+each line of stdin, and this script responds with one JSON line to stdout.
+"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import runpy
+import sys
+from typing import Any
+
+
+def _clear_caches(tool: str) -> None:
+    # Black caches e.g. the location of pyproject.toml. With a new working
+    # directory, it must be looked up again.
+    for name, module in list(sys.modules.items()):
+        if name == tool or name.startswith(tool + "."):
+            for value in list(vars(module).values()):
+                if callable(getattr(value, "cache_clear", None)):
+                    value.cache_clear()
+
+
+def run_tool(tool: str, code: str, cwd: str) -> dict[str, Any]:
+    os.chdir(cwd)
+    _clear_caches(tool)
+
+    stdin = io.TextIOWrapper(io.BytesIO(code.encode("utf-8")), encoding="utf-8")
+    stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    stderr = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    old_streams = (sys.stdin, sys.stdout, sys.stderr, sys.argv)
+    sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+    sys.argv = [tool, "-"]
+
+    # Same as "python -m black -", but black is imported only the first time
+    try:
+        runpy.run_module(tool, run_name="__main__", alter_sys=True)
+        status = 0
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        sys.stdin, sys.stdout, sys.stderr, sys.argv = old_streams
+
+    stdout.flush()
+    stderr.flush()
+    assert isinstance(stdout.buffer, io.BytesIO)
+    assert isinstance(stderr.buffer, io.BytesIO)
+    return {
+        "status": status,
+        "stdout": stdout.buffer.getvalue().decode("utf-8"),
+        "stderr": stderr.buffer.getvalue().decode("utf-8", errors="replace"),
+    }
+
+
+def main() -> None:
+    # The tools must not print to the real stdout, that would break the protocol
+    real_stdout = sys.stdout
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            response = run_tool(request["tool"], request["code"], request["cwd"])
+        except Exception as e:
+            response = {"status": 1, "stdout": "", "stderr": f"{type(e).__name__}: {e}"}
+        real_stdout.write(json.dumps(response) + "\n")
+        real_stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""Open a file in the current project by typing a part of its name.
+
+Available in File/Quick Open. For example, typing "dirtr" finds
+``porcupine/plugins/directory_tree.py``. Matches in the file name are
+preferred over matches elsewhere in the path, and recently opened files come
+first. Files ignored by git are not shown.
+
+Files are listed when Quick Open is first used in a project. The list of files
+is saved to the cache directory, so that it's available right away after
+restarting Porcupine. It is updated in the background when files may have
+changed, e.g. when the Porcupine window gets focus.
+"""
+from __future__ import annotations
+
+import array
+import bisect
+import dataclasses
+import hashlib
+import json
+import logging
+import re
+import time
+import tkinter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from tkinter import ttk
+from typing import Callable
+
+from porcupine import dirs, get_main_window, get_tab_manager, menubar, tabs, utils
+
+log = logging.getLogger(__name__)
+
+MAX_RESULTS = 50
+
+# How many recently opened files to remember in each project
+MAX_RECENT = 100
+
+# Listing files of a big project takes a while, so don't do it whenever the
+# Porcupine window gets focus or a file is saved
+REFRESH_DELAY_MS = 500
+MIN_REFRESH_INTERVAL = 5  # seconds
+
+# Writing files happens in this thread, one thing at a time in order
+write_pool = ThreadPoolExecutor(max_workers=1)
+
+
+# Must be a function, so that it updates when tests change the dirs object
+def _get_cache_path(project_root: Path) -> Path:
+    # Change the number after v when you make incompatible changes
+    digest = hashlib.sha1(str(project_root).encode("utf-8")).hexdigest()[:16]
+    return dirs.user_cache_path / "quick_open_v1" / f"{project_root.name}-{digest}.json"
+
+
+class _Blob:
+    """Many lines in one string, so that regexes can search all of them at once.
+
+    This is much faster than looping through the lines in Python.
+    """
+
+    def __init__(self, lines: list[str]) -> None:
+        self.text = "\n" + "\n".join(lines) + "\n"
+        self._line_starts = array.array("q")
+        offset = 1
+        for line in lines:
+            self._line_starts.append(offset)
+            offset += len(line) + 1
+
+    # Returns the indexes of matching lines, in order, each index at most once
+    def find(self, regex: re.Pattern[str]) -> Callable[[], int | None]:
+        matches = regex.finditer(self.text)
+        previous = -1
+
+        def next_line_index() -> int | None:
+            nonlocal previous
+            for match in matches:
+                if regex.groups and match.lastindex is None:
+                    # Fuzzy regex, see _compile_fuzzy_regex()
+                    continue
+
+                # Patterns starting with \n match just before the line
+                index = bisect.bisect_right(self._line_starts, match.start()) - 1
+                if regex.pattern.startswith("\n"):
+                    index += 1
+                if index != previous:
+                    previous = index
+                    return index
+            return None
+
+        return next_line_index
+
+
+# "abc" becomes a([^b\n]*b[^c\n]*c)?[^\n]*, which matches the rest of the line
+# even if the group fails to match. Without that, the regex engine would try
+# again from each "a" on the line, and that can be very slow.
+def _compile_fuzzy_regex(query: str) -> re.Pattern[str]:
+    escaped = [re.escape(char) for char in query]
+    rest = "".join(f"[^{char}\n]*{char}" for char in escaped[1:])
+    return re.compile(f"{escaped[0]}({rest})?[^\n]*")
+
+
+def _fuzzy_matches(fuzzy_regex: re.Pattern[str], string: str) -> bool:
+    match = fuzzy_regex.search(string)
+    return match is not None and match.lastindex is not None
+
+
+def _basename(path: str) -> str:
+    return path.rsplit("/", 1)[-1].lower()
+
+
+@dataclasses.dataclass
+class _SearchData:
+    paths: list[str]  # relative, with forward slashes, and short file names first
+    basenames: _Blob
+    full_paths: _Blob
+
+    @classmethod
+    def create(cls, paths: list[str]) -> _SearchData:
+        paths = sorted(paths, key=(lambda path: (len(_basename(path)), len(path), path)))
+        return cls(
+            paths=paths,
+            basenames=_Blob([_basename(path) for path in paths]),
+            full_paths=_Blob([path.lower() for path in paths]),
+        )
+
+
+class ProjectFiles:
+    def __init__(self, project_root: Path) -> None:
+        self.project_root = project_root
+        self.recent: list[str] = []  # most recent first
+        self._search_data = _SearchData.create([])
+        self._load_started = False
+        self._loaded = False
+        self._listed = False
+        self._refreshing = False
+        self._refresh_again = False
+        # (query, what was searched, matches), see search()
+        self._narrowed: tuple[str, _SearchData, _SearchData] | None = None
+
+    def _set_paths(self, paths: list[str], search_data: _SearchData) -> None:
+        path_set = set(paths)
+        recent = [path for path in self.recent if path in path_set]
+        if search_data.paths == self._search_data.paths and recent == self.recent:
+            # Usually nothing changed, and then the cache file is already up to date
+            return
+
+        if search_data.paths != self._search_data.paths:
+            self._search_data = search_data
+            self._narrowed = None
+        self.recent = recent
+        self._save_later()
+
+    def _save_later(self) -> None:
+        # Don't overwrite the cache file before it has been loaded
+        if self._loaded:
+            write_pool.submit(self._save, self._search_data.paths, self.recent.copy())
+
+    def _save(self, paths: list[str], recent: list[str]) -> None:
+        cache_path = _get_cache_path(self.project_root)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_suffix(".tmp")
+        with temp_path.open("w", encoding="utf-8") as file:
+            json.dump({"paths": paths, "recent": recent}, file)
+        temp_path.replace(cache_path)
+
+    # Runs in a thread
+    def _load(self) -> tuple[list[str], list[str], _SearchData] | None:
+        try:
+            with _get_cache_path(self.project_root).open("r", encoding="utf-8") as file:
+                content = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            log.warning(f"can't read cached file list of {self.project_root}", exc_info=True)
+            return None
+        return (content["paths"], content["recent"], _SearchData.create(content["paths"]))
+
+    # Runs in a thread
+    def _list_files(self) -> tuple[list[str], _SearchData]:
+        paths = [
+            path.relative_to(self.project_root).as_posix()
+            for path in utils.list_project_files(self.project_root)
+        ]
+        paths = [path for path in paths if "\n" not in path]  # would mess up searching
+        return (paths, _SearchData.create(paths))
+
+    @property
+    def loading(self) -> bool:
+        return not self._listed
+
+    # Does nothing if already called, so that opening Quick Open doesn't list files
+    def load_and_refresh(self) -> None:
+        if self._load_started:
+            return
+        self._load_started = True
+
+        def done(
+            success: bool, result: str | tuple[list[str], list[str], _SearchData] | None
+        ) -> None:
+            self._loaded = True
+            if isinstance(result, str):
+                log.error(f"loading file list of {self.project_root} failed:\n{result}")
+            elif result is not None:
+                paths, recent, search_data = result
+                self._search_data = search_data
+                self._narrowed = None
+                self.recent += [path for path in recent if path not in self.recent]
+                del self.recent[MAX_RECENT:]
+            self.refresh()
+
+        utils.run_in_thread(self._load, done)
+
+    def refresh(self) -> None:
+        if not self._load_started:
+            # Quick Open hasn't been used in this project, and maybe never will be
+            return
+        if self._refreshing:
+            self._refresh_again = True
+            return
+
+        def done(success: bool, result: str | tuple[list[str], _SearchData]) -> None:
+            self._refreshing = False
+            self._listed = True
+            if isinstance(result, str):
+                log.error(f"listing files in {self.project_root} failed:\n{result}")
+            else:
+                self._set_paths(*result)
+
+            if self._refresh_again:
+                self._refresh_again = False
+                self.refresh()
+
+        self._refreshing = True
+        utils.run_in_thread(self._list_files, done)
+
+    def file_opened(self, path: Path) -> None:
+        relative = path.relative_to(self.project_root).as_posix()
+        if relative in self.recent:
+            self.recent.remove(relative)
+        self.recent.insert(0, relative)
+        del self.recent[MAX_RECENT:]
+        self._save_later()
+
+    def search(self, query: str) -> list[str]:
+        """Return relative paths of files matching the query, best matches first.
+
+        This can be slow in big projects, so it runs in a thread. The file list
+        may change while searching, so each attribute is looked at only once.
+        """
+        query = query.strip().lower().replace("\\", "/")
+        recent = self.recent[:]
+        if not query:
+            return recent[:MAX_RESULTS]
+
+        # When typing more characters to the end of the query, only the
+        # previous matches can match, so there's no need to look at all files
+        all_data = self._search_data
+        data = all_data
+        narrowed = self._narrowed
+        if narrowed is not None and narrowed[1] is all_data and query.startswith(narrowed[0]):
+            data = narrowed[2]
+
+        fuzzy = _compile_fuzzy_regex(query)
+        result: dict[str, None] = {}  # dict is used as an ordered set
+
+        def add_from_recent(match_full_path: bool) -> None:
+            for path in recent:
+                if _fuzzy_matches(fuzzy, path.lower() if match_full_path else _basename(path)):
+                    result[path] = None
+
+        # Returns the paths found, or None if there were too many to find them all
+        def add_from_blob(blob: _Blob, regex: re.Pattern[str]) -> list[str] | None:
+            found: list[str] = []
+            next_line_index = blob.find(regex)
+            while len(result) < MAX_RESULTS:
+                index = next_line_index()
+                if index is None:
+                    return found
+                found.append(data.paths[index])
+                result[data.paths[index]] = None
+            return None
+
+        # Cheap and good ways to find matches are tried first
+        literal = re.escape(query)
+        if "/" not in query:
+            add_from_recent(match_full_path=False)
+            add_from_blob(data.basenames, re.compile("\n" + literal))
+            add_from_blob(data.basenames, re.compile(literal))
+        add_from_blob(data.full_paths, re.compile(literal))
+        if "/" not in query:
+            add_from_blob(data.basenames, fuzzy)
+        add_from_recent(match_full_path=True)
+
+        # Every other match also matches this
+        all_matches = add_from_blob(data.full_paths, fuzzy)
+        if all_matches is not None:
+            self._narrowed = (query, all_data, _SearchData.create(all_matches))
+        return list(result)[:MAX_RESULTS]
+
+
+_project_files: dict[Path, ProjectFiles] = {}
+_refresh_timeout: str | None = None
+_last_refresh_time: float | None = None
+
+
+def get_project_files(project_root: Path) -> ProjectFiles:
+    if project_root not in _project_files:
+        _project_files[project_root] = ProjectFiles(project_root)
+    return _project_files[project_root]
+
+
+class _QuickOpenPopup:
+    def __init__(self, project_files: ProjectFiles) -> None:
+        self._project_files = project_files
+        self._paths: dict[str, str] = {}  # keys are treeview item ids
+        self._searching = False
+        self._search_again = False
+        self._open_after_search = False
+
+        self.window = tkinter.Toplevel()
+        self.window.title(f"Quick Open in {project_files.project_root.name}")
+        self.window.transient(get_main_window())
+
+        content_frame = ttk.Frame(self.window, padding=10)
+        content_frame.pack(fill="both", expand=True)
+
+        self._query_var = tkinter.StringVar()
+        self._query_var.trace_add("write", self._update_results)
+        self._entry = ttk.Entry(content_frame, textvariable=self._query_var)
+        self._entry.pack(fill="x")
+
+        self._treeview = ttk.Treeview(
+            content_frame, columns=("folder",), show="tree", selectmode="browse"
+        )
+        self._treeview.column("#0", width=250)
+        self._treeview.column("folder", width=400)
+        self._treeview.pack(fill="both", expand=True, pady=(5, 0))
+
+        self._status_label = ttk.Label(content_frame)
+        self._status_label.pack(fill="x")
+
+        for widget in [self._entry, self._treeview]:
+            widget.bind("<Return>", self._open_selected, add=True)
+            widget.bind("<Escape>", (lambda event: self.window.destroy()), add=True)
+        self._entry.bind("<Down>", partial(self._move_selection, 1), add=True)
+        self._entry.bind("<Up>", partial(self._move_selection, -1), add=True)
+        self._treeview.bind("<Double-Button-1>", self._open_selected, add=True)
+
+        self._entry.focus_set()
+        self._update_status()
+
+    # Files are listed when Quick Open is first used, show them when they are found
+    def _update_status(self) -> None:
+        if not self.window.winfo_exists():
+            return
+
+        if self._project_files.loading:
+            self._status_label.config(text="Finding files...")
+            self._update_results()
+            self.window.after(500, self._update_status)
+        else:
+            self._status_label.config(text="")
+            self._update_results()
+
+    # Searching a big project can take a while, and doing it in the Tk thread
+    # would freeze the GUI on every keystroke. If the query changes while
+    # searching, the results are stale, and there's no need to show them.
+    def _update_results(self, *junk: object) -> None:
+        if self._searching:
+            self._search_again = True
+            return
+
+        self._searching = True
+        utils.run_in_thread(
+            partial(self._project_files.search, self._query_var.get()),
+            self._search_done,
+            check_interval_ms=20,
+        )
+
+    def _search_done(self, success: bool, result: str | list[str]) -> None:
+        self._searching = False
+        if not self.window.winfo_exists():
+            return
+        if self._search_again:
+            # Many keystrokes while searching result in only one new search
+            self._search_again = False
+            self._update_results()
+            return
+
+        if isinstance(result, str):
+            log.error(f"searching files in {self._project_files.project_root} failed:\n{result}")
+        else:
+            self._show_results(result)
+
+        if self._open_after_search:
+            self._open_after_search = False
+            self._open_selected(None)
+
+    def _show_results(self, paths: list[str]) -> None:
+        old_selection = self._treeview.selection()
+        old_path = self._paths.get(old_selection[0]) if old_selection else None
+
+        self._treeview.delete(*self._treeview.get_children())
+        self._paths.clear()
+        for path in paths:
+            folder, slash, name = path.rpartition("/")
+            item_id = self._treeview.insert("", "end", text=name, values=(folder,))
+            self._paths[item_id] = path
+            if path == old_path:
+                self._treeview.selection_set(item_id)
+
+        children = self._treeview.get_children()
+        if children and not self._treeview.selection():
+            self._treeview.selection_set(children[0])
+        if self._treeview.selection():
+            self._treeview.see(self._treeview.selection()[0])
+
+    def _move_selection(self, step: int, junk_event: object) -> str:
+        children = list(self._treeview.get_children())
+        selection = self._treeview.selection()
+        if children and selection:
+            index = children.index(selection[0]) + step
+            self._treeview.selection_set(children[max(0, min(index, len(children) - 1))])
+            self._treeview.see(self._treeview.selection()[0])
+        return "break"
+
+    def _open_selected(self, junk_event: object) -> str:
+        if self._searching:
+            # Don't open a file found with what was typed before
+            self._open_after_search = True
+            return "break"
+
+        selection = self._treeview.selection()
+        if selection:
+            path = self._project_files.project_root / self._paths[selection[0]]
+            self.window.destroy()
+            get_tab_manager().open_file(path)
+        return "break"
+
+
+def quick_open() -> None:
+    tab = get_tab_manager().select()
+    assert isinstance(tab, tabs.FileTab) and tab.path is not None
+    project_files = get_project_files(utils.find_project_root(tab.path))
+    project_files.load_and_refresh()
+    _QuickOpenPopup(project_files)
+
+
+def on_path_changed(tab: tabs.FileTab, junk: object = None) -> None:
+    if tab.path is not None:
+        project_root = utils.find_project_root(tab.path)
+        get_project_files(project_root).file_opened(tab.path)
+
+
+def on_new_filetab(tab: tabs.FileTab) -> None:
+    on_path_changed(tab)
+    tab.bind("<<PathChanged>>", partial(on_path_changed, tab), add=True)
+
+
+def _refresh_now() -> None:
+    global _refresh_timeout, _last_refresh_time
+    _refresh_timeout = None
+    _last_refresh_time = time.monotonic()
+    for project_files in _project_files.values():
+        project_files.refresh()
+
+
+# Files may have been created or deleted outside Porcupine
+def refresh_all_projects(junk: object) -> None:
+    global _refresh_timeout
+    if _refresh_timeout is not None:
+        return  # many events in a row, refresh once
+
+    delay_ms = REFRESH_DELAY_MS
+    if _last_refresh_time is not None:
+        next_allowed = _last_refresh_time + MIN_REFRESH_INTERVAL
+        delay_ms = max(delay_ms, round((next_allowed - time.monotonic()) * 1000))
+    _refresh_timeout = get_main_window().after(delay_ms, _refresh_now)
+
+
+def setup() -> None:
+    get_tab_manager().add_filetab_callback(on_new_filetab)
+    get_tab_manager().bind("<<FileSystemChanged>>", refresh_all_projects, add=True)
+
+    # Put it next to "Open", not below "Quit"
+    file_menu = menubar.get_menu("File")
+    open_index = file_menu.index("Open")
+    assert open_index is not None
+    file_menu.insert_command(open_index + 1, label="Quick Open", command=quick_open)
+    menubar.set_enabled_based_on_tab(
+        "File/Quick Open", (lambda tab: isinstance(tab, tabs.FileTab) and tab.path is not None)
+    )
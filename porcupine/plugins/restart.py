@@ -1,42 +1,451 @@
 """Save and restore opened tabs when Porcupine is restarted."""
+from __future__ import annotations
+
+import contextlib
+import gzip
+import hashlib
+import json
 import logging
+import os
 import pickle
+import shutil
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from tkinter import ttk
+from typing import Any
+
+import psutil
 
-from porcupine import add_quit_callback, dirs, get_tab_manager, settings
+from porcupine import (
+    _profiling,
+    add_quit_callback,
+    dirs,
+    get_main_window,
+    get_tab_manager,
+    settings,
+    tabs,
+)
 from porcupine.settings import global_settings
 
 log = logging.getLogger(__name__)
 
+# Each tab is saved to a separate file as soon as it changes (with a delay,
+# to avoid writing on every key press). This way, if Porcupine gets killed,
+# only a couple seconds of unsaved changes are lost, and quitting is fast.
+#
+#   sessions/<name>/owner.json          which Porcupine process uses the session
+#   sessions/<name>/index.json          order of tabs, which tab is selected, version number
+#   sessions/<name>/tabs/<id>.pkl       state of a tab, without the unsaved content
+#   sessions/<name>/blobs/<hash>.gz     unsaved content of a tab, compressed
+#
+# Tab states are pickled, because get_state() can return anything. The
+# content is stored separately, because it's often big and doesn't change
+# when e.g. the cursor moves.
+#
+# Each running Porcupine has its own session directory, so that several
+# Porcupines don't delete each other's files. When Porcupine starts, it
+# continues the newest session that no running Porcupine is using.
+SESSION_DIR = dirs.user_cache_path / "sessions"
+SESSION_FORMAT_VERSION = 1
+SAVE_DELAY_MS = 2000
+
+# Older Porcupine versions saved all tabs to this file when quitting
 # https://fileinfo.com/extension/pkl
-STATE_FILE = dirs.user_cache_path / "restart_state.pkl"
+LEGACY_STATE_FILE = dirs.user_cache_path / "restart_state.pkl"
 
 # If loading a file fails, a dialog is created and it should be themed as user wants
 setup_after = ["sun_valley_theme"]
 
+# Reading many files is faster with a few threads, especially on network drives
+read_pool = ThreadPoolExecutor(max_workers=4)
 
-def quit_callback() -> bool:
-    file_contents = []
+# Hashing, compressing and writing happens in this thread, one thing at a time
+# in order, so that typing doesn't lag when a big file is saved to the session
+write_pool = ThreadPoolExecutor(max_workers=1)
+
+
+def _log_write_errors(future: Future[Any]) -> None:
+    if future.exception() is not None:
+        log.error("saving session failed", exc_info=future.exception())
+
+
+def _read_file(path: Path) -> tuple[os.stat_result, bytes]:
+    with path.open("rb") as file:
+        return (os.fstat(file.fileno()), file.read())
+
+
+class PlaceholderTab(tabs.Tab):
+    """Shown instead of a restored FileTab until the file is actually loaded.
+
+    Creating a FileTab is slow, because plugins do a lot of things with
+    each new FileTab. The real tab is created when the placeholder gets
+    selected, or when Porcupine has nothing else to do.
+    """
+
+    def __init__(self, manager: tabs.TabManager, state_dict: dict[str, Any]) -> None:
+        super().__init__(manager)
+        self.state_dict = state_dict
+        self.path: Path = state_dict["tab_state"].path
+        self.read_future: Future[tuple[os.stat_result, bytes]] = read_pool.submit(
+            _read_file, self.path
+        )
+        self.title_choices = [self.path.name, str(self.path)]
+        ttk.Label(self, text=f"Loading {self.path}...").pack(expand=True)
+        self.bind(
+            "<<TabSelected>>",
+            (lambda event: get_main_window().after_idle(load_placeholder, self)),
+            add=True,
+        )
+
+    def equivalent(self, other: tabs.Tab) -> bool:  # override
+        return isinstance(other, tabs.FileTab) and other.path == self.path
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    # If Porcupine gets killed while writing, the old file is still there
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+
+class SessionJournal:
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        # To avoid writing files that haven't changed
+        self._written_records: dict[str, bytes] = {}
+        self._written_index: bytes | None = None
+        # Which blob each record refers to, so that replaced blobs can be deleted
+        self._record_blobs: dict[str, str | None] = {}
+
+    def write_blob(self, text: str) -> str:
+        data = text.encode("utf-8")
+        name = hashlib.sha256(data).hexdigest()
+        path = self.directory / "blobs" / f"{name}.gz"
+        if not path.exists():
+            _atomic_write(path, gzip.compress(data, compresslevel=1))
+        return name
+
+    def read_blob(self, name: str) -> str:
+        return gzip.decompress((self.directory / "blobs" / f"{name}.gz").read_bytes()).decode(
+            "utf-8"
+        )
+
+    def write_record(self, record_id: str, record: dict[str, Any]) -> None:
+        data = pickle.dumps(record)
+        path = self.directory / "tabs" / f"{record_id}.pkl"
+        if self._written_records.get(record_id) != data or not path.exists():
+            _atomic_write(path, data)
+            self._written_records[record_id] = data
+
+        old_blob = self._record_blobs.get(record_id)
+        self._record_blobs[record_id] = record["content_blob"]
+        if old_blob is not None and old_blob not in self._record_blobs.values():
+            (self.directory / "blobs" / f"{old_blob}.gz").unlink(missing_ok=True)
+
+    # content_blob of the record is set to None or the blob of the content
+    def write_record_and_content(
+        self, record_id: str, record: dict[str, Any], content: str | None
+    ) -> None:
+        record["content_blob"] = None if content is None else self.write_blob(content)
+        self.write_record(record_id, record)
+
+    def read_record(self, record_id: str) -> dict[str, Any]:
+        data = (self.directory / "tabs" / f"{record_id}.pkl").read_bytes()
+        record: dict[str, Any] = pickle.loads(data)
+        self._written_records[record_id] = data
+        self._record_blobs[record_id] = record["content_blob"]
+        return record
+
+    def write_index(self, ids: list[str], selected: str | None) -> None:
+        data = json.dumps(
+            {"version": SESSION_FORMAT_VERSION, "tabs": ids, "selected": selected}
+        ).encode("utf-8")
+        if data != self._written_index or not (self.directory / "index.json").exists():
+            _atomic_write(self.directory / "index.json", data)
+            self._written_index = data
+
+    # Returns None if there's no usable session
+    def read_index(self) -> tuple[list[str], str | None] | None:
+        try:
+            index = json.loads((self.directory / "index.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, UnicodeError, ValueError):
+            log.exception("reading session index failed")
+            return None
+
+        if not isinstance(index, dict) or index.get("version") != SESSION_FORMAT_VERSION:
+            log.warning(f"unknown session format, ignoring: {index!r}")
+            return None
+        return (index["tabs"], index["selected"])
+
+    def delete_unused_files(self, ids: list[str]) -> None:
+        used_blobs = set()
+        for path in (self.directory / "tabs").glob("*.pkl"):
+            if path.stem in ids:
+                try:
+                    used_blobs.add(self.read_record(path.stem)["content_blob"])
+                except Exception:
+                    log.exception(f"reading {path} failed")
+            else:
+                path.unlink()
+                self._written_records.pop(path.stem, None)
+                self._record_blobs.pop(path.stem, None)
+
+        for path in (self.directory / "blobs").glob("*.gz"):
+            if path.name[: -len(".gz")] not in used_blobs:
+                path.unlink()
+
+
+def _is_in_use(session_dir: Path) -> bool:
+    try:
+        owner = json.loads((session_dir / "owner.json").read_text(encoding="utf-8"))
+        create_time = psutil.Process(owner["pid"]).create_time()
+    except psutil.AccessDenied:
+        # Probably a process of another user, with the same cache directory
+        return True
+    except (OSError, ValueError, KeyError, TypeError, psutil.Error):
+        # No owner, or the owner has quit
+        return False
+    # If the pid has been reused, the process was created later
+    return abs(create_time - owner["create_time"]) < 1
+
+
+# Returns the directory of this Porcupine, and directories of old sessions to delete
+def _claim_session_dir() -> tuple[Path, list[Path]]:
+    SESSION_DIR.mkdir(parents=True, exist_ok=True)
+    resumable = {}  # values are modification times of index.json
+    to_delete = []
+    for path in SESSION_DIR.iterdir():
+        if _is_in_use(path):
+            continue
+        try:
+            resumable[path] = (path / "index.json").stat().st_mtime
+        except OSError:
+            # Crashed before writing the index, or another Porcupine is starting
+            with contextlib.suppress(OSError):
+                if time.time() - path.stat().st_mtime > 24 * 60 * 60:
+                    to_delete.append(path)
+
+    session_dir = SESSION_DIR / uuid.uuid4().hex
+    for path in sorted(resumable, key=resumable.__getitem__, reverse=True):
+        try:
+            # Renaming is atomic, so two Porcupines starting at once can't both get it
+            path.rename(session_dir)
+        except OSError:
+            continue
+
+        # Older sessions would never be resumed. Newer sessions were probably
+        # released by a Porcupine that quit just now.
+        to_delete += [old for old, mtime in resumable.items() if mtime < resumable[path]]
+        break
+    else:
+        session_dir.mkdir()
+
+    owner = {"pid": os.getpid(), "create_time": psutil.Process().create_time()}
+    _atomic_write(session_dir / "owner.json", json.dumps(owner).encode("utf-8"))
+    return (session_dir, to_delete)
+
+
+def _release_session_dir() -> None:
+    (journal.directory / "owner.json").unlink(missing_ok=True)
+
+
+# Set in setup(). After restoring tabs, use the journal only in write_pool.
+journal: SessionJournal
+# Placeholder tabs get an id when restoring, others in on_new_tab()
+record_ids: dict[tabs.Tab, str] = {}
+# Records that have been written, or will be written soon in write_pool
+_saved_record_ids: set[str] = set()
+_pending_saves: dict[tabs.Tab, str] = {}  # values are after() ids
+_pending_index_write: str | None = None
+
+
+def save_tab(tab: tabs.Tab) -> None:
+    if tab in _pending_saves:
+        tab.after_cancel(_pending_saves.pop(tab))
+
+    if isinstance(tab, PlaceholderTab):
+        # Never loaded, so it hasn't changed
+        state = tab.state_dict["tab_state"]
+        tab_type = tab.state_dict["tab_type"]
+    else:
+        state = tab.get_state()
+        tab_type = type(tab)
+        if state is None:
+            return
 
+    content = None
+    if isinstance(tab, (tabs.FileTab, PlaceholderTab)) and state.content is not None:
+        content = state.content
+        state = state._replace(content=None)
+
+    record_id = record_ids[tab]
+    write_pool.submit(
+        journal.write_record_and_content,
+        record_id,
+        {"tab_type": tab_type, "tab_state": state},
+        content,
+    ).add_done_callback(_log_write_errors)
+    _saved_record_ids.add(record_id)
+
+
+def write_index() -> list[str]:
+    global _pending_index_write
+    if _pending_index_write is not None:
+        get_main_window().after_cancel(_pending_index_write)
+        _pending_index_write = None
+
+    manager = get_tab_manager()
+    # Tabs with no state, and tabs that haven't been saved yet, are left out
+    ids = [
+        record_ids[tab]
+        for tab in manager.tabs()
+        if tab in record_ids and record_ids[tab] in _saved_record_ids
+    ]
+    selected_tab = manager.select()
+    write_pool.submit(
+        journal.write_index, ids, record_ids.get(selected_tab) if selected_tab is not None else None
+    ).add_done_callback(_log_write_errors)
+    return ids
+
+
+def _save_tab_later(tab: tabs.Tab, junk: object = None) -> None:
+    if not global_settings.get("remember_tabs_on_restart", bool):
+        return
+    if tab in _pending_saves:
+        tab.after_cancel(_pending_saves[tab])
+    _pending_saves[tab] = tab.after(SAVE_DELAY_MS, save_tab, tab)
+    _write_index_later()
+
+
+def _write_index_later(junk: object = None) -> None:
+    global _pending_index_write
+    if not global_settings.get("remember_tabs_on_restart", bool):
+        return
+    if _pending_index_write is not None:
+        get_main_window().after_cancel(_pending_index_write)
+    _pending_index_write = get_main_window().after(SAVE_DELAY_MS, write_index)
+
+
+def _forget_tab(tab: tabs.Tab) -> None:
+    _pending_saves.pop(tab, None)  # after() callbacks of destroyed widgets don't run
+    record_ids.pop(tab, None)
+    _write_index_later()
+
+
+def _create_real_tab(placeholder: PlaceholderTab) -> tabs.Tab | None:
+    tab_type = placeholder.state_dict["tab_type"]
+    state = placeholder.state_dict["tab_state"]
+
+    try:
+        stat_result, content = placeholder.read_future.result()
+    except OSError:
+        # from_state() will try to read the file again and show an error
+        log.info(f"reading {placeholder.path} failed", exc_info=True)
+    else:
+        # If the file was modified after Porcupine saved it, encoding or line
+        # endings may have changed. Let reload() figure that out.
+        saved_stat = state.saved_state[0]
+        if saved_stat is not None and (saved_stat.st_mtime, saved_stat.st_size) == (
+            stat_result.st_mtime,
+            stat_result.st_size,
+        ):
+            encoding_option = state.settings_state.get("encoding")
+            encoding = "utf-8" if encoding_option is None else encoding_option.value
+            try:
+                text = content.decode(encoding)
+            except (UnicodeError, LookupError):
+                pass
+            else:
+                # Universal newlines, like when reading a file in text mode
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+                state = state._replace(content=text)
+
+    tab: tabs.Tab | None = tab_type.from_state(get_tab_manager(), state)
+    return tab
+
+
+def load_placeholder(placeholder: PlaceholderTab) -> None:
+    manager = get_tab_manager()
+    if not placeholder.winfo_exists() or placeholder not in manager.tabs():
+        # Already loaded or closed
+        return
+
+    tab = _create_real_tab(placeholder)
+    if tab is None:
+        manager.close_tab(placeholder)
+    else:
+        # on_new_tab() replaces the placeholder
+        manager.add_tab(tab, select=(manager.select() == placeholder))
+
+
+def on_new_tab(tab: tabs.Tab) -> None:
+    # Also runs when a file is opened while its placeholder is still there
+    if isinstance(tab, tabs.FileTab):
+        manager = get_tab_manager()
+        for placeholder in manager.tabs():
+            if isinstance(placeholder, PlaceholderTab) and placeholder.equivalent(tab):
+                record_ids[tab] = record_ids.pop(placeholder)
+                manager.insert(manager.index(placeholder), tab)
+                manager.close_tab(placeholder)
+
+    if tab not in record_ids:
+        record_ids[tab] = uuid.uuid4().hex
+    tab.bind(
+        "<Destroy>", (lambda event: _forget_tab(tab) if event.widget is tab else None), add=True
+    )
+
+    if isinstance(tab, tabs.FileTab):
+        tab.textwidget.bind("<<ContentChanged>>", partial(_save_tab_later, tab), add=True)
+        tab.bind("<<PathChanged>>", partial(_save_tab_later, tab), add=True)
+        tab.bind("<<AfterSave>>", partial(_save_tab_later, tab), add=True)
+    if not isinstance(tab, PlaceholderTab):
+        _save_tab_later(tab)
+
+
+def load_placeholders_when_idle() -> None:
+    placeholders = [tab for tab in get_tab_manager().tabs() if isinstance(tab, PlaceholderTab)]
+    if not placeholders:
+        return
+
+    ready = [placeholder for placeholder in placeholders if placeholder.read_future.done()]
+    if ready:
+        # One tab at a time, so that Porcupine stays responsive
+        load_placeholder(ready[0])
+        get_main_window().after_idle(load_placeholders_when_idle)
+    else:
+        get_main_window().after(50, load_placeholders_when_idle)
+
+
+def quit_callback() -> bool:
     if global_settings.get("remember_tabs_on_restart", bool):
-        selected_tab = get_tab_manager().select()
+        # Usually most tabs were already saved while editing, and this does nothing for them
         for tab in get_tab_manager().tabs():
-            state = tab.get_state()
-            if state is not None:
-                file_contents.append(
-                    {"tab_type": type(tab), "tab_state": state, "selected": (tab == selected_tab)}
-                )
+            save_tab(tab)
+        ids = write_index()
     else:
         # Ask user to save changes in open tabs. They will soon be gone.
         for tab in get_tab_manager().tabs():
             if not tab.can_be_closed():
                 return False
+        ids = []
+        write_pool.submit(journal.write_index, ids, None).add_done_callback(_log_write_errors)
 
-    with STATE_FILE.open("wb") as file:
-        pickle.dump(file_contents, file)
+    write_pool.submit(journal.delete_unused_files, ids).add_done_callback(_log_write_errors)
+    future = write_pool.submit(_release_session_dir)
+    future.add_done_callback(_log_write_errors)
+    future.exception()  # wait for everything in write_pool to finish
+    LEGACY_STATE_FILE.unlink(missing_ok=True)
     return True
 
 
 def setup() -> None:
+    global journal
     global_settings.add_option("remember_tabs_on_restart", default=True)
     settings.add_checkbutton(
         "remember_tabs_on_restart", text="Remember open tabs when Porcupine is closed and reopened"
@@ -44,19 +453,100 @@ def setup() -> None:
 
     # this must run even if loading tabs from states below fails
     add_quit_callback(quit_callback)
+    get_tab_manager().add_tab_callback(on_new_tab)
+    get_tab_manager().bind("<<NotebookTabChanged>>", _write_index_later, add=True)
+
+    with _profiling.measure("core", "restoring tabs"):
+        session_dir, old_session_dirs = _claim_session_dir()
+        journal = SessionJournal(session_dir)
+        restore_tabs()
+    for path in old_session_dirs:
+        write_pool.submit(shutil.rmtree, path, ignore_errors=True)
+    get_main_window().after_idle(load_placeholders_when_idle)
 
+
+def _can_use_placeholder(state_dict: dict[str, Any]) -> bool:
+    # Tabs with unsaved changes are loaded right away. Their content comes
+    # from the state file, and placeholders must not contain unsaved changes.
+    state = state_dict["tab_state"]
+    return (
+        not state_dict["selected"]
+        and isinstance(state_dict["tab_type"], type)
+        and issubclass(state_dict["tab_type"], tabs.FileTab)
+        and getattr(state, "path", None) is not None
+        and getattr(state, "content", "") is None
+    )
+
+
+def _read_legacy_state_file() -> list[dict[str, Any]]:
     try:
-        with STATE_FILE.open("rb") as file:
+        with LEGACY_STATE_FILE.open("rb") as file:
             file_contents = pickle.load(file)
     except FileNotFoundError:
-        file_contents = []
+        return []
 
+    state_dicts = []
     for state_dict in file_contents:
         if isinstance(state_dict, tuple):
             log.info(f"state file contains a tab saved by Porcupine 0.93.x or older: {state_dict}")
             tab_type, tab_state = state_dict
             state_dict = {"tab_type": tab_type, "tab_state": tab_state, "selected": True}
+        state_dict["record_id"] = uuid.uuid4().hex
+        state_dicts.append(state_dict)
+    return state_dicts
+
+
+def _read_session() -> list[dict[str, Any]] | None:
+    index = journal.read_index()
+    if index is None:
+        return None
+
+    ids, selected_id = index
+    state_dicts = []
+    for record_id in ids:
+        try:
+            record = journal.read_record(record_id)
+            if record["content_blob"] is not None:
+                # Unsaved changes, can't use a placeholder
+                content = journal.read_blob(record["content_blob"])
+                record["tab_state"] = record["tab_state"]._replace(content=content)
+        except Exception:
+            # Don't lose all tabs because of one broken file
+            log.exception(f"restoring tab {record_id} failed")
+            continue
+
+        _saved_record_ids.add(record_id)
+        state_dicts.append(
+            {
+                "tab_type": record["tab_type"],
+                "tab_state": record["tab_state"],
+                "selected": (record_id == selected_id),
+                "record_id": record_id,
+            }
+        )
+    return state_dicts
+
+
+def restore_tabs() -> None:
+    state_dicts = _read_session()
+    if state_dicts is None:
+        state_dicts = _read_legacy_state_file()
+
+    # Only one tab can be selected, and it's the last one that says so
+    selected = [state_dict for state_dict in state_dicts if state_dict["selected"]]
+    for state_dict in selected[:-1]:
+        state_dict["selected"] = False
 
-        tab = state_dict["tab_type"].from_state(get_tab_manager(), state_dict["tab_state"])
+    manager = get_tab_manager()
+    for state_dict in state_dicts:
+        tab: tabs.Tab | None
+        if _can_use_placeholder(state_dict):
+            tab = PlaceholderTab(manager, state_dict)
+        else:
+            tab = state_dict["tab_type"].from_state(manager, state_dict["tab_state"])
         if tab is not None:
-            get_tab_manager().add_tab(tab, select=state_dict["selected"])
+            # Set before add_tab(), so that on_new_tab() doesn't make up a new id
+            record_ids[tab] = state_dict.pop("record_id")
+            if manager.add_tab(tab, select=state_dict["selected"]) is not tab:
+                # Same file twice, the tab was destroyed
+                del record_ids[tab]
@@ -13,7 +13,7 @@ from typing import List
 from porcupine import get_main_window, get_tab_manager, menubar, tabs, utils
 from porcupine.plugins import python_venv
 
-from . import common, dialog, history, no_terminal, terminal
+from . import common, dialog, history, jobs, no_terminal, terminal
 
 # affects order of buttons in setting dialog, want pygments buttons together
 setup_before = ["filetypes"]
@@ -37,7 +37,7 @@ def run(ctx: common.Context, command: common.Command) -> None:
     if command.external_terminal:
         terminal.run_command(command_string, command.format_cwd())
     else:
-        no_terminal.run_command(command_string, command.format_cwd())
+        jobs.run_command(command_string, command.format_cwd())
 
 
 def ask_and_run_command(initial_key_id: int, junk_event: tkinter.Event[tkinter.Misc]) -> None:
@@ -96,3 +96,4 @@ def setup() -> None:
         get_main_window().bind(f"<<Run:Repeat{key_id}>>", partial(repeat_command, key_id), add=True)
 
     no_terminal.setup()
+    jobs.setup()
@@ -3,9 +3,13 @@ from __future__ import annotations
 import copy
 import dataclasses
 import json
+import logging
+import os
 import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 
 import dacite
 
@@ -13,6 +17,19 @@ from porcupine import dirs
 
 from . import common
 
+log = logging.getLogger(__name__)
+
+# Merge the journal into the main file when this many commands have been added
+COMPACT_AFTER = 20
+
+# Writing files happens in this thread, one thing at a time in order
+write_pool = ThreadPoolExecutor(max_workers=1)
+
+
+def _log_write_errors(future: Future[Any]) -> None:
+    if future.exception() is not None:
+        log.error("saving run history failed", exc_info=future.exception())
+
 
 @dataclasses.dataclass
 class _HistoryItem:
@@ -29,6 +46,13 @@ def _get_path() -> Path:
     return dirs.user_config_path / "run_history_v3.json"
 
 
+# Every Porcupine process appends the commands it runs to this file. They are
+# moved to the main file later, so that several processes don't overwrite
+# each other's history.
+def _get_journal_path() -> Path:
+    return dirs.user_config_path / "run_history_v3_journal.jsonl"
+
+
 def _load_json_file() -> list[_HistoryItem]:
     try:
         with _get_path().open("r", encoding="utf-8") as file:
@@ -37,54 +61,145 @@ def _load_json_file() -> list[_HistoryItem]:
         return []
 
 
-def add(ctx: common.Context, command: common.Command) -> None:
-    history_items = _load_json_file()
+def _load_journal(path: Path) -> list[_HistoryItem]:
+    try:
+        with path.open("r", encoding="utf-8") as file:
+            lines = file.readlines()
+    except FileNotFoundError:
+        return []
 
-    old_use_count = 0
+    result = []
+    for line in lines:
+        try:
+            result.append(dacite.from_dict(_HistoryItem, json.loads(line)))
+        except (ValueError, dacite.DaciteError):
+            # Porcupine was probably killed while it was writing the line
+            log.warning(f"ignoring invalid line in {path}: {line!r}")
+    return result
+
+
+# Items are ordered so that most recently used is first
+def _add_item(history_items: list[_HistoryItem], new_item: _HistoryItem) -> None:
     for item in history_items:
         if (
-            item.command.command_format == command.command_format
-            and item.key_id == ctx.key_id
-            and item.filetype_name == ctx.filetype_name
+            item.command.command_format == new_item.command.command_format
+            and item.key_id == new_item.key_id
+            and item.filetype_name == new_item.filetype_name
         ):
-            old_use_count = item.use_count
+            new_item = dataclasses.replace(new_item, use_count=item.use_count + new_item.use_count)
             history_items.remove(item)
             break
 
-    history_items.insert(
-        0,
-        _HistoryItem(
-            command=command,
-            use_count=old_use_count + 1,
-            key_id=ctx.key_id,
-            filetype_name=ctx.filetype_name,
-        ),
-    )
+    history_items.insert(0, new_item)
+
+    # Delete everything after first 50 commands if used only once
+    # Delete everything after first 100 commands if used once or twice
+    # etc
+    history_items[:] = [
+        item for index, item in enumerate(history_items) if item.use_count > index / 50
+    ]
+
 
-    with _get_path().open("w", encoding="utf-8") as file:
-        json.dump(
-            [
-                dataclasses.asdict(item)
-                for index, item in enumerate(history_items)
-                # Delete everything after first 50 commands if used only once
-                # Delete everything after first 100 commands if used once or twice
-                # etc
-                if item.use_count > index / 50
-            ],
-            file,
-            indent=4,
+def _append_to_journal(item: _HistoryItem) -> None:
+    # Appending a short line is atomic enough, even if another process appends at the same time
+    path = _get_journal_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as file:
+        file.write(json.dumps(dataclasses.asdict(item)) + "\n")
+
+
+def _compact() -> None:
+    lock_path = _get_journal_path().with_suffix(".lock")
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        # Another process is compacting, and will handle our journal lines too.
+        # If the lock file is old, Porcupine probably crashed while compacting.
+        try:
+            if time.time() - lock_path.stat().st_mtime > 60:
+                log.warning(f"deleting old lock file: {lock_path}")
+                lock_path.unlink()
+        except FileNotFoundError:
+            pass
+        return
+
+    try:
+        # Other processes will create a new journal file when they add commands
+        compacting_path = _get_journal_path().with_suffix(f".{os.getpid()}.tmp")
+        try:
+            os.replace(_get_journal_path(), compacting_path)
+        except FileNotFoundError:
+            return
+
+        history_items = _load_json_file()
+        for item in _load_journal(compacting_path):
+            _add_item(history_items, item)
+
+        temp_path = _get_path().with_suffix(".tmp")
+        with temp_path.open("w", encoding="utf-8") as file:
+            json.dump([dataclasses.asdict(item) for item in history_items], file, indent=4)
+            file.write("\n")
+        os.replace(temp_path, _get_path())
+        compacting_path.unlink()
+    finally:
+        lock_path.unlink()
+
+
+class _HistoryStore:
+    def __init__(self) -> None:
+        self._items = _load_json_file()
+        journal = _load_journal(_get_journal_path())
+        for item in journal:
+            _add_item(self._items, item)
+
+        self._added_since_compacting = len(journal)
+        self._index: dict[tuple[int, str | None], list[_HistoryItem]] = {}
+        self._update_index()
+
+    def _update_index(self) -> None:
+        self._index.clear()
+        for item in self._items:
+            self._index.setdefault((item.key_id, item.filetype_name), []).append(item)
+
+    def add(self, item: _HistoryItem) -> None:
+        _add_item(self._items, item)
+        self._update_index()
+
+        write_pool.submit(_append_to_journal, item).add_done_callback(_log_write_errors)
+        self._added_since_compacting += 1
+        if self._added_since_compacting >= COMPACT_AFTER:
+            write_pool.submit(_compact).add_done_callback(_log_write_errors)
+            self._added_since_compacting = 0
+
+    def get_matching(self, ctx: common.Context) -> list[_HistoryItem]:
+        return self._index.get((ctx.key_id, ctx.filetype_name), [])
+
+    def get_all(self) -> list[_HistoryItem]:
+        return self._items
+
+
+_store: _HistoryStore | None = None
+
+
+# The files are read only once. After that, everything is in memory.
+def _get_store() -> _HistoryStore:
+    global _store
+    if _store is None:
+        _store = _HistoryStore()
+    return _store
+
+
+def add(ctx: common.Context, command: common.Command) -> None:
+    _get_store().add(
+        _HistoryItem(
+            command=command, use_count=1, key_id=ctx.key_id, filetype_name=ctx.filetype_name
         )
-        file.write("\n")
+    )
 
 
 def _get_commands(ctx: common.Context, *, include_unmatching: bool = False) -> list[common.Command]:
-    unmatching_commands = []
-    commands = []
-    for item in _load_json_file():
-        if item.key_id == ctx.key_id and item.filetype_name == ctx.filetype_name:
-            commands.append(item.command)
-        else:
-            unmatching_commands.append(item.command)
+    matching_items = _get_store().get_matching(ctx)
+    commands = [item.command for item in matching_items]
 
     for example in ctx.example_commands:
         if sys.platform == "win32" and example.windows_command is not None:
@@ -105,7 +220,11 @@ def _get_commands(ctx: common.Context, *, include_unmatching: bool = False) -> l
             )
 
     if include_unmatching:
-        commands.extend(unmatching_commands)
+        commands.extend(
+            item.command
+            for item in _get_store().get_all()
+            if (item.key_id, item.filetype_name) != (ctx.key_id, ctx.filetype_name)
+        )
     return commands
 
 
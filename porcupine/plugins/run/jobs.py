@@ -0,0 +1,174 @@
+"""Run several commands at the same time, or one after another.
+
+Each command gets its own tab in the output area, except when using the
+default mode, which stops the previous command and runs in the first tab.
+"""
+from __future__ import annotations
+
+import logging
+from functools import partial
+from pathlib import Path
+
+from porcupine import get_main_window, settings, utils
+from porcupine.settings import global_settings
+
+from . import no_terminal
+
+log = logging.getLogger(__name__)
+
+STOP_PREVIOUS = "Stop previous command"
+PARALLEL = "Run at the same time"
+QUEUE = "Run after previous command"
+CHAIN = "Run if previous command succeeds"
+
+
+class Job:
+    def __init__(
+        self,
+        command: str,
+        cwd: Path,
+        runner: no_terminal.NoTerminalRunner,
+        wait_for: Job | None = None,
+        require_success: bool = False,
+    ) -> None:
+        self.command = command
+        self.cwd = cwd
+        self.runner = runner
+        self.wait_for = wait_for
+        self.require_success = require_success
+        self.status = "waiting"  # "running", "succeeded", "failed" or "cancelled"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in {"succeeded", "failed", "cancelled"}
+
+
+# Jobs that haven't finished yet, in the order they were added
+_jobs: list[Job] = []
+# The job that most recently used each runner
+_runner_jobs: dict[no_terminal.NoTerminalRunner, Job] = {}
+
+
+def _update_title(job: Job) -> None:
+    assert no_terminal.output_notebook is not None
+    if job.runner is not no_terminal.runner and job.runner.textwidget.winfo_exists():
+        if len(job.command) > 30:
+            title = job.command[:27] + "..."
+        else:
+            title = job.command
+        no_terminal.output_notebook.tab(job.runner.textwidget, text=f"{title} ({job.status})")
+
+
+def _on_finished(job: Job, exit_status: int | None) -> None:
+    job.status = "succeeded" if exit_status == 0 else "failed"
+    _update_title(job)
+    _start_jobs()
+
+
+def _start(job: Job) -> None:
+    job.status = "running"
+    _update_title(job)
+    log.info(f"Running {job.command} in {job.cwd}")
+    if not job.runner.run_command(job.cwd, job.command, partial(_on_finished, job)):
+        job.status = "cancelled"
+        _update_title(job)
+
+
+def _start_jobs() -> None:
+    running_count = sum(job.status == "running" for job in _jobs)
+
+    # Jobs are in the order they were added, so that a job waits for jobs added before it
+    for job in _jobs.copy():
+        if job.status != "waiting":
+            continue
+        if job.wait_for is not None and not job.wait_for.finished:
+            continue
+
+        if job.wait_for is not None and job.require_success and job.wait_for.status != "succeeded":
+            job.status = "cancelled"
+            job.runner.show_message(
+                "error", f"Not running, because this command failed:\n{job.wait_for.command}"
+            )
+            _update_title(job)
+        elif running_count < global_settings.get("max_parallel_jobs", int):
+            _start(job)
+            running_count += 1
+
+    _jobs[:] = [job for job in _jobs if not job.finished]
+
+
+def _close_runner(runner: no_terminal.NoTerminalRunner, junk: object = None) -> None:
+    job = _runner_jobs.pop(runner)
+    if not job.finished:
+        job.status = "cancelled"
+    # Destroying stops the process
+    runner.textwidget.destroy()
+    # Something might be waiting for the job
+    get_main_window().after_idle(_start_jobs)
+
+
+def _get_runner(command: str, cwd: Path) -> no_terminal.NoTerminalRunner:
+    # Running the same command again reuses its tab, if nothing is running there
+    for runner, job in _runner_jobs.items():
+        if (
+            runner is not no_terminal.runner
+            and job.finished
+            and (job.command, job.cwd) == (command, cwd)
+        ):
+            return runner
+
+    runner = no_terminal.add_runner("")
+    runner.hide_button.bind("<Button-1>", partial(_close_runner, runner), add=True)
+    utils.set_tooltip(runner.hide_button, "Close")
+    return runner
+
+
+def run_command(command: str, cwd: Path, mode: str | None = None) -> Job | None:
+    if mode is None:
+        mode = global_settings.get("run_jobs_mode", str)
+
+    if mode == STOP_PREVIOUS:
+        assert no_terminal.runner is not None
+        job = Job(command, cwd, no_terminal.runner)
+        job.status = "running"
+        if not no_terminal.run_command(command, cwd, partial(_on_finished, job)):
+            return None
+        _jobs.append(job)
+        _runner_jobs[job.runner] = job
+        return job
+
+    if mode == PARALLEL:
+        wait_for = None
+    elif mode in {QUEUE, CHAIN}:
+        wait_for = _jobs[-1] if _jobs else None
+        if wait_for is not None and wait_for.finished:
+            wait_for = None
+    else:
+        raise ValueError(f"unknown mode: {mode!r}")
+
+    job = Job(command, cwd, _get_runner(command, cwd), wait_for, require_success=(mode == CHAIN))
+    _jobs.append(job)
+    _runner_jobs[job.runner] = job
+    if wait_for is None:
+        job.runner.show_message("info", f"Waiting for other commands to finish: {command}")
+    else:
+        job.runner.show_message("info", f"Waiting for this command to finish:\n{wait_for.command}")
+    _update_title(job)
+
+    no_terminal.show_runner(job.runner)
+    _start_jobs()
+    return job
+
+
+def setup() -> None:
+    global_settings.add_option("run_jobs_mode", STOP_PREVIOUS)
+    global_settings.add_option("max_parallel_jobs", 4)
+    settings.add_combobox(
+        "run_jobs_mode",
+        "When a command is already running:",
+        values=[STOP_PREVIOUS, PARALLEL, QUEUE, CHAIN],
+        state="readonly",
+    )
+    settings.add_spinbox(
+        "max_parallel_jobs", "Maximum number of commands running at the same time:", from_=1, to=100
+    )
@@ -0,0 +1,137 @@
+"""Show the full output of a command, one page at a time.
+
+The output log of a command can be gigabytes, so it is never read all at
+once. Only the shown page is in memory and in the text widget.
+"""
+from __future__ import annotations
+
+import tkinter
+from pathlib import Path
+from tkinter import ttk
+
+from porcupine import get_main_window, textutils
+
+# How many bytes of the log to show at a time
+PAGE_SIZE = 1024 * 1024
+
+
+def _read(path: Path, start: int, end: int) -> bytes:
+    with path.open("rb") as file:
+        file.seek(start)
+        return file.read(end - start)
+
+
+# Pages start at the beginning of a line, unless a line is longer than a page
+def find_page_end(path: Path, start: int, file_size: int) -> int:
+    if start + PAGE_SIZE >= file_size:
+        return file_size
+    newline = _read(path, start, start + PAGE_SIZE).rfind(b"\n")
+    return start + (PAGE_SIZE if newline == -1 else newline + 1)
+
+
+def find_page_start(path: Path, end: int) -> int:
+    if end <= PAGE_SIZE:
+        return 0
+    data = _read(path, end - PAGE_SIZE, end)
+    newline = data.find(b"\n")
+    if newline == -1 or newline == len(data) - 1:
+        return end - PAGE_SIZE
+    return end - PAGE_SIZE + newline + 1
+
+
+class LogViewer:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._start = 0
+        self._end = 0
+
+        self.window = tkinter.Toplevel()
+        self.window.title(f"Full output: {path.name}")
+        self.window.transient(get_main_window())
+
+        button_frame = ttk.Frame(self.window, padding=5)
+        button_frame.pack(side="bottom", fill="x")
+        self._first_button = ttk.Button(
+            button_frame, text="First page", command=(lambda: self.show_page(0))
+        )
+        self._previous_button = ttk.Button(
+            button_frame, text="Previous page", command=self.show_previous_page
+        )
+        self._next_button = ttk.Button(
+            button_frame, text="Next page", command=(lambda: self.show_page(self._end))
+        )
+        self._last_button = ttk.Button(button_frame, text="Last page", command=self.show_last_page)
+        for button in [self._first_button, self._previous_button]:
+            button.pack(side="left")
+        for button in [self._last_button, self._next_button]:
+            button.pack(side="right")
+        self._status_label = ttk.Label(button_frame)
+        self._status_label.pack(side="left", expand=True)
+
+        text_frame = ttk.Frame(self.window)
+        text_frame.pack(fill="both", expand=True)
+        self.textwidget = textutils.create_passive_text_widget(
+            text_frame, is_focusable=True, font="TkFixedFont", wrap="none", width=100, height=30
+        )
+        yscrollbar = ttk.Scrollbar(text_frame, command=self.textwidget.yview)
+        xscrollbar = ttk.Scrollbar(text_frame, orient="horizontal", command=self.textwidget.xview)
+        self.textwidget.config(yscrollcommand=yscrollbar.set, xscrollcommand=xscrollbar.set)
+        yscrollbar.pack(side="right", fill="y")
+        xscrollbar.pack(side="bottom", fill="x")
+        self.textwidget.pack(fill="both", expand=True)
+
+        self.window.bind("<Escape>", (lambda event: self.window.destroy()), add=True)
+        self.textwidget.focus_set()
+
+        # The end of the output is usually the interesting part
+        self.show_last_page()
+
+    def _show_text(self, text: str) -> None:
+        self.textwidget.config(state="normal")
+        self.textwidget.delete("1.0", "end")
+        self.textwidget.insert("1.0", text)
+        self.textwidget.config(state="disabled")
+
+    def show_page(self, start: int) -> None:
+        try:
+            # The command may be still running and writing more output
+            file_size = self.path.stat().st_size
+            end = find_page_end(self.path, start, file_size)
+            text = _read(self.path, start, end).decode("utf-8", errors="replace")
+        except OSError as e:
+            self._show_text(f"Can't read {self.path}: {type(e).__name__}: {e}")
+            for button in [
+                self._first_button,
+                self._previous_button,
+                self._next_button,
+                self._last_button,
+            ]:
+                button.config(state="disabled")
+            self._status_label.config(text="")
+            return
+
+        self._start = start
+        self._end = end
+        self._show_text(text)
+        self._status_label.config(text=f"Bytes {start}-{end} of {file_size}")
+
+        at_start = start == 0
+        at_end = end == file_size
+        self._first_button.config(state=("disabled" if at_start else "normal"))
+        self._previous_button.config(state=("disabled" if at_start else "normal"))
+        self._next_button.config(state=("disabled" if at_end else "normal"))
+        self._last_button.config(state=("disabled" if at_end else "normal"))
+
+    def show_previous_page(self) -> None:
+        try:
+            start = find_page_start(self.path, self._start)
+        except OSError:
+            start = 0  # show_page() shows the error
+        self.show_page(start)
+
+    def show_last_page(self) -> None:
+        try:
+            start = find_page_start(self.path, self.path.stat().st_size)
+        except OSError:
+            start = 0
+        self.show_page(start)
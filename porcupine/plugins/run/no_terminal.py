@@ -1,24 +1,29 @@
 """Run commands within the Porcupine window."""
 from __future__ import annotations
 
+import codecs
+import collections
+import itertools
 import locale
 import logging
 import os
-import queue
 import re
 import signal
 import subprocess
 import sys
 import threading
+import time
 import tkinter
+from datetime import datetime
 from functools import partial
 from pathlib import Path
 from tkinter import ttk
-from typing import Any, Callable
+from typing import IO, Any, Callable
 
 import psutil
 
 from porcupine import (
+    dirs,
     get_tab_manager,
     get_vertical_panedwindow,
     images,
@@ -27,7 +32,7 @@ from porcupine import (
     textutils,
     utils,
 )
-from porcupine.plugins.run import common
+from porcupine.plugins.run import common, log_viewer
 from porcupine.settings import global_settings
 from porcupine.textutils import add_change_blocker, track_changes
 from porcupine.utils import copy_type
@@ -61,20 +66,137 @@ def open_file_with_line_number(path: Path, lineno: int) -> None:
 MAX_SCROLLBACK = 5000
 OUTPUT_TAGS = {"info": "Token.Keyword", "output": "Token.Text", "error": "Token.Name.Exception"}
 
+# Output is inserted to the text widget in pieces of at most this many characters
+CHUNK_SIZE = 64 * 1024
+# If the process prints faster than we can show the output, its thread waits
+# when this many characters are waiting to be inserted
+MAX_PENDING_OUTPUT = 4 * 1024 * 1024
+# How long to spend at a time inserting output, so that the GUI doesn't freeze
+INSERT_TIME_BUDGET = 0.03  # seconds
+# Long lines make the text widget slow, so the end of a long line is shown
+# only in the full output (see "Run/Open full output" in the menubar)
+MAX_LINE_LENGTH = 5000
+
+# The full output of each command is saved here, also the lines not shown
+OUTPUT_LOG_DIR = dirs.user_log_path / "run_output"
+KEEP_OUTPUT_LOGS = 10
+_log_counter = itertools.count()
+
+
+def _create_output_log_path() -> Path:
+    OUTPUT_LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    # Delete logs of old commands, newest first. A command shown in a runner
+    # may be still running, and "Open full output" needs its log.
+    in_use = {runner.executor.output_log_path for runner in runners if runner.executor is not None}
+    logs = []
+    for path in OUTPUT_LOG_DIR.glob("*.txt"):
+        try:
+            logs.append((path.stat().st_mtime, path))
+        except OSError:
+            pass  # another Porcupine deleted it
+    logs.sort(reverse=True)
+
+    for mtime, path in logs[KEEP_OUTPUT_LOGS - 1 :]:
+        if path not in in_use:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                # e.g. Windows, when another Porcupine is still writing to the file
+                log.info(f"can't delete {path}", exc_info=True)
+
+    timestamp = datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
+    return OUTPUT_LOG_DIR / f"{timestamp}_{os.getpid()}_{next(_log_counter):06d}.txt"
+
+
+def shorten_long_lines(text: str, line_length: int) -> tuple[str, int]:
+    """Cut lines to MAX_LINE_LENGTH characters.
+
+    The line_length is how many characters the last line of previous
+    output had. Returns the shortened text and line_length for the next call.
+    """
+    lines = text.split("\n")
+    for index, line in enumerate(lines):
+        if index != 0:
+            line_length = 0
+
+        room = MAX_LINE_LENGTH - line_length
+        line_length += len(line)
+        if len(line) > room:
+            if room >= 0:
+                lines[index] = line[:room] + " [...]"
+            else:
+                # Already cut in previous output
+                lines[index] = ""
+
+    return ("\n".join(lines), line_length)
+
+
+class _OutputBuffer:
+    """Output from the thread running the process goes through this to tkinter.
+
+    Consecutive pieces of output are joined together, because inserting
+    one big string to the text widget is much faster than inserting many
+    small strings.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        # Each chunk is [message_type, list of strings, total length]
+        self._chunks: collections.deque[list[Any]] = collections.deque()
+        self._size = 0
+
+    def put(self, message_type: str, text: str) -> None:
+        with self._condition:
+            self._condition.wait_for(lambda: self._size < MAX_PENDING_OUTPUT)
+            if (
+                message_type != "end"
+                and self._chunks
+                and self._chunks[-1][0] == message_type
+                and self._chunks[-1][2] < CHUNK_SIZE
+            ):
+                self._chunks[-1][1].append(text)
+                self._chunks[-1][2] += len(text)
+            else:
+                self._chunks.append([message_type, [text], len(text)])
+            self._size += len(text)
+            self._condition.notify_all()
+
+    def get(self, *, block: bool) -> tuple[str, str] | None:
+        with self._condition:
+            if block:
+                self._condition.wait_for(lambda: bool(self._chunks))
+            if not self._chunks:
+                return None
+            message_type, texts, size = self._chunks.popleft()
+            self._size -= size
+            self._condition.notify_all()
+            return (message_type, "".join(texts))
+
 
 class Executor:
-    def __init__(self, cwd: Path, textwidget: tkinter.Text, link_manager: textutils.LinkManager):
+    def __init__(
+        self,
+        cwd: Path,
+        textwidget: tkinter.Text,
+        link_manager: textutils.LinkManager,
+        finished_callback: Callable[[int | None], object] | None = None,
+    ):
         self.cwd = cwd
         self._textwidget = textwidget
         self._link_manager = link_manager
+        # Runs with the exit status, or None if the process didn't start
+        self._finished_callback = finished_callback
+        self._finished = False
+        self.exit_status: int | None = None
 
         self._shell_process: subprocess.Popen[bytes] | None = None
-        self._input_queue: queue.Queue[bytes] = queue.Queue(maxsize=1)
-        self._queue: queue.Queue[tuple[str, str]] = queue.Queue(maxsize=1)
+        self._queue = _OutputBuffer()
         self._timeout_id: str | None = None
         self.started = False
         self.paused = False
         self._thread: threading.Thread | None = None
+        self.output_log_path = _create_output_log_path()
 
     def run(self, command: str) -> None:
         env = common.prepare_env()
@@ -100,7 +222,17 @@ class Executor:
         return self._shell_process is not None and self._shell_process.poll() is None
 
     def _thread_target(self, command: str, env: dict[str, str]) -> None:
-        self._queue.put(("info", command + "\n"))
+        with self.output_log_path.open("w", encoding="utf-8") as log_file:
+            self._run_process(command, env, log_file)
+        self._queue.put("end", "")
+
+    def _run_process(self, command: str, env: dict[str, str], log_file: IO[str]) -> None:
+        def put(message_type: str, text: str) -> None:
+            log_file.write(text)
+            log_file.flush()
+            self._queue.put(message_type, text)
+
+        put("info", command + "\n")
 
         try:
             self._shell_process = subprocess.Popen(
@@ -114,54 +246,88 @@ class Executor:
                 **utils.subprocess_kwargs,
             )
         except OSError as e:
-            self._queue.put(("error", f"{type(e).__name__}: {e}\n"))
+            put("error", f"{type(e).__name__}: {e}\n")
             log.debug("here's full traceback", exc_info=True)
             return
 
         assert self._shell_process.stdout is not None
+        # Incremental decoder handles characters split between two reads
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding())(errors="replace")
+        line_length = 0
         while True:
-            bytez = self._shell_process.stdout.read1()  # type: ignore
+            bytez = self._shell_process.stdout.read1(CHUNK_SIZE)  # type: ignore
+            text = decoder.decode(bytez, final=(not bytez)).replace("\r\n", "\n")
+            if text:
+                log_file.write(text)
+                log_file.flush()
+                shown_text, line_length = shorten_long_lines(text, line_length)
+                self._queue.put("output", utils.tkinter_safe_string(shown_text))
             if not bytez:
                 break
-            text = bytez.decode(locale.getpreferredencoding(), errors="replace")
-            self._queue.put(("output", utils.tkinter_safe_string(text).replace("\r\n", "\n")))
 
         status = self._shell_process.wait()
+        self.exit_status = status
         if status == 0:
-            self._queue.put(("info", "The process completed successfully."))
+            put("info", "The process completed successfully.")
         else:
-            self._queue.put(("error", f"The process failed with status {status}."))
-        self._queue.put(("end", ""))
+            put("error", f"The process failed with status {status}.")
 
     def _handle_queued_item(self, message_type: str, text: str) -> None:
         if message_type == "end":
             assert not text
             get_tab_manager().event_generate("<<FileSystemChanged>>")
+            self._finish()
         else:
-            scrolled_to_end = self._textwidget.yview()[1] == 1.0
-
             self._textwidget.insert("end", text, [OUTPUT_TAGS[message_type], "uneditable"])
-            # Add links to full lines
+            # Add links to lines that became complete. The last line usually
+            # isn't complete yet, it will be linked when its newline comes.
             linked_line_count = text.count("\n")
-            self._link_manager.add_links(
-                start=f"end - 1 char linestart - {linked_line_count} lines",
-                end="end - 1 char linestart",
-            )
-            if scrolled_to_end:
-                self._textwidget.yview_moveto(1)
+            if linked_line_count > 0:
+                self._link_manager.add_links(
+                    start=f"end - 1 char linestart - {linked_line_count} lines",
+                    end="end - 1 char linestart",
+                )
 
-        self._textwidget.delete("1.0", f"end - {MAX_SCROLLBACK} lines")
+    def _finish(self) -> None:
+        if not self._finished:
+            self._finished = True
+            if self._finished_callback is not None:
+                self._finished_callback(self.exit_status)
+
+    def _delete_old_output(self, *, force: bool = False) -> None:
+        # Deleting is slow-ish, so let the output grow a bit before doing it
+        line_count = int(self._textwidget.index("end").split(".")[0])
+        if line_count > MAX_SCROLLBACK + MAX_SCROLLBACK // 10 or (
+            force and line_count > MAX_SCROLLBACK
+        ):
+            self._textwidget.delete("1.0", f"end - {MAX_SCROLLBACK} lines")
+            self._textwidget.insert(
+                "1.0",
+                "(Older output is not shown here. Use Run → Open full output to see it.)\n",
+                [OUTPUT_TAGS["info"], "uneditable"],
+            )
 
     def _poll_queue_and_put_to_textwidget(self) -> None:
-        # too many iterations here freezes the GUI when an infinite loop with print is running
-        for iteration in range(10):
-            try:
-                message_type, text = self._queue.get(block=False)
-            except queue.Empty:
+        scrolled_to_end = self._textwidget.yview()[1] == 1.0
+        start = time.perf_counter()
+        got_anything = False
+
+        # Not everything at once, that would freeze the GUI when an infinite loop prints
+        while time.perf_counter() - start < INSERT_TIME_BUDGET:
+            item = self._queue.get(block=False)
+            if item is None:
                 break
-            self._handle_queued_item(message_type, text)
+            self._handle_queued_item(*item)
+            got_anything = True
 
-        self._timeout_id = self._textwidget.after(50, self._poll_queue_and_put_to_textwidget)
+        if got_anything:
+            self._delete_old_output()
+            if scrolled_to_end:
+                self._textwidget.yview_moveto(1)
+            # Come back soon, there's probably more output
+            self._timeout_id = self._textwidget.after(1, self._poll_queue_and_put_to_textwidget)
+        else:
+            self._timeout_id = self._textwidget.after(50, self._poll_queue_and_put_to_textwidget)
 
     def send_signal(self, signal: signal.Signals) -> None:
         if self._shell_process is None:
@@ -185,6 +351,10 @@ class Executor:
             self._timeout_id = None
 
         if self._shell_process is None:
+            # The process didn't start, or hasn't started yet. Either way, the
+            # queue is no longer polled, so the finished callback must run here.
+            if not quitting:
+                self._finish()
             return
 
         try:
@@ -223,7 +393,9 @@ class Executor:
 
                 # Consume queue until the thread stops
                 while True:
-                    message_type, text = self._queue.get(block=True)
+                    item = self._queue.get(block=True)
+                    assert item is not None
+                    message_type, text = item
                     # For killing messages, a separate "Killed." will be added below
                     if (message_type, text) != (
                         "error",
@@ -235,6 +407,7 @@ class Executor:
                 self._thread.join()
 
                 self._handle_queued_item("error", "Killed.")
+                self._delete_old_output(force=True)
 
         if not quitting:
             get_tab_manager().event_generate("<<FileSystemChanged>>")
@@ -286,10 +459,10 @@ class PyEditTrackingText(tkinter.Text):
 
 
 class NoTerminalRunner:
-    def __init__(self, master: tkinter.Misc) -> None:
+    def __init__(self, master: tkinter.Misc, name: str = "run_output") -> None:
         self.textwidget = PyEditTrackingText(
             master,
-            name="run_output",  # TODO: rename
+            name=name,  # TODO: rename
             font="TkFixedFont",
             blockcursor=True,
             insertunfocussed="hollow",
@@ -345,6 +518,9 @@ class NoTerminalRunner:
         self.hide_button.pack(side="left", padx=1)
         utils.set_tooltip(self.hide_button, "Hide output")
 
+        self.stop_button.bind("<Button-1>", self.stop_executor, add=True)
+        self.pause_button.bind("<Button-1>", self.pause_resume_executor, add=True)
+
     def _editing_should_be_blocked(self) -> bool:
         return (not self.textwidget.in_a_python_method) and (
             # Block editing when nothing is running
@@ -400,11 +576,14 @@ class NoTerminalRunner:
                 utils.set_tooltip(self.pause_button, "Resume execution")
 
     def focus(self, junk: object = None) -> None:
-        is_hidden = get_vertical_panedwindow().panecget(self.textwidget, "hide")
-        if is_hidden:
-            get_vertical_panedwindow().paneconfigure(self.textwidget, hide=False)
+        show_runner(self)
         self.textwidget.focus()
 
+    def open_full_output(self, junk: object = None) -> log_viewer.LogViewer | None:
+        if self.executor is None:
+            return None
+        return log_viewer.LogViewer(self.executor.output_log_path)
+
     def _get_link_opener(self, match: re.Match[str]) -> Callable[[], None] | None:
         assert self.executor is not None
 
@@ -420,11 +599,17 @@ class NoTerminalRunner:
 
         return partial(open_file_with_line_number, path, int(lineno))
 
-    def run_command(self, cwd: Path, command: str) -> None:
+    def run_command(
+        self,
+        cwd: Path,
+        command: str,
+        finished_callback: Callable[[int | None], object] | None = None,
+    ) -> bool:
+        """Returns False if the command didn't run, because another command is starting."""
         if self.executor is not None:
             # This prevents a bug where smashing F5 runs in parallel
             if not self.executor.started:
-                return
+                return False
 
             self.executor.stop()
 
@@ -432,11 +617,43 @@ class NoTerminalRunner:
         self._link_manager.delete_all_links()  # prevent memory leak
         self.pause_button.configure(image=images.get("pause"))
 
-        self.executor = Executor(cwd, self.textwidget, self._link_manager)
+        self.executor = Executor(cwd, self.textwidget, self._link_manager, finished_callback)
         self.executor.run(command)
+        return True
+
+    def show_message(self, message_type: str, text: str) -> None:
+        self.textwidget.delete("1.0", "end")
+        self.textwidget.insert("end", text, [OUTPUT_TAGS[message_type], "uneditable"])
 
 
+# The output of each command goes to a separate tab in this notebook, see jobs.py
+output_notebook: ttk.Notebook | None = None
+# The runner in the first tab of output_notebook, can't be closed
 runner: NoTerminalRunner | None = None
+runners: list[NoTerminalRunner] = []
+_runner_counter = itertools.count(2)
+
+
+def add_runner(title: str) -> NoTerminalRunner:
+    assert output_notebook is not None
+    name = "run_output" if runner is None else f"run_output_{next(_runner_counter)}"
+    new_runner = NoTerminalRunner(output_notebook, name=name)
+    output_notebook.add(new_runner.textwidget, text=title)
+    runners.append(new_runner)
+    new_runner.textwidget.bind("<Destroy>", (lambda e: runners.remove(new_runner)), add=True)
+    return new_runner
+
+
+def show_runner(runner_to_show: NoTerminalRunner) -> None:
+    assert output_notebook is not None
+    get_vertical_panedwindow().paneconfigure(output_notebook, hide=False)
+    output_notebook.select(runner_to_show.textwidget)
+
+
+def get_selected_runner() -> NoTerminalRunner:
+    assert output_notebook is not None
+    [result] = [r for r in runners if str(r.textwidget) == output_notebook.select()]
+    return result
 
 
 def setup() -> None:
@@ -445,36 +662,44 @@ def setup() -> None:
         "run_output_pygments_style", "Pygments style for output of commands:"
     )
 
-    global runner
-    assert runner is None
-    runner = NoTerminalRunner(get_vertical_panedwindow())
+    global output_notebook, runner
+    assert output_notebook is None and runner is None
+    output_notebook = ttk.Notebook(get_vertical_panedwindow())
+    runner = add_runner("Output")
     get_vertical_panedwindow().add(
-        runner.textwidget, after=get_tab_manager(), stretch="never", hide=True
+        output_notebook, after=get_tab_manager(), stretch="never", hide=True
     )
     settings.remember_pane_size(
-        get_vertical_panedwindow(), runner.textwidget, "run_command_output_height", 200
+        get_vertical_panedwindow(), output_notebook, "run_command_output_height", 200
     )
 
     def toggle_visible(junk_event: object = ...) -> None:
-        assert runner is not None
-        is_hidden = get_vertical_panedwindow().panecget(runner.textwidget, "hide")
-        get_vertical_panedwindow().paneconfigure(runner.textwidget, hide=not is_hidden)
+        assert output_notebook is not None
+        is_hidden = get_vertical_panedwindow().panecget(output_notebook, "hide")
+        get_vertical_panedwindow().paneconfigure(output_notebook, hide=not is_hidden)
 
     runner.hide_button.bind("<Button-1>", toggle_visible, add=True)
-    runner.stop_button.bind("<Button-1>", runner.stop_executor, add=True)
-    runner.pause_button.bind("<Button-1>", runner.pause_resume_executor, add=True)
     menubar.get_menu("Run").add_command(label="Show/hide output", command=toggle_visible)
-    menubar.get_menu("View/Focus").add_command(label="Command output", command=runner.focus)
+    menubar.get_menu("Run").add_command(
+        label="Open full output", command=(lambda: get_selected_runner().open_full_output())
+    )
+    menubar.get_menu("View/Focus").add_command(
+        label="Command output", command=(lambda: get_selected_runner().focus())
+    )
     if sys.platform != "win32":
         menubar.get_menu("Run").add_command(
-            label="Pause/resume process", command=runner.pause_resume_executor
+            label="Pause/resume process",
+            command=(lambda: get_selected_runner().pause_resume_executor()),
         )
-    menubar.get_menu("Run").add_command(label="Kill process", command=runner.stop_executor)
+    menubar.get_menu("Run").add_command(
+        label="Kill process", command=(lambda: get_selected_runner().stop_executor())
+    )
 
 
-# succeeded_callback() will be ran from tkinter if the command returns 0
-def run_command(command: str, cwd: Path) -> None:
+def run_command(
+    command: str, cwd: Path, finished_callback: Callable[[int | None], object] | None = None
+) -> bool:
     log.info(f"Running {command} in {cwd}")
     assert runner is not None
-    get_vertical_panedwindow().paneconfigure(runner.textwidget, hide=False)
-    runner.run_command(cwd, command)
+    show_runner(runner)
+    return runner.run_command(cwd, command, finished_callback)
@@ -14,18 +14,24 @@ display something like "Ctrl+Enter or Ctrl+click to open" when hovered.
 """
 from __future__ import annotations
 
+import bisect
 import dataclasses
+import itertools
 import logging
 import tkinter
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 
-from porcupine import get_tab_manager, tabs, utils
+from porcupine import get_tab_manager, tabs, textutils, utils
 from porcupine.plugins import hover
 
 log = logging.getLogger(__name__)
 
+# Underlines are shown only near the visible part of the file. When
+# scrolling, this many lines above and below are already underlined.
+VIEW_MARGIN = 100
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(frozen=True)
 class Underline:
     start: str
     end: str
@@ -33,64 +39,248 @@ class Underline:
     color: Optional[str] = None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Underlines(utils.EventDataclass):
     # <<SetUnderlines>> clears previous underlinings with the same id
     id: str
     underline_list: List[Underline]
 
 
+# Line and column, same as in Tk text indexes
+_Position = Tuple[int, int]
+
+
+def _position_to_index(position: _Position) -> str:
+    line, column = position
+    return f"{line}.{column}"
+
+
+class _Entry:
+    def __init__(self, id: str, start: _Position, end: _Position, underline: Underline) -> None:
+        self.id = id
+        self.start = start
+        self.end = end
+        self.underline = underline
+        # Bigger number = added later = shown on top of other underlines
+        self.order = 0
+
+    @property
+    def tag(self) -> str:
+        return f"underline:{self.id}:{self.underline.color or 'default'}"
+
+
+class _IntervalIndex:
+    """Finds underlines that overlap a location or a range of text.
+
+    The entries are sorted by start. For each entry, we also store the
+    biggest end of that entry and all entries before it. When looking for
+    entries that overlap some location, we can stop going backwards as soon
+    as that biggest end is before the location.
+    """
+
+    def __init__(self, entries: list[_Entry]) -> None:
+        self._entries = sorted(entries, key=(lambda entry: entry.start))
+        self._starts = [entry.start for entry in self._entries]
+        self._max_ends: list[_Position] = []
+        for entry in self._entries:
+            self._max_ends.append(
+                max(self._max_ends[-1], entry.end) if self._max_ends else entry.end
+            )
+
+    # Entries with start < range_end and end > range_start
+    def overlapping(self, range_start: _Position, range_end: _Position) -> Iterator[_Entry]:
+        index = bisect.bisect_left(self._starts, range_end) - 1
+        while index >= 0 and self._max_ends[index] > range_start:
+            if self._entries[index].end > range_start:
+                yield self._entries[index]
+            index -= 1
+
+    def at(self, position: _Position) -> Iterator[_Entry]:
+        return self.overlapping(position, (position[0], position[1] + 1))
+
+
 class _Underliner:
     def __init__(self, textwidget: tkinter.Text) -> None:
         self.textwidget = textwidget
-        self._tag2underline: dict[str, Underline] = {}
-
-    def set_underlines(self, event: utils.EventWithData) -> None:
-        underlines = event.data_class(Underlines)
-        log.debug(f"Setting underlines: {underlines}")
-        self.textwidget.tag_remove(f"underline:{underlines.id}", "1.0", "end")
-
-        for tag in list(self._tag2underline.keys()):
-            literally_underline, tag_id, number = tag.split(":")
-            if tag_id == underlines.id:
-                self.textwidget.tag_delete(tag)
-                del self._tag2underline[tag]
-
-        for index, underline in enumerate(underlines.underline_list):
-            tag = f"underline:{underlines.id}:{index}"
-            less_specific_tag = f"underline:{underlines.id}"
-
-            self._tag2underline[tag] = underline
-            if underline.color is None:
-                self.textwidget.tag_config(tag, underline=True)
+        self._entries: dict[str, list[_Entry]] = {}  # keys are underline ids
+        self._index: _IntervalIndex | None = None
+        self._order_counter = itertools.count()
+
+        # Entries currently tagged in the text widget
+        self._tagged: set[_Entry] = set()
+
+    def _get_index(self) -> _IntervalIndex:
+        if self._index is None:
+            self._index = _IntervalIndex(
+                [entry for entries in self._entries.values() for entry in entries]
+            )
+        return self._index
+
+    def _parse_index(self, index: str) -> _Position:
+        line, column = map(int, self.textwidget.index(index).split("."))
+        return (line, column)
+
+    def get_entries(self, underline_id: str) -> list[_Entry]:
+        return sorted(self._entries.get(underline_id, []), key=(lambda entry: entry.start))
+
+    def on_set_underlines_event(self, event: utils.EventWithData) -> None:
+        self.set_underlines(event.data_class(Underlines))
+
+    def set_underlines(self, underlines: Underlines) -> None:
+        log.debug(f"Setting {len(underlines.underline_list)} underlines with id {underlines.id!r}")
+
+        # Keep the entries that didn't change, so that they don't need to be tagged again
+        old_entries: dict[tuple[_Position, _Position, str, str | None], list[_Entry]] = {}
+        for entry in self._entries.get(underlines.id, []):
+            key = (entry.start, entry.end, entry.underline.tooltip_text, entry.underline.color)
+            old_entries.setdefault(key, []).append(entry)
+
+        new_entries = []
+        for underline in underlines.underline_list:
+            start = self._parse_index(underline.start)
+            end = self._parse_index(underline.end)
+            reusable = old_entries.get((start, end, underline.tooltip_text, underline.color))
+            if reusable:
+                entry = reusable.pop()
             else:
-                self.textwidget.tag_config(tag, underline=True, underlinefg=underline.color)
+                entry = _Entry(underlines.id, start, end, underline)
+            entry.order = next(self._order_counter)
+            new_entries.append(entry)
+
+        for unused_entries in old_entries.values():
+            for entry in unused_entries:
+                if entry in self._tagged:
+                    self._untag(entry)
+        self._entries[underlines.id] = new_entries
+        self._index = None
 
-            self.textwidget.tag_add(tag, underline.start, underline.end)
-            self.textwidget.tag_add(less_specific_tag, underline.start, underline.end)
+        # Later underlines go on top of earlier underlines, e.g. red on top of orange
+        existing_tags = set(self.textwidget.tag_names())
+        for entry in new_entries:
+            if entry.tag not in existing_tags:
+                existing_tags.add(entry.tag)
+                if entry.underline.color is None:
+                    self.textwidget.tag_config(entry.tag, underline=True)
+                else:
+                    self.textwidget.tag_config(
+                        entry.tag, underline=True, underlinefg=entry.underline.color
+                    )
+        for tag in dict.fromkeys(entry.tag for entry in new_entries):
+            self.textwidget.tag_raise(tag)
 
+        self.update_tags()
         # FIXME: update what hover plugin is showing (broke in #585)
 
+    def _untag(self, entry: _Entry) -> None:
+        self._tagged.discard(entry)
+        self.textwidget.tag_remove(
+            entry.tag, _position_to_index(entry.start), _position_to_index(entry.end)
+        )
+
+        # Other underlines with the same tag may have overlapped the removed range
+        for other in self._get_index().overlapping(entry.start, entry.end):
+            if other in self._tagged and other.tag == entry.tag:
+                self._tag(other)
+
+    def _tag(self, entry: _Entry) -> None:
+        self._tagged.add(entry)
+        self.textwidget.tag_add(
+            entry.tag, _position_to_index(entry.start), _position_to_index(entry.end)
+        )
+
+    # Tag underlines near the visible part of the text, and untag others
+    def update_tags(self, junk: object = None) -> None:
+        first_line = int(self.textwidget.index("@0,0").split(".")[0])
+        last_line = int(self.textwidget.index(f"@0,{self.textwidget.winfo_height()}").split(".")[0])
+        region = ((max(first_line - VIEW_MARGIN, 1), 0), (last_line + VIEW_MARGIN + 1, 0))
+
+        wanted = set(self._get_index().overlapping(*region))
+        for entry in self._tagged - wanted:
+            self._untag(entry)
+        for entry in wanted - self._tagged:
+            self._tag(entry)
+
+    def on_change(self, event: utils.EventWithData) -> None:
+        if not self._entries:
+            return
+
+        # Tk moves the tags when text changes, and we move the entries in the same way
+        for change in event.data_class(textutils.Changes).change_list:
+            for underline_id, entries in self._entries.items():
+                for entry in entries:
+                    entry.start = textutils.move_position(entry.start, change)
+                    entry.end = textutils.move_position(entry.end, change, is_end=True)
+
+                # Tk deletes a tag when all text with that tag is deleted
+                deleted = [entry for entry in entries if entry.start >= entry.end]
+                if deleted:
+                    self._tagged.difference_update(deleted)
+                    self._entries[underline_id] = [
+                        entry for entry in entries if entry.start < entry.end
+                    ]
+
+        self._index = None
+        self.update_tags()
+
     def handle_hover_request(self, event: utils.EventWithData) -> str | None:
-        # Reversing to prefer topmost tags (i.e. tags added last)
-        for tag in reversed(self.textwidget.tag_names(event.data_string)):
-            if tag in self._tag2underline:
-                self.textwidget.event_generate(
-                    "<<HoverResponse>>",
-                    data=hover.Response(
-                        location=event.data_string, text=self._tag2underline[tag].tooltip_text
-                    ),
-                )
-                return "break"  # Do not pass hover event to langserver
-        return None
+        entries = list(self._get_index().at(self._parse_index(event.data_string)))
+        if not entries:
+            return None
+
+        # Prefer topmost underlines (i.e. underlines added last)
+        topmost = max(entries, key=(lambda entry: entry.order))
+        self.textwidget.event_generate(
+            "<<HoverResponse>>",
+            data=hover.Response(location=event.data_string, text=topmost.underline.tooltip_text),
+        )
+        return "break"  # Do not pass hover event to langserver
+
+
+_underliners: dict[tkinter.Text, _Underliner] = {}
+
+
+def set_underlines(textwidget: tkinter.Text, underlines: Underlines) -> None:
+    """Same as generating ``<<SetUnderlines>>`` on the tab of the text widget.
+
+    This is handy when you have a text widget but not its tab. If the text
+    widget doesn't belong to a :class:`~porcupine.tabs.FileTab`, this does nothing.
+    """
+    underliner = _underliners.get(textwidget)
+    if underliner is not None:
+        underliner.set_underlines(underlines)
+
+
+def get_underlines(textwidget: tkinter.Text, underline_id: str) -> list[Underline]:
+    """Return the underlines set with the given id, ordered by location.
+
+    The start and end of the returned underlines are where the underlined
+    text is now. They can differ from what was given in ``<<SetUnderlines>>``
+    if the text has been edited after that.
+    """
+    underliner = _underliners.get(textwidget)
+    if underliner is None:
+        return []
+    return [
+        dataclasses.replace(
+            entry.underline,
+            start=_position_to_index(entry.start),
+            end=_position_to_index(entry.end),
+        )
+        for entry in underliner.get_entries(underline_id)
+    ]
 
 
 def on_new_filetab(tab: tabs.FileTab) -> None:
     underliner = _Underliner(tab.textwidget)
-    utils.bind_with_data(tab, "<<SetUnderlines>>", underliner.set_underlines, add=True)
+    _underliners[tab.textwidget] = underliner
+    tab.bind("<Destroy>", (lambda event: _underliners.pop(tab.textwidget, None)), add=True)
+
+    utils.bind_with_data(tab, "<<SetUnderlines>>", underliner.on_set_underlines_event, add=True)
     utils.bind_with_data(
         tab.textwidget, "<<HoverRequest>>", underliner.handle_hover_request, add=True
     )
+    utils.bind_with_data(tab.textwidget, "<<ContentChanged>>", underliner.on_change, add=True)
+    utils.add_scroll_command(tab.textwidget, "yscrollcommand", underliner.update_tags)
 
 
 def setup() -> None:
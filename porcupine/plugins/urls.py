@@ -1,31 +1,35 @@
 """Find URLs in code and make them clickable."""
 from __future__ import annotations
 
+import re
 import tkinter
 import webbrowser
 from functools import partial
-from typing import Iterable
+from typing import Iterable, Iterator
 
-from porcupine import get_tab_manager, tabs, utils
+from porcupine import get_tab_manager, tabs, textutils, utils
 from porcupine.plugins import underlines
 
 # urls and langserver both use <<JumpToDefinitionRequest>>
 setup_before = ["langserver"]
+# underlines plugin must move old underlines before we send new underlines on <<ContentChanged>>
+setup_after = ["underlines"]
 
 
-def find_urls(text: tkinter.Text, start: str, end: str) -> Iterable[tuple[str, str]]:
-    match_ends_and_search_begins = start
+_URL_START_REGEX = re.compile(r"\bhttps?://[a-z0-9:]", flags=re.IGNORECASE)
+
+
+def find_urls_in_line(line: str) -> Iterator[tuple[int, int]]:
+    """Yield start and end columns of URLs found in a line of text."""
+    search_begins = 0
     while True:
-        match_start = text.search(
-            r"\mhttps?://[a-z0-9:]", match_ends_and_search_begins, end, nocase=True, regexp=True
-        )
-        if not match_start:  # empty string means not found
+        match = _URL_START_REGEX.search(line, search_begins)
+        if match is None:
             break
 
-        url = text.get(match_start, f"{match_start} lineend")
-        before_url = (
-            None if text.index(match_start) == "1.0" else text.get(f"{match_start} - 1 char")
-        )
+        url_start = match.start()
+        url = line[url_start:]
+        before_url = line[url_start - 1] if url_start > 0 else None
 
         # urls end on space or quote
         url = url.split(" ")[0]
@@ -46,43 +50,106 @@ def find_urls(text: tkinter.Text, start: str, end: str) -> Iterable[tuple[str, s
         # urls in middle of text: URL, and URL.
         url = url.rstrip(".,")
 
-        match_ends_and_search_begins = f"{match_start} + {len(url)} chars"
-        yield (match_start, match_ends_and_search_begins)
+        search_begins = url_start + len(url)
+        yield (url_start, search_begins)
 
 
-def update_url_underlines(tab: tabs.FileTab, junk: object = None) -> None:
-    view_start = tab.textwidget.index("@0,0")
-    view_end = tab.textwidget.index("@0,10000")
-    shortcut = utils.get_binding("<<Menubar:Edit/Jump to definition>>", many=True)
-
-    tab.event_generate(
-        "<<SetUnderlines>>",
-        data=underlines.Underlines(
-            id="urls",
-            underline_list=[
-                underlines.Underline(start, end, f"{shortcut} to open")
-                for start, end in find_urls(tab.textwidget, view_start, view_end)
-            ],
-        ),
-    )
+def find_urls(text: tkinter.Text, start: str, end: str) -> Iterable[tuple[str, str]]:
+    first_lineno = int(text.index(start).split(".")[0])
+    lines = text.get(f"{start} linestart", f"{end} lineend").split("\n")
+    for lineno, line in enumerate(lines, start=first_lineno):
+        for start_column, end_column in find_urls_in_line(line):
+            url_start = f"{lineno}.{start_column}"
+            url_end = f"{lineno}.{end_column}"
+            if text.compare(start, "<=", url_start) and text.compare(url_end, "<=", end):
+                yield (url_start, url_end)
+
+
+class _UrlFinder:
+    """Finds URLs in the visible part of the file.
+
+    URLs found on each line are remembered until the line changes or goes
+    out of view, so that scrolling only needs to look at the lines that
+    just became visible.
+    """
+
+    def __init__(self, tab: tabs.FileTab) -> None:
+        self._tab = tab
+        self._line_urls: dict[int, list[tuple[int, int]]] = {}  # keys are line numbers
+        self._underlined: list[underlines.Underline] | None = None
+
+    def on_change(self, event: utils.EventWithData) -> None:
+        for change in event.data_class(textutils.Changes).change_list:
+            start_line = change.start[0]
+            old_end_line = change.old_end[0]
+            line_count_diff = change.new_end[0] - old_end_line
+
+            self._line_urls = {
+                (lineno if lineno < start_line else lineno + line_count_diff): urls
+                for lineno, urls in self._line_urls.items()
+                if lineno < start_line or lineno > old_end_line
+            }
+        self.update()
+
+    def _find_missing(self, first_lineno: int, last_lineno: int) -> None:
+        lines = self._tab.textwidget.get(f"{first_lineno}.0", f"{last_lineno}.0 lineend")
+        for lineno, line in enumerate(lines.split("\n"), start=first_lineno):
+            self._line_urls[lineno] = list(find_urls_in_line(line))
+
+    def update(self, junk: object = None) -> None:
+        first_visible = int(self._tab.textwidget.index("@0,0").split(".")[0])
+        last_visible = int(self._tab.textwidget.index("@0,10000").split(".")[0])
+
+        self._line_urls = {
+            lineno: urls
+            for lineno, urls in self._line_urls.items()
+            if first_visible <= lineno <= last_visible
+        }
+
+        # Look at each run of consecutive lines that haven't been searched yet
+        missing = [
+            lineno
+            for lineno in range(first_visible, last_visible + 1)
+            if lineno not in self._line_urls
+        ]
+        while missing:
+            run_end = 1
+            while run_end < len(missing) and missing[run_end] == missing[0] + run_end:
+                run_end += 1
+            self._find_missing(missing[0], missing[run_end - 1])
+            del missing[:run_end]
+
+        shortcut = utils.get_binding("<<Menubar:Edit/Jump to definition>>", many=True)
+        underline_list = [
+            underlines.Underline(f"{lineno}.{start}", f"{lineno}.{end}", f"{shortcut} to open")
+            for lineno, urls in sorted(self._line_urls.items())
+            for start, end in urls
+        ]
+
+        # Nothing to do when scrolling within lines that have no new URLs
+        if underline_list != self._underlined:
+            self._underlined = underline_list
+            self._tab.event_generate(
+                "<<SetUnderlines>>",
+                data=underlines.Underlines(id="urls", underline_list=underline_list),
+            )
 
 
 def open_the_url(tab: tabs.FileTab, junk: object) -> str | None:
-    # tag_ranges is a painful method to use
-    ranges = tab.textwidget.tag_ranges("underline:urls")
-    for start, end in zip(ranges[0::2], ranges[1::2]):
-        if tab.textwidget.compare(start, "<=", "insert") and tab.textwidget.compare(
-            "insert", "<=", end
+    for underline in underlines.get_underlines(tab.textwidget, "urls"):
+        if tab.textwidget.compare(underline.start, "<=", "insert") and tab.textwidget.compare(
+            "insert", "<=", underline.end
         ):
-            webbrowser.open(tab.textwidget.get(start, end))
+            webbrowser.open(tab.textwidget.get(underline.start, underline.end))
             return "break"
     return None
 
 
 def on_new_filetab(tab: tabs.FileTab) -> None:
-    tab.textwidget.bind("<<ContentChanged>>", partial(update_url_underlines, tab), add=True)
-    utils.add_scroll_command(tab.textwidget, "yscrollcommand", partial(update_url_underlines, tab))
-    update_url_underlines(tab)
+    finder = _UrlFinder(tab)
+    utils.bind_with_data(tab.textwidget, "<<ContentChanged>>", finder.on_change, add=True)
+    utils.add_scroll_command(tab.textwidget, "yscrollcommand", finder.update)
+    finder.update()
 
     tab.textwidget.bind("<<JumpToDefinitionRequest>>", partial(open_the_url, tab), add=True)
 
@@ -9,9 +9,11 @@ import enum
 import json
 import logging
 import os
+import subprocess
 import sys
 import time
 import tkinter
+from functools import partial
 from pathlib import Path
 from tkinter import messagebox, ttk
 from typing import Any, Callable, Generator, Iterator, List, TypeVar, overload
@@ -20,7 +22,7 @@ import dacite
 from pygments import styles, token
 
 import porcupine
-from porcupine import dirs, images, utils
+from porcupine import _profiling, dirs, images, utils
 
 _log = logging.getLogger(__name__)
 
@@ -521,6 +523,45 @@ def _create_dialog_content() -> ttk.Frame:
 
 _dialog_content: ttk.Frame | None = None
 
+# Most of the time, the user doesn't open the dialog at all, so creating its
+# widgets is postponed until the dialog is needed. None means not initialized.
+_widget_creators: list[Callable[[], object]] | None = None
+
+
+def _add_to_dialog(create_widgets: Callable[[], object]) -> None:
+    if _dialog_content is not None:
+        create_widgets()
+    elif _widget_creators is not None:
+        _widget_creators.append(create_widgets)
+    else:
+        raise RuntimeError("porcupine isn't running")
+
+
+_WidgetT = TypeVar("_WidgetT", bound=tkinter.Widget)
+
+
+def _add_widget_to_dialog(
+    create_widget: Callable[[], _WidgetT], widget_callback: Callable[[_WidgetT], object] | None
+) -> None:
+    def create_and_call_back() -> None:
+        widget = create_widget()
+        if widget_callback is not None:
+            widget_callback(widget)
+
+    _add_to_dialog(create_and_call_back)
+
+
+def add_custom_widgets(create_widgets: Callable[[], object]) -> None:
+    """Call ``create_widgets()`` when the setting dialog gets created.
+
+    Use this if you want to add something to the setting dialog that the
+    functions below can't create. The callback should add the widgets to
+    :func:`get_dialog_content`. Calling :func:`get_dialog_content` directly
+    in a plugin's ``setup()`` would work too, but it creates the dialog
+    during startup, and that makes Porcupine start slower.
+    """
+    _add_to_dialog(create_widgets)
+
 
 def show_dialog() -> None:
     """Show the "Porcupine Settings" dialog.
@@ -575,9 +616,23 @@ def get_dialog_content() -> ttk.Frame:
     Column 0 typically contains labels such as "Font Family:", and column 1
     contains widgets for changing the settings. Column 2 is used for displaying
     |triangle| when the user has chosen the setting badly.
+
+    The dialog is created when this function is called for the first time.
     """
+    global _dialog_content
     if _dialog_content is None:
-        raise RuntimeError("porcupine isn't running")
+        if _widget_creators is None:
+            raise RuntimeError("porcupine isn't running")
+
+        # Shows up in --profile-startup output if a plugin creates the dialog on startup
+        start_time = time.perf_counter()
+        with _profiling.measure("settings", "create dialog"):
+            _dialog_content = _create_dialog_content()
+            for create_widgets in _widget_creators:
+                create_widgets()
+            _widget_creators.clear()
+        _log.debug(f"Created settings dialog in {round((time.perf_counter() - start_time)*1000)}ms")
+
     return _dialog_content
 
 
@@ -645,8 +700,13 @@ def _grid_widgets(
 
 
 def add_entry(
-    option_name: str, text: str, validate_callback: Callable[[str], bool], **entry_kwargs: Any
-) -> ttk.Entry:
+    option_name: str,
+    text: str,
+    validate_callback: Callable[[str], bool],
+    *,
+    widget_callback: Callable[[ttk.Entry], object] | None = None,
+    **entry_kwargs: Any,
+) -> None:
     """Add a :class:`tkinter.ttk.Entry` to the setting dialog.
 
     A label that displays *text* will be added next to the entry.
@@ -658,13 +718,29 @@ def add_entry(
     is set to the string that the user typed.
     Otherwise |triangle| is shown.
     """
+    _add_widget_to_dialog(
+        partial(_create_entry, option_name, text, validate_callback, entry_kwargs), widget_callback
+    )
+
+
+def _create_entry(
+    option_name: str,
+    text: str,
+    validate_callback: Callable[[str], bool],
+    entry_kwargs: dict[str, Any],
+) -> ttk.Entry:
     entry = ttk.Entry(get_dialog_content(), **entry_kwargs)
     triangle = _create_validation_triangle(entry, option_name, str, validate_callback)
     _grid_widgets(text, entry, triangle)
     return entry
 
 
-def add_checkbutton(option_name: str, **checkbutton_kwargs: Any) -> ttk.Checkbutton:
+def add_checkbutton(
+    option_name: str,
+    *,
+    widget_callback: Callable[[ttk.Checkbutton], object] | None = None,
+    **checkbutton_kwargs: Any,
+) -> None:
     """Add a :class:`tkinter.ttk.Checkbutton` to the setting dialog.
 
     All ``**checkbutton_kwargs`` go to :class:`tkinter.ttk.Checkbutton`.
@@ -687,6 +763,12 @@ def add_checkbutton(option_name: str, **checkbutton_kwargs: Any) -> ttk.Checkbut
     Currently it is not possible to display a |triangle| next to the
     checkbutton. Let me know if you need it.
     """
+    _add_widget_to_dialog(
+        partial(_create_checkbutton, option_name, checkbutton_kwargs), widget_callback
+    )
+
+
+def _create_checkbutton(option_name: str, checkbutton_kwargs: dict[str, Any]) -> ttk.Checkbutton:
     checkbutton = ttk.Checkbutton(get_dialog_content(), **checkbutton_kwargs)
     checkbutton.grid(column=0, columnspan=2, sticky="w", pady=2)
 
@@ -707,21 +789,32 @@ def add_checkbutton(option_name: str, **checkbutton_kwargs: Any) -> ttk.Checkbut
     return checkbutton
 
 
-def add_combobox(option_name: str, text: str, **combobox_kwargs: Any) -> ttk.Combobox:
+def add_combobox(
+    option_name: str,
+    text: str,
+    *,
+    widget_callback: Callable[[ttk.Combobox], object] | None = None,
+    **combobox_kwargs: Any,
+) -> None:
     """Add a :class:`tkinter.ttk.Combobox` to the setting dialog.
 
     All ``**combobox_kwargs`` go to :class:`tkinter.ttk.Combobox`.
     Usually you should pass at least ``values=list_of_strings``.
 
     The content of the combobox is checked whenever it changes.
-    If it's in ``combobox['values']``
-    (given with the ``values=list_of_strings`` keyword argument or changed
-    later by configuring the returned combobox), then the option given by
+    If it's in ``combobox['values']`` (given with the ``values=list_of_strings``
+    keyword argument), then the option given by
     *option_name* is set to the content of the combobox. The converter passed
     to the :meth:`~Settings.add_option` of ``global_settings`` will be used.
     If the content of the combobox is not in ``combobox['values']``,
     then |triangle| is shown.
     """
+    _add_widget_to_dialog(
+        partial(_create_combobox, option_name, text, combobox_kwargs), widget_callback
+    )
+
+
+def _create_combobox(option_name: str, text: str, combobox_kwargs: dict[str, Any]) -> ttk.Combobox:
     combo = ttk.Combobox(get_dialog_content(), **combobox_kwargs)
     triangle = _create_validation_triangle(
         combo, option_name, str, (lambda value: value in combo["values"])
@@ -730,7 +823,13 @@ def add_combobox(option_name: str, text: str, **combobox_kwargs: Any) -> ttk.Com
     return combo
 
 
-def add_spinbox(option_name: str, text: str, **spinbox_kwargs: Any) -> tkinter.ttk.Spinbox:
+def add_spinbox(
+    option_name: str,
+    text: str,
+    *,
+    widget_callback: Callable[[ttk.Spinbox], object] | None = None,
+    **spinbox_kwargs: Any,
+) -> None:
     """Add a :class:`tkinter.ttk.Spinbox` to the setting dialog.
 
     All ``**spinbox_kwargs`` go to :class:`tkinter.ttk.Spinbox`.
@@ -741,6 +840,12 @@ def add_spinbox(option_name: str, text: str, **spinbox_kwargs: Any) -> tkinter.t
     then the option given by *option_name* is set to the :class:`int`.
     Otherwise |triangle| is shown.
     """
+    _add_widget_to_dialog(
+        partial(_create_spinbox, option_name, text, spinbox_kwargs), widget_callback
+    )
+
+
+def _create_spinbox(option_name: str, text: str, spinbox_kwargs: dict[str, Any]) -> ttk.Spinbox:
     spinbox = ttk.Spinbox(get_dialog_content(), **spinbox_kwargs)
     triangle = _create_validation_triangle(
         spinbox, option_name, int, lambda value: int(spinbox["from"]) <= value <= int(spinbox["to"])
@@ -773,17 +878,16 @@ def _get_colors(style_name: str) -> tuple[str, str]:
 
 # TODO: document this?
 def add_pygments_style_button(option_name: str, text: str) -> None:
+    _add_to_dialog(partial(_create_pygments_style_button, option_name, text))
+
+
+def _create_pygments_style_button(option_name: str, text: str) -> None:
     var = tkinter.StringVar()
 
     # not using ttk.Menubutton because i want custom colors
     menubutton = tkinter.Menubutton(
         get_dialog_content(), textvariable=var, takefocus=True, highlightthickness=1
     )
-    menu = tkinter.Menu(menubutton, tearoff=False)
-    menubutton.config(menu=menu)
-
-    def var_to_settings(*junk: object) -> None:
-        global_settings.set(option_name, var.get())
 
     def settings_to_var_and_colors(junk: object = None) -> None:
         style_name = global_settings.get(option_name, object)
@@ -791,12 +895,15 @@ def add_pygments_style_button(option_name: str, text: str) -> None:
         fg, bg = _get_colors(style_name)
         menubutton.config(foreground=fg, background=bg, highlightcolor=fg, highlightbackground=bg)
 
-    menubutton.bind(f"<<GlobalSettingChanged:{option_name}>>", settings_to_var_and_colors, add=True)
-    var.trace_add("write", var_to_settings)
+    def var_to_settings(*junk: object) -> None:
+        global_settings.set(option_name, var.get())
+
+    # Not done when creating button, because getting the colors of all
+    # styles is slow. Runs when the menu is about to be shown.
+    def fill_menu() -> None:
+        if menu.index("end") is not None:
+            return
 
-    # Not done when creating button, because can slow down porcupine startup
-    def fill_menubutton(junk_event: object) -> None:
-        menu.delete(0, "end")
         for index, style_name in enumerate(sorted(styles.get_all_styles())):
             fg, bg = _get_colors(style_name)
             menu.add_radiobutton(
@@ -810,18 +917,26 @@ def add_pygments_style_button(option_name: str, text: str) -> None:
                 activebackground=fg,
                 columnbreak=(index != 0 and index % 20 == 0),
             )
-        settings_to_var_and_colors()
 
-    menubutton.bind("<Map>", fill_menubutton, add=True)
+    menu = tkinter.Menu(menubutton, tearoff=False, postcommand=fill_menu)
+    menubutton.config(menu=menu)
+
+    menubutton.bind(f"<<GlobalSettingChanged:{option_name}>>", settings_to_var_and_colors, add=True)
+    settings_to_var_and_colors()
+    var.trace_add("write", var_to_settings)
     _grid_widgets(text, menubutton, None)
 
 
-def add_label(text: str) -> ttk.Label:
+def add_label(text: str, *, widget_callback: Callable[[ttk.Label], object] | None = None) -> None:
     """Add text to the setting dialog.
 
     This is useful for explaining what some options do with more than a few words.
     The text is always as wide as the dialog is, even when the dialog is resized.
     """
+    _add_widget_to_dialog(partial(_create_label, text), widget_callback)
+
+
+def _create_label(text: str) -> ttk.Label:
     label = ttk.Label(get_dialog_content(), text=text)
     label.grid(column=0, columnspan=3, sticky="we", pady=10)
 
@@ -889,7 +1004,7 @@ def _is_monospace(font_family: str) -> bool:
         return False
 
     # I don't want to create font objects just for this, lol
-    tcl_interpreter = get_dialog_content().tk
+    tcl_interpreter = porcupine.get_main_window().tk
 
     # https://core.tcl-lang.org/tk/info/3767882e06
     if "emoji" in font_family.lower():
@@ -913,17 +1028,66 @@ def _is_monospace(font_family: str) -> bool:
     return max(sizes) - min(sizes) <= 1
 
 
+# On X11, Tk gets its fonts from fontconfig, so fontconfig and Tk agree on
+# font family names. Elsewhere, fontconfig might be installed but Tk doesn't
+# use it.
+def _uses_fontconfig() -> bool:
+    return porcupine.get_main_window().tk.call("tk", "windowingsystem") == "x11"
+
+
+# fc-cache updates these folders when fonts are installed or removed
+_FONTCONFIG_CACHE_DIRS = [
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "fontconfig",
+    Path("/var/cache/fontconfig"),
+    Path("/usr/lib/fontconfig/cache"),
+    Path("/usr/local/var/cache/fontconfig"),
+]
+
+
+def _get_fontconfig_cache_timestamp() -> float | None:
+    timestamps = []
+    for path in _FONTCONFIG_CACHE_DIRS:
+        try:
+            timestamps.append(path.stat().st_mtime)
+        except OSError:
+            pass
+    return max(timestamps, default=None)
+
+
+# Much faster than measuring each font with Tk, because fontconfig knows the
+# spacing of each font without rendering anything
+def _find_monospace_families_with_fontconfig() -> set[str] | None:
+    try:
+        output = subprocess.run(
+            ["fc-list", "--format", "%{family[0]}\n", ":spacing=mono"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        ).stdout.decode("utf-8", errors="replace")
+    except (OSError, subprocess.CalledProcessError):
+        _log.info("fc-list failed, measuring fonts with Tk instead", exc_info=True)
+        return None
+    return set(output.splitlines())
+
+
 def _get_monospace_font_families() -> list[str]:
     cache_path = dirs.user_cache_path / "font_cache.json"
     all_families = sorted(set(tkinter.font.families()))
 
+    # In case the user installs more fonts
+    timestamp = _get_fontconfig_cache_timestamp() if _uses_fontconfig() else None
+    cache_key: object
+    if timestamp is None:
+        cache_key = {"all_families": all_families}
+    else:
+        cache_key = {"fontconfig_cache_timestamp": timestamp}
+
     # This is surprisingly slow when there are lots of fonts. Let's cache.
     try:
         with cache_path.open("r") as file:
             cache = json.load(file)
 
-        # all_families stored to cache in case user installs more fonts
-        if cache["version"] == 2 and cache["all_families"] == all_families:
+        if cache["version"] == 3 and cache["key"] == cache_key:
             _log.debug(f"Taking list of monospace families from {cache_path}")
             return cache["monospace_families"]
 
@@ -932,18 +1096,22 @@ def _get_monospace_font_families() -> list[str]:
     except Exception:
         _log.error(f"unexpected {cache_path} reading error", exc_info=True)
 
-    _log.warning(f"Can't use {cache_path}. Starting Porcupine might take a while.")
-    monospace_families = list(filter(_is_monospace, all_families))
+    _log.info(f"Can't use {cache_path}, finding monospace fonts")
+    fontconfig_families = _find_monospace_families_with_fontconfig() if _uses_fontconfig() else None
+    if fontconfig_families is None:
+        monospace_families = list(filter(_is_monospace, all_families))
+    else:
+        monospace_families = [
+            family
+            for family in all_families
+            if family in fontconfig_families and "emoji" not in family.lower()
+        ]
 
     try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
         with cache_path.open("w") as file:
             json.dump(
-                {
-                    "version": 2,
-                    "all_families": all_families,
-                    "monospace_families": monospace_families,
-                },
-                file,
+                {"version": 3, "key": cache_key, "monospace_families": monospace_families}, file
             )
         _log.debug(f"Wrote {cache_path}")
     except Exception:
@@ -952,12 +1120,16 @@ def _get_monospace_font_families() -> list[str]:
     return monospace_families
 
 
-def _fill_dialog_content_with_defaults() -> None:
+def _create_font_family_combobox() -> None:
     start_time = time.perf_counter()
     monospace_families = _get_monospace_font_families()
     _log.debug(f"Found monospace fonts in {round((time.perf_counter() - start_time)*1000)}ms")
+    _create_combobox("font_family", "Font family:", {"values": monospace_families})
+
 
-    add_combobox("font_family", "Font family:", values=monospace_families)
+def _fill_dialog_content_with_defaults() -> None:
+    # Finding the fonts is slow, so it's done only when the dialog is created
+    _add_to_dialog(_create_font_family_combobox)
     add_spinbox("font_size", "Font size:", from_=3, to=1000)
     add_combobox(
         "default_line_ending", "Default line ending:", values=[ending.name for ending in LineEnding]
@@ -967,11 +1139,11 @@ def _fill_dialog_content_with_defaults() -> None:
 
 # undocumented on purpose, don't use in plugins
 def init_the_rest_after_initing_enough_for_using_disabled_plugins_list() -> None:
-    global _dialog_content
-    assert _dialog_content is None
+    global _widget_creators
+    assert _widget_creators is None
 
     _log.debug("initializing continues")
     _init_global_gui_settings()
-    _dialog_content = _create_dialog_content()
+    _widget_creators = []
     _fill_dialog_content_with_defaults()
     _log.debug("initialized")
@@ -455,7 +455,7 @@ def _import_lexer_class(name: str) -> LexerMeta:
     return klass
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class ReloadInfo(utils.EventDataclass):
     had_unsaved_changes: bool
 
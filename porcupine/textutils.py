@@ -7,7 +7,7 @@ import tkinter
 import weakref
 from functools import partial
 from tkinter.font import Font
-from typing import TYPE_CHECKING, Any, Callable, Iterator, List
+from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Sequence
 from weakref import WeakKeyDictionary
 
 from pygments import styles
@@ -19,7 +19,7 @@ if TYPE_CHECKING:
     from porcupine import tabs
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Change:
     r"""
     This :mod:`dataclass <dataclasses>` represents a deletion, insertion or
@@ -60,7 +60,7 @@ class Change:
     new_text: str
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Changes(utils.EventDataclass):
     r"""
     This :mod:`dataclass <dataclasses>` represents a list of several
@@ -70,8 +70,40 @@ class Changes(utils.EventDataclass):
 
     This boilerplate class is needed instead of a plain ``List[Change]``
     because of how :class:`porcupine.utils.EventDataclass` works.
+
+    If ``whole_document_replaced`` is True, then at least one of the changes
+    deleted or replaced all text in the text widget. This happens when e.g. a
+    formatter replaces the whole file. Instead of applying ``change_list`` one
+    change at a time, you should then resync with the new content of the text
+    widget. See :func:`track_changes` for how ``old_text`` works in this case.
     """
     change_list: List[Change]
+    whole_document_replaced: bool = False
+
+
+def move_position(
+    position: tuple[int, int], change: Change, *, is_end: bool = False
+) -> tuple[int, int]:
+    """Find out where a ``(line, column)`` location goes when ``change`` is applied.
+
+    This is useful for keeping locations up to date without putting a mark
+    or a tag to the text widget. Text inserted at ``position`` goes after
+    it, unless *is_end* is True. This is how the start and end of a tag
+    behave. Locations inside deleted text go to where the deletion happened.
+    """
+    start = (change.start[0], change.start[1])
+    old_end = (change.old_end[0], change.old_end[1])
+    new_end = (change.new_end[0], change.new_end[1])
+
+    if position < start or (position == start and is_end):
+        return position
+    if position < old_end:
+        return start if is_end else new_end
+
+    line, column = position
+    if line == old_end[0]:
+        return (new_end[0], new_end[1] + column - old_end[1])
+    return (line + new_end[0] - old_end[0], column)
 
 
 # TODO: document this
@@ -80,13 +112,22 @@ def count(widget: tkinter.Text, start: str, end: str, *, option: str = "-chars")
     return widget.tk.call(widget, "count", option, start, end)
 
 
+def _index_to_tuple(index: str) -> tuple[int, int]:
+    line, column = map(int, index.split("."))
+    return (line, column)
+
+
 class _ChangeTracker:
-    def __init__(self, event_receiver_widget: tkinter.Text) -> None:
+    def __init__(self, event_receiver_widget: tkinter.Text, *, lazy_old_text: bool) -> None:
         # can't reference text widget directly
         # would cause text widget refcount never reach zero, WeakKeyDictionary won't work
         self._event_receiver_ref = weakref.ref(event_receiver_widget)
         self._change_batch: list[Change] | None = None
+        self._pending_change_events: dict[str, Changes] = {}
+        self._batch_replaced_whole_document = False
         self.change_blockers: list[Callable[[], bool]] = []
+        self.lazy_old_text = lazy_old_text
+        self.old_text_requests = 0
 
     def setup(self, widget: tkinter.Text) -> None:
         old_cursor_pos = widget.index("insert")  # must be widget specific
@@ -195,11 +236,16 @@ class _ChangeTracker:
             # however, it's also important that this is before the mark set
             # stuff because the documented way to access the new index in a
             # <<CursorMoved>> binding is getting it directly from the widget
-            set result [%(actual_widget)s {*}$args]
-
-            if {$prepared_event != ""} {
-                # must be after calling actual widget command
-                event generate %(event_receiver)s <<ContentChanged>> -data $prepared_event
+            if {$prepared_event == ""} {
+                set result [%(actual_widget)s {*}$args]
+            } else {
+                try {
+                    set result [%(actual_widget)s {*}$args]
+                    # must be after calling actual widget command
+                    event generate %(event_receiver)s <<ContentChanged>> -data $prepared_event
+                } finally {
+                    %(forget_change_event)s $prepared_event
+                }
             }
 
             # only[*] 'textwidget mark set insert new_location' can change the
@@ -226,11 +272,14 @@ class _ChangeTracker:
                     partial(self._change_event_from_command, widget)
                 ),
                 "event_receiver": str(self._event_receiver_ref()),
+                "forget_change_event": widget.register(self._forget_change_event),
                 "cursor_moved_callback": widget.register(cursor_pos_changed),
             }
         )
 
-    def _create_change(self, widget: tkinter.Text, start: str, end: str, new_text: str) -> Change:
+    def _create_change(
+        self, widget: tkinter.Text, start: str, end: str, new_text: str, *, get_old_text: bool
+    ) -> Change:
         start_line = int(start.split(".")[0])
         end_line = int(end.split(".")[0])
         start_column = count(widget, f"{start_line}.0", start)
@@ -246,15 +295,23 @@ class _ChangeTracker:
             start=[start_line, start_column],
             old_end=[end_line, end_column],
             new_end=[new_end_line, new_end_col],
-            old_text=widget.get(start, end),
+            old_text=(widget.get(start, end) if get_old_text else ""),
             new_text=new_text,
         )
 
+    def _forget_change_event(self, data_string: str) -> None:
+        del self._pending_change_events[data_string]
+
     # Must be called before widget content actually changes
     def _change_event_from_command(
         self, widget: tkinter.Text, subcommand: str, *args_tuple: str
     ) -> str:
-        changes = []
+        # The Tcl code has already converted the indexes to "LINE.COLUMN"
+        # strings, so they can be compared in Python without calling Tcl. The
+        # end is looked up only once, because every index call goes through Tcl.
+        end_of_text = widget.index("end")
+        last_char = widget.index("end - 1 char")
+        ranges: list[tuple[str, str, str]] = []  # (start, end, new_text)
 
         # search for 'pathName delete' in text(3tk)... it's a wall of text,
         # and this thing has to implement every detail of that wall
@@ -262,10 +319,7 @@ class _ChangeTracker:
             # tk has a funny abstraction of an invisible newline character at
             # the end of file, it's always there but nothing else uses it, so
             # let's ignore it
-            args = list(args_tuple)
-            for index, old_arg in enumerate(args):
-                if old_arg == widget.index("end"):
-                    args[index] = widget.index("end - 1 char")
+            args = [last_char if arg == end_of_text else arg for arg in args_tuple]
 
             # "If index2 is not specified then the single character at index1
             # is deleted." and later: "If more indices are given, multiple
@@ -274,44 +328,37 @@ class _ChangeTracker:
             if len(args) % 2 == 1:
                 args.append(widget.index(f"{args[-1]} + 1 char"))
             assert len(args) % 2 == 0
-            pairs = list(zip(args[0::2], args[1::2]))
 
             # "If index2 does not specify a position later in the text than
             # index1 then no characters are deleted."
-            pairs = [(start, end) for (start, end) in pairs if widget.compare(start, "<", end)]
-
-            # "They [index pairs, aka ranges] are sorted [...]."
+            #
             # (line, column) tuples sort nicely
-            def get_range_beginning_as_tuple(start_and_end: tuple[str, str]) -> tuple[int, int]:
-                line, column = map(int, start_and_end[0].split("."))
-                return (line, column)
+            pairs = [
+                (_index_to_tuple(start), _index_to_tuple(end))
+                for start, end in zip(args[0::2], args[1::2])
+            ]
+            pairs = [(start, end) for (start, end) in pairs if start < end]
 
-            pairs.sort(key=get_range_beginning_as_tuple)
+            # "They [index pairs, aka ranges] are sorted [...]."
+            pairs.sort()
 
             # "If multiple ranges with the same start index are given, then the
             # longest range is used. If overlapping ranges are given, then they
             # will be merged into spans that do not cause deletion of text
             # outside the given ranges due to text shifted during deletion."
-            def merge_index_ranges(
-                start1: str, end1: str, start2: str, end2: str
-            ) -> tuple[str, str]:
-                start = start1 if widget.compare(start1, "<", start2) else start2
-                end = end1 if widget.compare(end1, ">", end2) else end2
-                return (start, end)
-
+            #
             # loop through pairs of pairs
             for i in range(len(pairs) - 2, -1, -1):
                 (start1, end1), (start2, end2) = pairs[i : i + 2]
-                if widget.compare(end1, ">=", start2):
+                if end1 >= start2:
                     # they overlap
-                    new_pair = merge_index_ranges(start1, end1, start2, end2)
-                    pairs[i : i + 2] = [new_pair]
+                    pairs[i : i + 2] = [(min(start1, start2), max(end1, end2))]
 
             # "[...] and the text is removed from the last range to the first
             # range so deleted text does not cause an undesired index shifting
             # side-effects."
-            for start, end in reversed(pairs):
-                changes.append(self._create_change(widget, start, end, ""))
+            for (start_line, start_column), (end_line, end_column) in reversed(pairs):
+                ranges.append((f"{start_line}.{start_column}", f"{end_line}.{end_column}", ""))
 
         # the man page's inserting section is also kind of a wall of
         # text, but not as bad as the delete
@@ -321,8 +368,8 @@ class _ChangeTracker:
             # "If index refers to the end of the text (the character after the
             # last newline) then the new text is inserted just before the last
             # newline instead."
-            if text_index == widget.index("end"):
-                text_index = widget.index("end - 1 char")
+            if text_index == end_of_text:
+                text_index = last_char
 
             # we don't care about the tagList arguments to insert, but we need
             # to handle the other arguments nicely anyway: "If multiple
@@ -333,8 +380,7 @@ class _ChangeTracker:
             # it, and 'textwidget.insert('1.0', 'asd', [], 'toot', [])' inserts
             # 'asdtoot', not 'tootasd'
             new_text = "".join(other_args[::2])
-
-            changes.append(self._create_change(widget, text_index, text_index, new_text))
+            ranges.append((text_index, text_index, new_text))
 
         # an even smaller wall of text that mostly refers to insert and replace
         elif subcommand == "replace":
@@ -342,19 +388,31 @@ class _ChangeTracker:
             new_text = "".join(other_args[::2])
 
             # more invisible newline garbage
-            if start == widget.index("end"):
-                start = widget.index("end - 1 char")
-            if end == widget.index("end"):
-                end = widget.index("end - 1 char")
+            if start == end_of_text:
+                start = last_char
+            if end == end_of_text:
+                end = last_char
 
             # didn't find in docs, but tcl throws an error for this
-            assert widget.compare(start, "<=", end)
-
-            changes.append(self._create_change(widget, start, end, new_text))
+            assert _index_to_tuple(start) <= _index_to_tuple(end)
+            ranges.append((start, end, new_text))
 
         else:  # pragma: no cover
             raise ValueError(f"unexpected subcommand: {subcommand}")
 
+        # Copying all text of a big file is slow, and rarely needed
+        replaces_whole_document = any(
+            start == "1.0" and end == last_char != "1.0" for start, end, new_text in ranges
+        )
+        get_old_text = not (
+            replaces_whole_document and self.lazy_old_text and self.old_text_requests == 0
+        )
+
+        changes = [
+            self._create_change(widget, start, end, new_text, get_old_text=get_old_text)
+            for start, end, new_text in ranges
+        ]
+
         # remove changes that don't actually do anything
         changes = [
             change
@@ -363,15 +421,24 @@ class _ChangeTracker:
         ]
 
         if self._change_batch is None:
-            return str(Changes(changes)) if changes else ""
+            if not changes:
+                return ""
+            # The event data refers to the Changes object weakly, so it must be
+            # kept alive until the Tcl code has generated the event
+            changes_object = Changes(changes, whole_document_replaced=replaces_whole_document)
+            data_string = str(changes_object)
+            self._pending_change_events[data_string] = changes_object
+            return data_string
         else:
             self._change_batch.extend(changes)
+            self._batch_replaced_whole_document |= replaces_whole_document
             return ""  # don't generate event
 
     def begin_batch(self) -> None:
         if self._change_batch is not None:
             raise RuntimeError("nested calls to change_batch")
         self._change_batch = []
+        self._batch_replaced_whole_document = False
 
     def finish_batch(self) -> None:
         try:
@@ -379,7 +446,13 @@ class _ChangeTracker:
             if self._change_batch:
                 widget = self._event_receiver_ref()
                 assert widget is not None
-                widget.event_generate("<<ContentChanged>>", data=Changes(self._change_batch))
+                widget.event_generate(
+                    "<<ContentChanged>>",
+                    data=Changes(
+                        self._change_batch,
+                        whole_document_replaced=self._batch_replaced_whole_document,
+                    ),
+                )
         finally:
             self._change_batch = None
 
@@ -387,7 +460,7 @@ class _ChangeTracker:
 _change_trackers: WeakKeyDictionary[tkinter.Text, _ChangeTracker] = WeakKeyDictionary()
 
 
-def track_changes(widget: tkinter.Text) -> None:
+def track_changes(widget: tkinter.Text, *, lazy_old_text: bool = False) -> None:
     """
     Make the text widget emit virtual events whenever its content is modified
     or the cursor moves.
@@ -438,6 +511,13 @@ def track_changes(widget: tkinter.Text) -> None:
         widget has already changed. Also, sometimes many changes are applied
         at once and ``change_list`` contains more than one item.
 
+        With ``lazy_old_text=True``, the ``old_text`` of a change that deletes
+        or replaces all text in the widget is an empty string, because getting
+        the old content of a big file is slow. The ``Changes`` object then has
+        ``whole_document_replaced=True``. If you need the ``old_text`` anyway,
+        call :func:`request_old_text`. The ``textwidget`` of a
+        :class:`~porcupine.tabs.FileTab` uses ``lazy_old_text=True``.
+
     .. virtualevent:: CursorMoved
 
         This event is generated every time the user moves the cursor or
@@ -450,11 +530,20 @@ def track_changes(widget: tkinter.Text) -> None:
     if widget.peer_names():
         raise RuntimeError("track_changes() must be called before create_peer_widget()")
 
-    tracker = _ChangeTracker(widget)
+    tracker = _ChangeTracker(widget, lazy_old_text=lazy_old_text)
     tracker.setup(widget)
     _change_trackers[widget] = tracker
 
 
+def request_old_text(widget: tkinter.Text) -> None:
+    """Make sure that ``<<ContentChanged>>`` events always include ``old_text``.
+
+    This only makes a difference if :func:`track_changes` was called with
+    ``lazy_old_text=True``.
+    """
+    _change_trackers[widget].old_text_requests += 1
+
+
 # Add a callback function that is called to decide whether the text widget can be edited.
 # You can disable all editing by making a text widget disabled, but that has a few disadvantages:
 #   - Not very dynamic: you have to update the disabled-ness when you want the text to become editable / non editable
@@ -513,6 +602,172 @@ def change_batch(widget: tkinter.Text) -> Iterator[None]:
         widget.mark_set("insert", cursor_pos)
 
 
+# Myers' diff algorithm: http://www.xmailserver.org/diff2.pdf
+#
+# Returns the matching parts of a and b as (a_start, b_start, length) tuples,
+# or None if more than max_edits lines need to be inserted or deleted.
+def _find_matching_runs(
+    a: Sequence[str], b: Sequence[str], max_edits: int
+) -> list[tuple[int, int, int]] | None:
+    n = len(a)
+    m = len(b)
+    if abs(n - m) > max_edits:
+        return None
+
+    # v[k] = how far (x coordinate) we got on diagonal k = x - y
+    v = {1: 0}
+    trace = []
+    for d in range(min(n + m, max_edits) + 1):
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]  # insert line from b
+            else:
+                x = v[k - 1] + 1  # delete line from a
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                break
+        else:
+            continue
+        break
+    else:
+        return None
+
+    # Walk backwards to find out how we got to the end
+    runs = []
+    x = n
+    y = m
+    for d in range(len(trace) - 1, 0, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+
+        # After inserting or deleting, there may be lines that match
+        if prev_k == k + 1:
+            match_x, match_y = prev_x, prev_y + 1
+        else:
+            match_x, match_y = prev_x + 1, prev_y
+        if x > match_x:
+            runs.append((match_x, match_y, x - match_x))
+        x = prev_x
+        y = prev_y
+
+    assert x == y
+    if x > 0:
+        runs.append((0, 0, x))
+    runs.reverse()
+    return runs
+
+
+def diff_lines(
+    old_lines: Sequence[str], new_lines: Sequence[str], *, max_edits: int = 1000
+) -> list[tuple[int, int, int, int]]:
+    """Find out which lines need to change to turn ``old_lines`` into ``new_lines``.
+
+    The return value is a list of ``(old_start, old_end, new_start, new_end)``
+    tuples, meaning that ``old_lines[old_start:old_end]`` should be replaced
+    with ``new_lines[new_start:new_end]``. The list is sorted, and all
+    indexes refer to the original lists.
+
+    If the lists are very different, computing the smallest possible diff
+    would be slow. When more than ``max_edits`` lines would need to be
+    inserted or deleted, this function instead returns one big change that
+    covers everything except the lines that are same in the beginning and the
+    end.
+    """
+    # Most diffs are small changes in the middle, and Myers is fast when the
+    # lists are short, so first get rid of the matching start and end.
+    prefix_len = 0
+    max_prefix_len = min(len(old_lines), len(new_lines))
+    while prefix_len < max_prefix_len and old_lines[prefix_len] == new_lines[prefix_len]:
+        prefix_len += 1
+
+    suffix_len = 0
+    max_suffix_len = max_prefix_len - prefix_len
+    while (
+        suffix_len < max_suffix_len
+        and old_lines[len(old_lines) - suffix_len - 1] == new_lines[len(new_lines) - suffix_len - 1]
+    ):
+        suffix_len += 1
+
+    old_middle = old_lines[prefix_len : len(old_lines) - suffix_len]
+    new_middle = new_lines[prefix_len : len(new_lines) - suffix_len]
+    runs = _find_matching_runs(old_middle, new_middle, max_edits)
+    if runs is None:
+        runs = []
+
+    result = []
+    old_pos = 0
+    new_pos = 0
+    for old_start, new_start, length in runs + [(len(old_middle), len(new_middle), 0)]:
+        if old_start > old_pos or new_start > new_pos:
+            result.append(
+                (
+                    prefix_len + old_pos,
+                    prefix_len + old_start,
+                    prefix_len + new_pos,
+                    prefix_len + new_start,
+                )
+            )
+        old_pos = old_start + length
+        new_pos = new_start + length
+    return result
+
+
+def replace_text_with_diff(
+    widget: tkinter.Text, new_text: str, *, diff: list[tuple[int, int, int, int]] | None = None
+) -> None:
+    """Change the content of a text widget to ``new_text``.
+
+    Unlike ``widget.replace("1.0", "end - 1 char", new_text)``, this only
+    replaces the lines that actually change, as computed by :func:`diff_lines`.
+    This way, tags and marks on other lines stay where they are, and
+    ``<<ContentChanged>>`` callbacks don't need to process the whole file. All
+    changes are done in one :func:`change_batch`.
+
+    This is useful for plugins that run a tool (e.g. a code formatter) on the
+    whole file and then show the result.
+
+    Computing the diff can take a while if the file is big. To avoid that,
+    you can pass a *diff* that was already computed in another thread with
+    :func:`diff_lines`. It must be computed from the current content of the
+    widget and ``new_text``.
+    """
+    old_lines = widget.get("1.0", "end - 1 char").split("\n")
+    new_lines = new_text.split("\n")
+    if diff is None:
+        diff = diff_lines(old_lines, new_lines)
+
+    with change_batch(widget):
+        # Start from the end, so that line numbers of earlier hunks stay valid.
+        # Line numbers here start at 0, but in Tk they start at 1.
+        for old_start, old_end, new_start, new_end in reversed(diff):
+            replacement = "\n".join(new_lines[new_start:new_end])
+            if new_start == new_end:
+                if old_end < len(old_lines):
+                    widget.delete(f"{old_start + 1}.0", f"{old_end + 1}.0")
+                else:
+                    # Deleting the last lines, delete newline before them
+                    widget.delete(f"{old_start}.0 lineend", f"{old_end}.0 lineend")
+            elif old_start == old_end:
+                if old_start < len(old_lines):
+                    widget.insert(f"{old_start + 1}.0", replacement + "\n")
+                else:
+                    # Adding lines to the end
+                    widget.insert(f"{old_start}.0 lineend", "\n" + replacement)
+            else:
+                widget.replace(f"{old_start + 1}.0", f"{old_end}.0 lineend", replacement)
+
+
 def create_peer_widget(
     original_text_widget: tkinter.Text, the_widget_that_becomes_a_peer: tkinter.Text
 ) -> None:
@@ -711,7 +966,7 @@ class MainText(tkinter.Text):
     def __init__(self, tab: tabs.FileTab, **kwargs: Any) -> None:
         super().__init__(tab.panedwindow, **kwargs)
         self._tab = tab
-        track_changes(self)
+        track_changes(self, lazy_old_text=True)
 
         bind_font_changed(tab, self._on_font_changed)
         self._on_font_changed()
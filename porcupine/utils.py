@@ -20,9 +20,12 @@ import collections
 import contextlib
 import dataclasses
 import functools
+import itertools
 import json
 import logging
+import os
 import re
+import secrets
 import shlex
 import shutil
 import subprocess
@@ -30,6 +33,7 @@ import sys
 import threading
 import tkinter
 import traceback
+import weakref
 from pathlib import Path
 from tkinter import ttk
 from typing import TYPE_CHECKING, Any, Callable, Type, TypeVar, cast
@@ -127,6 +131,43 @@ def find_project_root(project_file_path: Path) -> Path:
     return likely_root or project_file_path.parent
 
 
+def list_project_files(project_root: Path) -> list[Path]:
+    """Return absolute paths of all files in a project, except git-ignored files.
+
+    In a Git repository, this runs ``git ls-files``, so the result may contain
+    files that have been deleted but not committed yet. Otherwise the project
+    is walked through, skipping hidden folders such as ``.venv``.
+
+    This can be slow for big projects, so call it from a thread
+    (see :func:`run_in_thread`).
+    """
+    try:
+        result = subprocess.run(
+            ["git", "ls-files", "--cached", "--others", "--exclude-standard", "-z"],
+            cwd=project_root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=(60 * 10),
+            **subprocess_kwargs,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        log.debug("can't run git", exc_info=True)
+    else:
+        if result.returncode == 0:
+            return [
+                project_root / os.fsdecode(relative)
+                for relative in result.stdout.split(b"\0")
+                if relative
+            ]
+        # Probably not a git repo
+
+    paths: list[Path] = []
+    for dirpath, dirnames, filenames in os.walk(project_root):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        paths.extend(Path(dirpath, name) for name in filenames)
+    return paths
+
+
 # https://github.com/python/typing/issues/769
 def copy_type(f: _T) -> Callable[[Any], _T]:
     return lambda x: x
@@ -355,6 +396,9 @@ def get_binding(virtual_event: str, *, menu: bool = False, many: bool = False) -
     return " or ".join(results)
 
 
+_NON_BMP_REGEX = re.compile("[\U00010000-\U0010FFFF]")
+
+
 # TODO: document this
 def tkinter_safe_string(string: str, *, hide_unsupported_chars: bool = False) -> str:
     if hide_unsupported_chars:
@@ -362,7 +406,8 @@ def tkinter_safe_string(string: str, *, hide_unsupported_chars: bool = False) ->
     else:
         replace_with = "\N{replacement character}"
 
-    return "".join(replace_with if ord(char) > 0xFFFF else char for char in string)
+    # Regex is much faster than looping in Python, this is used for all output of commands
+    return _NON_BMP_REGEX.sub(replace_with, string)
 
 
 class EventDataclass:
@@ -377,12 +422,12 @@ class EventDataclass:
         from typing import List
         from porcupine import utils
 
-        @dataclasses.dataclass
+        @dataclasses.dataclass(frozen=True)
         class Foo:
             message: str
             num: int
 
-        @dataclasses.dataclass
+        @dataclasses.dataclass(frozen=True)
         class Bar(utils.EventDataclass):
             foos: List[Foo]
 
@@ -394,6 +439,10 @@ class EventDataclass:
         foos = [Foo('ab', 123), Foo('cd', 456)]
         some_widget.event_generate('<<Thingy>>', data=Bar(foos))
 
+    The object passed to ``event_generate()`` is not copied. Every callback
+    bound with :func:`bind_with_data` gets the same object, so please use
+    ``frozen=True`` and don't mutate the lists inside it either.
+
     Note that before Python 3.10, you need ``List[str]`` instead of
     ``list[str]``, even if you use ``from __future__ import annotations``. This
     is because Porcupine uses a library that needs to evaluate the type
@@ -402,11 +451,52 @@ class EventDataclass:
     """
 
     def __str__(self) -> str:
-        # str(Foo(a=1, b=2)) --> 'Foo{"a": 1, "b": 2}'
-        # Content after Foo is JSON parsed in Event.data_class()
+        # str(Foo(a=1, b=2)) --> '<porcupine-event-data-1a2b3c4d5e6f7a8b>Foo#123'
+        # The number is looked up in EventWithData.data_class(). This is much
+        # faster than converting to JSON and back, especially when the event
+        # contains a lot of text and many callbacks are bound to it.
+        token = next(_event_data_counter)
+        _event_data_objects[token] = self
+        return f"{_EVENT_DATA_PREFIX}{type(self).__name__}#{token}"
+
+    def to_json_string(self) -> str:
+        """Return a data string that doesn't refer to this object.
+
+        :meth:`EventWithData.data_class` parses strings returned by this method
+        with JSON. This is slow, but unlike ``str(the_dataclass)``, the string
+        remains usable even after the dataclass has been garbage collected.
+        Use this if you generate an event with ``when='tail'``, for example.
+        """
+        # Foo(a=1, b=2).to_json_string() --> 'Foo{"a": 1, "b": 2}'
         return type(self).__name__ + json.dumps(dataclasses.asdict(self))  # type: ignore
 
 
+# Weak values: whoever generates the event must hold a reference to the data
+# object until the event has been handled. The EventWithData objects given to
+# callbacks also refer to it, but otherwise we don't want to keep it alive.
+_event_data_objects: weakref.WeakValueDictionary[
+    int, EventDataclass
+] = weakref.WeakValueDictionary()
+_event_data_counter = itertools.count()
+
+# Random, so that other data strings can't be mistaken for references to the dict above
+_EVENT_DATA_PREFIX = f"<porcupine-event-data-{secrets.token_hex(8)}>"
+
+
+def _get_event_data_object(data_string: str) -> EventDataclass | None:
+    if not data_string.startswith(_EVENT_DATA_PREFIX):
+        return None
+    token = data_string.rpartition("#")[2]
+    return _event_data_objects.get(int(token)) if token.isdigit() else None
+
+
+# Cached, because data_class() is called once for every bound callback
+@functools.lru_cache(maxsize=16)
+def _parse_json_event_data(T: type, data_string: str) -> object:
+    assert data_string.startswith(T.__name__ + "{")
+    return dacite.from_dict(T, json.loads(data_string[len(T.__name__) :]))
+
+
 if TYPE_CHECKING:
     _Event = tkinter.Event[tkinter.Misc]
 else:
@@ -420,16 +510,28 @@ class EventWithData(_Event):
     #: then this is that string.
     data_string: str
 
+    # Keeps the dataclass alive as long as the event object, see EventDataclass.__str__
+    _data_object: EventDataclass | None
+
     def data_class(self, T: Type[_T]) -> _T:
         """
         If a dataclass instance of type ``T`` was passed as ``data`` to
-        ``event_generate()``, then this returns a copy of it. Otherwise this
-        raises an error.
+        ``event_generate()``, then this returns it. Otherwise this raises an
+        error.
 
+        The returned object is shared with other callbacks handling the same
+        event, and you shouldn't modify it.
         ``T`` must be a dataclass that inherits from :class:`EventDataclass`.
         """
-        assert self.data_string.startswith(T.__name__ + "{")
-        result = dacite.from_dict(T, json.loads(self.data_string[len(T.__name__) :]))
+        result: object
+        if self._data_object is not None:
+            result = self._data_object
+        elif self.data_string.startswith(_EVENT_DATA_PREFIX + T.__name__ + "#"):
+            raise RuntimeError(
+                f"{T.__name__} object was garbage collected, maybe use to_json_string()?"
+            )
+        else:
+            result = _parse_json_event_data(cast(type, T), self.data_string)
         assert isinstance(result, T)
         return result
 
@@ -477,6 +579,7 @@ def bind_with_data(
         event.__class__ = EventWithData  # evil haxor muhaha
         assert isinstance(event, EventWithData)
         event.data_string = data_string
+        event._data_object = _get_event_data_object(data_string)
         return callback(event)  # may return 'break'
 
     # tkinter's bind() ignores the add argument when the callback is a string :(
@@ -102,7 +102,8 @@ def porcusession(monkeypatch_dirs):
     try:
         # --verbose here doesn't work for whatever reason
         # I tried to make it work, but then pytest caplog fixture didn't work
-        sys.argv[1:] = ["--shuffle-plugins"]
+        # lazy plugins would be loaded in mainloop(), which does nothing here
+        sys.argv[1:] = ["--shuffle-plugins", "--no-lazy-plugins"]
         tkinter.Tk.mainloop = lambda self: None
         main()
     finally:
@@ -2,6 +2,7 @@ import logging
 from pathlib import Path
 
 from porcupine import settings
+from porcupine.plugins import editorconfig
 from porcupine.plugins.editorconfig import apply_config, get_config, glob_match
 
 
@@ -111,6 +112,31 @@ def test_example_file_from_editorconfig_org():
     }
 
 
+def test_many_files_in_deep_tree(tmp_path, mocker):
+    (tmp_path / ".editorconfig").write_text("root = true\n[*]\nend_of_line = lf\n")
+    directories = [tmp_path]
+    for i in range(20):
+        directories.append(directories[-1] / f"dir{i}")
+        directories[-1].mkdir()
+        if i % 5 == 0:
+            (directories[-1] / ".editorconfig").write_text(f"[*.py]\nindent_size = {i + 1}\n")
+
+    parse_spy = mocker.spy(editorconfig, "parse_file")
+    configs = [get_config(directories[i % 21] / f"file{i}.py") for i in range(3000)]
+    assert parse_spy.call_count == 5  # each file parsed only once
+
+    assert configs[0] == {"end_of_line": "lf"}
+    assert configs[1] == {"end_of_line": "lf", "indent_size": "1"}
+    assert configs[20] == {"end_of_line": "lf", "indent_size": "16"}
+
+    # Editing an .editorconfig takes effect after the cache is cleared, which
+    # happens whenever files might have changed (e.g. on save)
+    (tmp_path / "dir0" / ".editorconfig").write_text("[*.py]\nindent_size = 123\n")
+    editorconfig.clear_cache()
+    assert get_config(directories[1] / "foo.py") == {"end_of_line": "lf", "indent_size": "123"}
+    assert parse_spy.call_count == 6
+
+
 def test_good_values(filetab):
     apply_config(
         {
@@ -104,6 +104,20 @@ def test_slash_in_filename_patterns(custom_filetypes, caplog, tmp_path):
             assert "/" not in pattern
 
 
+def test_guess_filetype_from_path(tmp_path):
+    def filetype_name(path):
+        filetype = filetypes.guess_filetype_from_path(path)
+        return None if filetype is None else filetype["filetype_name"]
+
+    assert filetype_name(tmp_path / "foo.py") == "Python"
+    assert filetype_name(tmp_path / "foo.tar.py") == "Python"
+    assert filetype_name(tmp_path / "foo.py.bak") is None
+    assert filetype_name(tmp_path / "Makefile") == "Makefile"
+    assert filetype_name(tmp_path / "Makefile.am") == "Makefile"
+    assert filetype_name(tmp_path / "NotMakefile") is None
+    assert filetype_name(tmp_path / "Makefile" / "foo.c") == "C"
+
+
 @pytest.mark.skipif(shutil.which("clangd") is None, reason="example config uses clangd")
 def test_cplusplus_toml_bug(tmp_path, tabmanager, custom_filetypes):
     (tmp_path / "foo.cpp").touch()
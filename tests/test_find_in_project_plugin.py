@@ -0,0 +1,102 @@
+import re
+import time
+
+from porcupine.plugins import find_in_project
+
+
+def compile_regex(query, *, full_words=False, ignore_case=False):
+    regex = find_in_project._build_regex(query, full_words=full_words, ignore_case=ignore_case)
+    return re.compile(regex.encode("utf-8"))
+
+
+def test_search_files(tmp_path):
+    (tmp_path / "a.txt").write_text("hello world\nöö hello\n", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("nothing here\n")
+    (tmp_path / "empty.txt").write_text("")
+    (tmp_path / "binary.dat").write_bytes(b"hello\0world")
+    paths = sorted(tmp_path.iterdir())
+
+    [result] = find_in_project._search_files(paths, compile_regex("hello"))
+    assert result.path == tmp_path / "a.txt"
+    assert [(m.line, m.column, m.length, m.line_text) for m in result.matches] == [
+        (1, 0, 5, "hello world"),
+        (2, 3, 5, "öö hello"),
+    ]
+
+    # Searching happens in another process, so everything must be picklable
+    future = find_in_project._get_pool().submit(
+        find_in_project._search_files, paths, compile_regex("HELLO", ignore_case=True)
+    )
+    assert future.result(timeout=30) == [result]
+
+
+def test_full_words(tmp_path):
+    (tmp_path / "a.txt").write_text("foo foobar foo_bar\n")
+    [result] = find_in_project._search_files(
+        [tmp_path / "a.txt"], compile_regex("foo", full_words=True)
+    )
+    assert [m.column for m in result.matches] == [0]
+
+
+def test_replace_in_file(tmp_path):
+    (tmp_path / "a.txt").write_text("Hello hello\\1\n")
+    count = find_in_project._replace_in_file(
+        tmp_path / "a.txt", compile_regex("hello", ignore_case=True), b"\\1bye"
+    )
+    assert count == 2
+    assert (tmp_path / "a.txt").read_text() == "\\1bye \\1bye\\1\n"
+
+
+def wait_until(tab, condition):
+    end = time.monotonic() + 30
+    while not condition():
+        assert time.monotonic() < end
+        tab.update()
+
+
+def search(tabmanager, tmp_path, query):
+    find_tab = tabmanager.add_tab(find_in_project.FindInProjectTab(tabmanager, tmp_path))
+    find_tab.find_entry.insert(0, query)
+    find_tab.start_search()
+    wait_until(find_tab, lambda: find_tab.statuslabel["text"].startswith("Found"))
+    return find_tab
+
+
+def test_replace_all(tabmanager, tmp_path, mocker):
+    (tmp_path / "disk.txt").write_text("foo bar foo\n")
+    (tmp_path / "open.txt").write_text("foo\n")
+    (tmp_path / "other.txt").write_text("bar\n")
+    filetab = tabmanager.open_file(tmp_path / "open.txt")
+    filetab.textwidget.insert("1.0", "unsaved ")
+
+    find_tab = search(tabmanager, tmp_path, "foo")
+    assert find_tab.statuslabel["text"] == "Found 3 matches in 2 files."
+    assert str(find_tab.replace_all_button["state"]) == "normal"
+
+    askyesno = mocker.patch("tkinter.messagebox.askyesno", return_value=True)
+    find_tab.replace_entry.insert(0, "baz")
+    find_tab.replace_all()
+    assert "Replace 3 matches in 2 files with 'baz'?" in askyesno.call_args.args
+
+    # The file opened in Porcupine is changed in the editor, and searching
+    # again finds it on disk where it wasn't changed
+    wait_until(find_tab, lambda: find_tab.statuslabel["text"].startswith("Found"))
+    assert find_tab.statuslabel["text"] == "Found 1 matches in 1 files."
+    assert (tmp_path / "disk.txt").read_text() == "baz bar baz\n"
+    assert (tmp_path / "open.txt").read_text() == "foo\n"
+    assert filetab.textwidget.get("1.0", "end - 1 char") == "unsaved baz\n"
+    assert (tmp_path / "other.txt").read_text() == "bar\n"
+
+
+def test_too_many_matches(tabmanager, tmp_path, mocker):
+    mocker.patch.object(find_in_project, "MAX_MATCHES", 2)
+    (tmp_path / "a.txt").write_text("foo foo foo\n")
+
+    find_tab = search(tabmanager, tmp_path, "foo")
+    assert find_tab.statuslabel["text"].startswith("Found too many matches. Showing the first 2.")
+    assert str(find_tab.replace_all_button["state"]) == "disabled"
+
+    askyesno = mocker.patch("tkinter.messagebox.askyesno", return_value=True)
+    find_tab.replace_all()
+    askyesno.assert_not_called()
+    assert (tmp_path / "a.txt").read_text() == "foo foo foo\n"
@@ -0,0 +1,80 @@
+from porcupine import get_tab_manager, utils
+from porcupine.plugins import go_to_symbol
+from porcupine.plugins.go_to_symbol import index
+
+
+def test_find_symbols(tmp_path):
+    finder = index._SymbolFinder("c")
+    [symbol] = finder.find_symbols(
+        tmp_path / "foo.c", "/* ö */ int main(void) {}\n".encode("utf-8")
+    )
+    assert symbol == index.Symbol("main", "function", tmp_path / "foo.c", 1, 12)
+
+
+def get_names(project_index, query):
+    return [symbol.name for symbol in project_index.search(query)]
+
+
+def test_index_and_search(tmp_path):
+    (tmp_path / "a.py").write_text("class FooBar:\n    def foo(self): pass\n\ndef fb(): pass\n")
+    (tmp_path / "b.py").write_text("def oof(): pass\n")
+    (tmp_path / "notes.txt").write_text("def not_a_symbol(): pass\n")
+
+    project_index = index.ProjectIndex(tmp_path)
+    project_index.rescan()
+    assert get_names(project_index, "fb") == ["fb", "FooBar"]
+    assert get_names(project_index, "F O O") == ["foo", "FooBar"]
+    assert get_names(project_index, "o") == ["oof", "foo", "FooBar"]
+    assert get_names(project_index, "symbol") == []
+
+    [oof] = project_index.search("oof")
+    assert (oof.path, oof.line, oof.column) == (tmp_path / "b.py", 1, 4)
+
+    (tmp_path / "b.py").write_text("def new_function(): pass\n")
+    project_index.update_file(tmp_path / "b.py")
+    assert get_names(project_index, "oof") == []
+    assert get_names(project_index, "nf") == ["new_function"]
+
+    (tmp_path / "a.py").unlink()
+    project_index.rescan()
+    assert get_names(project_index, "o") == ["new_function"]
+
+    # Symbols are loaded from the database without parsing the files again
+    (tmp_path / "b.py").write_text("this file was not parsed")
+    another_index = index.ProjectIndex(tmp_path)
+    another_index._connect()
+    assert get_names(another_index, "nf") == ["new_function"]
+
+
+def test_indexing_is_lazy(filetab, tmp_path, mocker):
+    mocker.patch.object(go_to_symbol, "_indexes", {})
+    mocker.patch.object(go_to_symbol, "_SymbolPopup")
+    rescan = mocker.patch.object(index.ProjectIndex, "request_rescan")
+
+    filetab.path = tmp_path / "foo.py"
+    filetab.save()
+    assert go_to_symbol._indexes == {}
+    rescan.assert_not_called()
+
+    get_tab_manager().select(filetab)
+    go_to_symbol.go_to_symbol()
+    assert list(go_to_symbol._indexes) == [utils.find_project_root(filetab.path)]
+    rescan.assert_called_once_with()
+
+
+def test_saving_does_not_rescan(filetab, tmp_path, mocker):
+    filetab.path = tmp_path / "foo.py"
+    go_to_symbol.get_project_index(utils.find_project_root(filetab.path))
+    go_to_symbol._rescan_if_needed()  # handle changes from before this test
+    rescan = mocker.patch.object(index.ProjectIndex, "request_rescan")
+    update = mocker.patch.object(index.ProjectIndex, "request_file_update")
+
+    filetab.save()
+    go_to_symbol._rescan_if_needed()  # don't wait for the timeout
+    update.assert_called_once_with(tmp_path / "foo.py")
+    rescan.assert_not_called()
+
+    get_tab_manager().event_generate("<<FileSystemChanged>>")
+    get_tab_manager().event_generate("<<FileSystemChanged>>")
+    go_to_symbol._rescan_if_needed()
+    assert rescan.call_count == len(go_to_symbol._indexes)
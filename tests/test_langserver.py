@@ -1,8 +1,21 @@
 # There's more langserver related tests in other files, e.g. test_jump_to_definition.py
+import json
+import logging
 import sys
 from pathlib import Path
 
-from porcupine.plugins.langserver import _file_url_to_path
+import sansio_lsp_client as lsp
+
+from porcupine import textutils
+from porcupine.plugins import underlines
+from porcupine.plugins.langserver import (
+    LangServer,
+    _Client,
+    _create_completions,
+    _DiagnosticsStore,
+    _file_url_to_path,
+    _RequestManager,
+)
 
 
 def test_file_url_to_path():
@@ -13,3 +26,108 @@ def test_file_url_to_path():
 
     for path in paths:
         assert _file_url_to_path(path.as_uri()) == path
+
+
+def test_diagnostics_move_through_unseen_changes(filetab, tmp_path, mocker):
+    filetab.path = tmp_path / "foo.txt"
+    filetab.textwidget.insert("1.0", "x = foo\n")
+    store = _DiagnosticsStore(filetab)
+    store.document_opened()
+
+    # Langserver computes diagnostics for version 1, then user adds a line
+    store.changes_sent(1, [])
+    filetab.textwidget.insert("1.0", "import os\n")
+    store.changes_sent(
+        2,
+        [
+            textutils.Change(
+                start=[1, 0], old_end=[1, 0], new_end=[2, 0], old_text="", new_text="import os\n"
+            )
+        ],
+    )
+
+    server = LangServer.__new__(LangServer)
+    server.log = logging.LoggerAdapter(logging.getLogger(__name__), {})
+    server.tabs_opened = {filetab}
+    server._diagnostics = {filetab: store}
+    mocker.patch.object(LangServer, "_is_in_langservers", return_value=True)
+
+    message = json.dumps(
+        {
+            "jsonrpc": "2.0",
+            "method": "textDocument/publishDiagnostics",
+            "params": {
+                "uri": filetab.path.as_uri(),
+                "version": 1,
+                "diagnostics": [
+                    {
+                        "range": {
+                            "start": {"line": 0, "character": 4},
+                            "end": {"line": 0, "character": 7},
+                        },
+                        "severity": lsp.DiagnosticSeverity.ERROR,
+                        "message": "undefined name 'foo'",
+                    }
+                ],
+            },
+        }
+    ).encode("utf-8")
+    client = _Client(trace="verbose", root_uri=tmp_path.as_uri())
+    for lsp_event in client.recv(b"Content-Length: %d\r\n\r\n" % len(message) + message):
+        server._handle_lsp_event(lsp_event)
+    store._show()
+
+    [underline] = underlines.get_underlines(filetab.textwidget, "diagnostics")
+    assert (underline.start, underline.end) == ("2.4", "2.7")
+    assert underline.color == "red"
+
+
+def test_create_completions_from_cached_items():
+    items = [
+        lsp.CompletionItem(label="getchar"),
+        lsp.CompletionItem(label="getchar_unlocked"),
+        lsp.CompletionItem(label="gets", insertText="gets"),
+    ]
+
+    # Langserver was asked when the user had typed "get", and now there's "getc"
+    completions = _create_completions(items, "3.8", "getc", requested_word="get")
+    assert [c.display_text for c in completions] == ["getchar", "getchar_unlocked"]
+    assert {c.replace_start for c in completions} == {"3.4"}
+    assert [c.filter_text for c in completions] == ["har", "har_unlocked"]
+
+    # Without requested_word, nothing is filtered, just like with a fresh response
+    assert len(_create_completions(items, "3.8", "getc")) == 3
+
+
+def test_request_manager():
+    class FakeClient:
+        def __init__(self):
+            self.cancelled = []
+
+        def _send_notification(self, method, params):
+            assert method == "$/cancelRequest"
+            self.cancelled.append(params["id"])
+
+    client = FakeClient()
+    manager = _RequestManager(client, logging.LoggerAdapter(logging.getLogger(__name__), {}))
+    request_ids = iter(range(100))
+
+    # Same position and version twice: only one request is sent
+    manager.send("hover", "tab", 1, "1.2", lambda: next(request_ids), location="1.2")
+    manager.send("hover", "tab", 1, "1.2", lambda: next(request_ids), location="1.2")
+    assert manager.stats["hover"].sent == 1
+    assert manager.stats["hover"].deduplicated == 1
+
+    # Different position: the old request is cancelled
+    manager.send("hover", "tab", 1, "1.5", lambda: next(request_ids), location="1.5")
+    assert client.cancelled == [0]
+
+    assert manager.response_received(0).cancelled
+    request = manager.response_received(1)
+    assert not request.cancelled
+    assert request.location == "1.5"
+    assert manager.response_received(1) is None
+
+    manager.add_hover_to_cache("tab", 1, "1.5", "hello")
+    assert manager.get_cached_hover("tab", 1, "1.5") == "hello"
+    assert manager.get_cached_hover("tab", 2, "1.5") is None
@@ -1,4 +1,10 @@
-from porcupine import pluginloader
+import logging
+import sys
+import types
+
+import pytest
+
+from porcupine import get_main_window, pluginloader
 
 
 def test_all_plugins_loaded_successfully():
@@ -32,3 +38,103 @@ def test_setup_order_bugs(monkeypatch):
         # but not the other way, autoindent must go first
         monkey.setattr(autoindent, "status", pluginloader.Status.DISABLED_BY_SETTINGS)
         assert not pluginloader.can_setup_while_running(autoindent)
+
+
+def test_load_when():
+    assert pluginloader._read_load_when("highlight") == "filetab"
+    assert pluginloader._read_load_when("autoindent") == "startup"
+
+    # tests use --no-lazy-plugins
+    [highlight] = [info for info in pluginloader.plugin_infos if info.name == "highlight"]
+    assert highlight.load_when == "startup"
+    assert highlight.status == pluginloader.Status.ACTIVE
+
+
+# Tests run with --no-lazy-plugins, so these tests use fake plugins instead
+@pytest.fixture
+def add_fake_plugin(monkeypatch):
+    infos = []
+    monkeypatch.setattr(pluginloader, "_mutable_plugin_infos", infos)
+    monkeypatch.setattr(pluginloader, "plugin_infos", infos)
+    monkeypatch.setattr(pluginloader, "_dependencies", {})
+
+    def add(name, load_when, setup, setup_after=()):
+        module = types.ModuleType(f"porcupine.plugins.{name}")
+        module.setup = setup
+        module.setup_after = list(setup_after)
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+
+        info = pluginloader.PluginInfo(
+            name=name,
+            came_with_porcupine=False,
+            status=pluginloader.Status.LOADING,
+            module=None,
+            error=None,
+            load_when=load_when,
+        )
+        infos.append(info)
+        pluginloader._dependencies[info] = set()
+        pluginloader._add_trigger(info)
+        return info
+
+    return add
+
+
+def test_lazy_loading_event_trigger(add_fake_plugin):
+    events = []
+
+    def setup_a():
+        get_main_window().bind("<<LazyTestA>>", (lambda event: events.append("a")), add=True)
+
+    a = add_fake_plugin("lazy_test_a", "event:<<LazyTestA>>", setup_a)
+    b = add_fake_plugin("lazy_test_b", "event:<<LazyTestB>>", lambda: events.append("b setup"))
+
+    get_main_window().event_generate("<<LazyTestA>>")
+    assert a.status == pluginloader.Status.ACTIVE
+    assert events == ["a"]  # event generated again after setting up
+
+    # Other deferred plugins wait for their own trigger
+    assert b.status == pluginloader.Status.LOADING
+    assert b.module is None
+
+    get_main_window().event_generate("<<LazyTestA>>")
+    assert events == ["a", "a"]
+
+
+def test_lazy_loading_setup_after(add_fake_plugin):
+    setup_order = []
+    first = add_fake_plugin("lazy_test_first", "idle", lambda: setup_order.append("first"))
+    second = add_fake_plugin(
+        "lazy_test_second",
+        "event:<<LazyTestSecond>>",
+        lambda: setup_order.append("second"),
+        setup_after=["lazy_test_first"],
+    )
+    unrelated = add_fake_plugin(
+        "lazy_test_unrelated", "event:<<LazyTestUnrelated>>", (lambda: None)
+    )
+
+    get_main_window().event_generate("<<LazyTestSecond>>")
+    assert setup_order == ["first", "second"]
+    assert first.status == pluginloader.Status.ACTIVE
+    assert second.status == pluginloader.Status.ACTIVE
+    assert unrelated.module is None
+
+
+def test_lazy_loading_setup_fails(add_fake_plugin, caplog):
+    def bad_setup():
+        raise RuntimeError("oh no")
+
+    bad = add_fake_plugin("lazy_test_bad", "event:<<LazyTestBad>>", bad_setup)
+    get_main_window().event_generate("<<LazyTestBad>>")
+
+    assert bad.status == pluginloader.Status.SETUP_FAILED
+    assert "RuntimeError: oh no" in bad.error
+    [error] = [record for record in caplog.records if record.levelno >= logging.ERROR]
+    assert error.getMessage() == "lazy_test_bad.setup() doesn't work"
+
+    # Generating the event again doesn't retry
+    caplog.clear()
+    get_main_window().event_generate("<<LazyTestBad>>")
+    assert bad.status == pluginloader.Status.SETUP_FAILED
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
@@ -40,3 +40,11 @@ def test_enable_disable_multiple(dialog_content):
     assert get_states() == ("normal", "normal")
     dialog_content.enable_button.invoke()
     assert get_states() == ("disabled", "normal")
+
+
+def test_startup_timing_shown(dialog_content):
+    dialog_content.treeview.selection_set("autoindent")
+    dialog_content.treeview.update()
+    description = dialog_content.description.get("1.0", "end - 1 char")
+    assert "Importing took " in description
+    assert "Calling setup() took " in description
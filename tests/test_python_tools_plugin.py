@@ -0,0 +1,87 @@
+import logging
+import sys
+import time
+from pathlib import Path
+
+from porcupine.plugins import python_tools
+
+
+def test_worker_process(tmp_path):
+    python = Path(sys.executable)
+    (tmp_path / "pyproject.toml").write_text("[tool.black]\nline-length = 20\n")
+
+    result = python_tools._run_in_worker(python, "black", "foo(aaaaa, bbbbb, ccccc)\n", tmp_path)
+    assert result["status"] == 0
+    assert result["stdout"] == "foo(\n    aaaaa,\n    bbbbb,\n    ccccc,\n)\n"
+
+    # Same worker process, different config
+    worker = python_tools._workers[python]
+    result = python_tools._run_in_worker(python, "black", "foo(aaaaa, bbbbb, ccccc)\n", Path.home())
+    assert python_tools._workers[python] is worker
+    assert result["stdout"] == "foo(aaaaa, bbbbb, ccccc)\n"
+
+    result = python_tools._run_in_worker(python, "isort", "import sys\nimport os\n", tmp_path)
+    assert result["stdout"] == "import os\nimport sys\n"
+
+    result = python_tools._run_in_worker(python, "black", "print(\n", tmp_path)
+    assert result["status"] != 0
+    assert "Cannot parse" in result["stderr"]
+
+
+def test_worker_dies(tmp_path):
+    python = Path(sys.executable)
+    python_tools._run_in_worker(python, "isort", "", tmp_path)
+    python_tools._workers[python].kill()
+
+    result = python_tools._run_in_worker(python, "isort", "import sys\nimport os\n", tmp_path)
+    assert result["stdout"] == "import os\nimport sys\n"
+    assert python not in python_tools._workers  # new worker is started next time
+
+
+def test_format_selected_lines(tmp_path):
+    python = Path(sys.executable)
+    code = "import os\n\n\ndef foo():\n    x=[1,2]\n    y  =  3\n    return x\n"
+
+    # Lines start at 0, format lines "x=[1,2]" and "y  =  3"
+    result = python_tools._format(python, ["isort", "black"], code, 4, 6, tmp_path)
+    assert result.new_text == code.replace("x=[1,2]", "x = [1, 2]").replace("y  =  3", "y = 3")
+    assert result.diff == [(4, 6, 4, 6)]
+
+    # Whole file
+    result = python_tools._format(python, ["black"], code, 0, 7, tmp_path)
+    assert result.new_text == code.replace("x=[1,2]", "x = [1, 2]").replace("y  =  3", "y = 3")
+
+    result = python_tools._format(python, ["black"], "print(\n", 0, 1, tmp_path)
+    assert result.tool == "black"
+    assert "Cannot parse" in result.stderr
+
+
+def test_format_on_save(filetab, tmp_path, monkeypatch):
+    monkeypatch.setattr(python_tools, "FORMAT_ON_SAVE_TIMEOUT", 30)  # worker may be slow to start
+    filetab.path = tmp_path / "foo.py"
+    filetab.settings.set("formatters", ["black"])
+    filetab.settings.set("format_on_save", True)
+    filetab.textwidget.insert("1.0", "x=1\n")
+
+    filetab.save()
+    assert (tmp_path / "foo.py").read_text() == "x = 1\n"
+    assert filetab.textwidget.get("1.0", "end - 1 char") == "x = 1\n"
+    assert not filetab.has_unsaved_changes()
+
+
+def test_format_on_save_timeout(filetab, tmp_path, monkeypatch, caplog):
+    def slow_format(*args):
+        time.sleep(0.5)
+        return python_tools._FormatResult("formatted\n", [(0, 1, 0, 1)])
+
+    monkeypatch.setattr(python_tools, "FORMAT_ON_SAVE_TIMEOUT", 0.05)
+    monkeypatch.setattr(python_tools, "_format", slow_format)
+    filetab.path = tmp_path / "foo.py"
+    filetab.settings.set("formatters", ["black"])
+    filetab.settings.set("format_on_save", True)
+    filetab.textwidget.insert("1.0", "x=1\n")
+
+    with caplog.at_level(logging.WARNING):
+        filetab.save()
+    assert (tmp_path / "foo.py").read_text() == "x=1\n"
+    assert "saving" in caplog.text and "without formatting" in caplog.text
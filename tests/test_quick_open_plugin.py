@@ -0,0 +1,127 @@
+from porcupine import get_tab_manager
+from porcupine.plugins import quick_open
+
+
+def create_project_files(tmp_path, paths):
+    project_files = quick_open.ProjectFiles(tmp_path)
+    project_files._search_data = quick_open._SearchData.create(paths)
+    return project_files
+
+
+def test_search_order(tmp_path):
+    project_files = create_project_files(
+        tmp_path,
+        [
+            "docs/directory_tree.rst",
+            "porcupine/plugins/directory_tree.py",
+            "porcupine/plugins/run/dialog.py",
+            "tests/test_directory_tree_plugin.py",
+            "dirtr/README.md",
+        ],
+    )
+    assert project_files.search("dirtr") == [
+        "dirtr/README.md",
+        "porcupine/plugins/directory_tree.py",
+        "docs/directory_tree.rst",
+        "tests/test_directory_tree_plugin.py",
+    ]
+    assert project_files.search("run/dia") == ["porcupine/plugins/run/dialog.py"]
+    assert project_files.search("plugins\\dirtree") == ["porcupine/plugins/directory_tree.py"]
+    assert project_files.search("xyz") == []
+
+    project_files.file_opened(tmp_path / "tests" / "test_directory_tree_plugin.py")
+    assert project_files.search("") == ["tests/test_directory_tree_plugin.py"]
+    assert project_files.search("dirtr")[0] == "tests/test_directory_tree_plugin.py"
+
+
+def test_typing_more_characters(tmp_path):
+    project_files = create_project_files(
+        tmp_path, [f"dir{n}/file{n}.py" for n in range(200)] + ["foo/bar.py", "foo/baz.py"]
+    )
+    assert project_files.search("fbar") == ["foo/bar.py"]
+    assert project_files._narrowed is not None
+    assert project_files.search("fbarpy") == ["foo/bar.py"]
+    assert project_files.search("fbaz") == ["foo/baz.py"]
+
+
+def test_save_and_load(tmp_path):
+    project_files = create_project_files(tmp_path, ["a.py", "b.py"])
+    project_files._loaded = True
+    project_files.file_opened(tmp_path / "b.py")
+    quick_open.write_pool.submit(lambda: None).result()
+
+    paths, recent, search_data = quick_open.ProjectFiles(tmp_path)._load()
+    assert paths == ["a.py", "b.py"]
+    assert recent == ["b.py"]
+    assert search_data.paths == ["a.py", "b.py"]
+
+
+def test_refresh_with_same_files(tmp_path, mocker):
+    project_files = create_project_files(tmp_path, ["a.py", "b.py"])
+    project_files._loaded = True
+    assert project_files.search("a") == ["a.py"]
+    narrowed = project_files._narrowed
+    assert narrowed is not None
+
+    save_later = mocker.patch.object(project_files, "_save_later")
+    project_files._set_paths(["b.py", "a.py"], quick_open._SearchData.create(["b.py", "a.py"]))
+    assert project_files._narrowed is narrowed
+    save_later.assert_not_called()
+
+    project_files._set_paths(["a.py"], quick_open._SearchData.create(["a.py"]))
+    assert project_files._narrowed is None
+    save_later.assert_called_once()
+
+
+def test_files_are_listed_lazily(filetab, tmp_path, mocker):
+    mocker.patch.object(quick_open, "_project_files", {})
+    popup = mocker.patch.object(quick_open, "_QuickOpenPopup")
+    list_files = mocker.patch.object(
+        quick_open.ProjectFiles, "_list_files", return_value=([], quick_open._SearchData.create([]))
+    )
+    load = mocker.patch.object(quick_open.ProjectFiles, "_load", return_value=None)
+
+    filetab.path = tmp_path / "foo.py"
+    [project_files] = quick_open._project_files.values()
+    assert project_files.recent == ["foo.py"]
+    quick_open._refresh_now()
+    filetab.update()
+    list_files.assert_not_called()
+    load.assert_not_called()
+
+    get_tab_manager().select(filetab)
+    quick_open.quick_open()
+    popup.assert_called_once_with(project_files)
+    assert project_files.loading
+    while project_files.loading:
+        filetab.update()
+    load.assert_called_once_with()
+    list_files.assert_called_once_with()
+
+
+def test_file_list_changes_while_searching(tmp_path):
+    project_files = create_project_files(tmp_path, ["foo/bar.py", "foo/baz.py"])
+    assert project_files.search("fba") == ["foo/bar.py", "foo/baz.py"]
+    assert project_files._narrowed is not None
+
+    # Like when refreshing finishes while a search thread is running
+    project_files._search_data = quick_open._SearchData.create(["foo/bat.py"])
+    assert project_files.search("fbat") == ["foo/bat.py"]
+
+
+def test_typing_fast_searches_once(tabmanager, tmp_path, mocker):
+    project_files = create_project_files(tmp_path, ["foo/bar.py", "baz.py"])
+    project_files._listed = True
+    search = mocker.spy(project_files, "search")
+
+    popup = quick_open._QuickOpenPopup(project_files)
+    for query in ["b", "ba", "bar"]:
+        popup._query_var.set(query)
+    while popup._searching or popup._search_again:
+        popup.window.update()
+
+    assert [call.args for call in search.call_args_list] == [("",), ("bar",)]
+    assert [popup._treeview.item(item, "text") for item in popup._treeview.get_children()] == [
+        "bar.py"
+    ]
+    popup.window.destroy()
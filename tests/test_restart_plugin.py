@@ -1,8 +1,13 @@
+import json
+import os
+
+import psutil
 import pytest
 
 from porcupine import get_tab_manager, quit
+from porcupine.plugins import restart
 from porcupine.settings import global_settings
-from porcupine.tabs import Tab
+from porcupine.tabs import FileTab, Tab
 
 
 @pytest.fixture
@@ -53,3 +58,123 @@ def test_quit_with_remember_tabs_on_restart(mocker):
     quit()
     mocked_destroy.assert_called_once_with()
     assert len(get_tab_manager().tabs()) == 0
+
+
+def test_placeholder_tabs(tabmanager, tmp_path):
+    (tmp_path / "a.py").write_text("print('a')\n")
+    (tmp_path / "b.py").write_text("print('b')\n")
+    tab_a = tabmanager.open_file(tmp_path / "a.py")
+    tab_b = tabmanager.open_file(tmp_path / "b.py")
+    state_dicts = [
+        {"tab_type": FileTab, "tab_state": tab.get_state(), "selected": False}
+        for tab in [tab_a, tab_b]
+    ]
+    tabmanager.close_tab(tab_a)
+    tabmanager.close_tab(tab_b)
+
+    placeholder_a = restart.PlaceholderTab(tabmanager, state_dicts[0])
+    placeholder_b = restart.PlaceholderTab(tabmanager, state_dicts[1])
+    tabmanager.add_tab(placeholder_a, select=False)
+    tabmanager.add_tab(placeholder_b, select=False)
+    assert tabmanager.tabs() == (placeholder_a, placeholder_b)
+
+    # Loading replaces the placeholder and keeps the order of tabs
+    restart.load_placeholder(placeholder_a)
+    [new_tab_a, still_placeholder_b] = tabmanager.tabs()
+    assert isinstance(new_tab_a, FileTab)
+    assert new_tab_a.path == tmp_path / "a.py"
+    assert new_tab_a.textwidget.get("1.0", "end - 1 char") == "print('a')\n"
+    assert not new_tab_a.has_unsaved_changes()
+    assert still_placeholder_b is placeholder_b
+
+    # Opening the file replaces the placeholder too
+    new_tab_b = tabmanager.open_file(tmp_path / "b.py")
+    assert tabmanager.tabs() == (new_tab_a, new_tab_b)
+
+
+def test_session_journal(tabmanager, tmp_path):
+    (tmp_path / "saved.py").write_text("print('saved')\n")
+    (tmp_path / "unsaved.py").write_text("print('unsaved')\n")
+    saved = tabmanager.open_file(tmp_path / "saved.py")
+    unsaved = tabmanager.open_file(tmp_path / "unsaved.py")
+    unsaved.textwidget.insert("end", "# not saved yet\n")
+
+    restart.save_tab(saved)
+    restart.save_tab(unsaved)
+    ids = restart.write_index()
+    assert ids == [restart.record_ids[saved], restart.record_ids[unsaved]]
+    restart.write_pool.submit(lambda: None).result()
+    journal = restart.journal
+
+    # Content is stored only for tabs with unsaved changes
+    saved_record = journal.read_record(restart.record_ids[saved])
+    unsaved_record = journal.read_record(restart.record_ids[unsaved])
+    assert saved_record["content_blob"] is None
+    assert unsaved_record["tab_state"].content is None
+    assert journal.read_blob(unsaved_record["content_blob"]) == (
+        "print('unsaved')\n# not saved yet\n"
+    )
+
+    [saved_dict, unsaved_dict] = restart._read_session()
+    assert not saved_dict["selected"]
+    assert unsaved_dict["selected"]
+    assert saved_dict["tab_state"].content is None
+    assert unsaved_dict["tab_state"].content == "print('unsaved')\n# not saved yet\n"
+
+    # Closing the tab and quitting deletes its files
+    unsaved_blob = unsaved_record["content_blob"]
+    tabmanager.close_tab(unsaved)
+    restart.write_pool.submit(journal.delete_unused_files, restart.write_index()).result()
+    assert not (journal.directory / "blobs" / f"{unsaved_blob}.gz").exists()
+    assert [path.stem for path in (journal.directory / "tabs").iterdir()] == [
+        restart.record_ids[saved]
+    ]
+
+
+def test_replaced_blobs_are_deleted(tmp_path):
+    journal = restart.SessionJournal(tmp_path)
+    journal.write_record_and_content("a", {"tab_state": None}, "hello")
+    journal.write_record_and_content("b", {"tab_state": None}, "hello")
+    [hello_blob] = (tmp_path / "blobs").iterdir()
+
+    # Still used by record b
+    journal.write_record_and_content("a", {"tab_state": None}, "hello world")
+    assert hello_blob.exists()
+
+    journal.write_record_and_content("b", {"tab_state": None}, None)
+    assert not hello_blob.exists()
+    assert journal.read_blob(journal.read_record("a")["content_blob"]) == "hello world"
+    assert len(list((tmp_path / "blobs").iterdir())) == 1
+
+
+def test_deleted_record_is_written_again(tmp_path):
+    journal = restart.SessionJournal(tmp_path)
+    journal.write_record("a", {"content_blob": None})
+    (tmp_path / "tabs" / "a.pkl").unlink()
+    journal.write_record("a", {"content_blob": None})
+    assert journal.read_record("a") == {"content_blob": None}
+
+
+def test_sessions_of_other_porcupines(tmp_path, monkeypatch):
+    monkeypatch.setattr(restart, "SESSION_DIR", tmp_path)
+    running_owner = {"pid": os.getpid(), "create_time": psutil.Process().create_time()}
+    quit_owner = {"pid": os.getpid(), "create_time": 0}  # same pid reused by another process
+
+    for name, owner, index_mtime in [
+        ("running", running_owner, 3000),
+        ("newest", quit_owner, 2000),
+        ("older", quit_owner, 1000),
+    ]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "owner.json").write_text(json.dumps(owner))
+        (tmp_path / name / "index.json").write_text("{}")
+        os.utime(tmp_path / name / "index.json", (index_mtime, index_mtime))
+
+    # Continue the newest session that no running Porcupine uses
+    session_dir, to_delete = restart._claim_session_dir()
+    assert (session_dir / "index.json").stat().st_mtime == 2000
+    assert to_delete == [tmp_path / "older"]
+    assert restart._is_in_use(session_dir)
+    assert restart._is_in_use(tmp_path / "running")
+    assert not restart._is_in_use(tmp_path / "older")
+    assert {path.name for path in tmp_path.iterdir()} == {"running", "older", session_dir.name}
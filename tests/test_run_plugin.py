@@ -2,24 +2,29 @@ import os
 import shutil
 import sys
 import time
+import types
 from tkinter import ttk
 
 import pytest
 
 from porcupine import get_main_window, get_tab_manager, utils
-from porcupine.plugins.run import common, dialog, history, no_terminal, terminal
+from porcupine.plugins.run import common, dialog, history, jobs, log_viewer, no_terminal, terminal
+from porcupine.settings import global_settings
 
 
 @pytest.fixture(autouse=True)
 def isolated_history():
     # We don't overwrite the user's file because porcupine.dirs is monkeypatched
-    path = history._get_path()
-    assert not path.exists()
+    paths = [history._get_path(), history._get_journal_path()]
+    assert not any(path.exists() for path in paths)
     yield
-    try:
-        path.unlink()
-    except FileNotFoundError:
-        pass
+    history.write_pool.submit(lambda: None).result()  # wait for writing to finish
+    history._store = None
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
 
 
 @pytest.fixture
@@ -49,6 +54,63 @@ def test_external_terminal(filetab, tmp_path, fake_runner, wait_until):
     wait_until(lambda: (tmp_path / "file").exists() and (tmp_path / "file").read_text() == "hello")
 
 
+def test_history_journal(filetab, tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "COMPACT_AFTER", 3)
+    filetab.save_as(tmp_path / "hello.py")
+    ctx = common.Context(filetab, 0)
+
+    def add(command_format):
+        command = common.Command(command_format, "{folder_path}", False, ctx.get_substitutions())
+        history.add(ctx, command)
+        history.write_pool.submit(lambda: None).result()
+
+    add("python3 hello.py")
+    add("python3 -i hello.py")
+    assert not history._get_path().exists()
+    assert len(history._get_journal_path().read_text().splitlines()) == 2
+
+    # Another Porcupine process appends to the same journal
+    other_item = history._HistoryItem(
+        command=common.Command("other", "{folder_path}", False, {}),
+        use_count=1,
+        filetype_name=ctx.filetype_name,
+        key_id=0,
+    )
+    history._append_to_journal(other_item)
+
+    add("python3 hello.py")
+    assert not history._get_journal_path().exists()
+    assert [item.command.command_format for item in history._load_json_file()] == [
+        "python3 hello.py",
+        "other",
+        "python3 -i hello.py",
+    ]
+    assert history._load_json_file()[0].use_count == 2
+
+    # This process doesn't see the other process's command until restarting
+    assert history.get_command_to_repeat(ctx).command_format == "python3 hello.py"
+    assert "other" not in [c.command_format for c in history.get_commands_to_suggest(ctx)]
+    history._store = None
+    assert "other" in [c.command_format for c in history.get_commands_to_suggest(ctx)]
+
+
+def test_history_write_error(filetab, tmp_path, monkeypatch, caplog):
+    filetab.save_as(tmp_path / "hello.py")
+    ctx = common.Context(filetab, 0)
+    history._get_store()  # load before breaking the journal path
+
+    (tmp_path / "not_a_directory").touch()
+    monkeypatch.setattr(
+        history, "_get_journal_path", (lambda: tmp_path / "not_a_directory" / "journal.jsonl")
+    )
+    history.add(ctx, common.Command("python3 hello.py", "{folder_path}", False, {}))
+    history.write_pool.submit(lambda: None).result()
+
+    [record] = [r for r in caplog.records if r.levelname == "ERROR"]
+    assert record.getMessage() == "saving run history failed"
+    assert isinstance(record.exc_info[1], OSError)
+
+
 def get_output():
     return no_terminal.runner.textwidget.get("1.0", "end - 1 char")
 
@@ -324,6 +386,79 @@ time.sleep(10)
     assert end - start < 8
 
 
+def test_lots_of_output_quickly(tmp_path, wait_until):
+    # About 7MB, used to take several seconds
+    (tmp_path / "spam.py").write_text("for i in range(10**6): print(i)")
+    no_terminal.run_command(f"{utils.quote(sys.executable)} spam.py", tmp_path)
+    wait_until(lambda: "The process completed successfully." in get_output())
+
+    lines = get_output().splitlines()
+    assert len(lines) <= no_terminal.MAX_SCROLLBACK * 1.1
+    assert lines[-2] == str(10**6 - 1)
+
+
+def test_full_output_saved_to_file(tabmanager, tmp_path, wait_until):
+    (tmp_path / "spam.py").write_text(
+        f"for i in range({2 * no_terminal.MAX_SCROLLBACK}): print(i)\nprint('x' * 10**5)"
+    )
+    no_terminal.run_command(f"{utils.quote(sys.executable)} spam.py", tmp_path)
+    wait_until(lambda: "The process completed successfully." in get_output())
+
+    output_lines = get_output().splitlines()
+    assert "Open full output" in output_lines[0]
+    assert output_lines[-2] == "x" * no_terminal.MAX_LINE_LENGTH + " [...]"
+
+    viewer = no_terminal.runner.open_full_output()
+    log_lines = viewer.textwidget.get("1.0", "end - 1 char").splitlines()
+    viewer.window.destroy()
+    assert log_lines[1:-2] == [str(i) for i in range(2 * no_terminal.MAX_SCROLLBACK)]
+    assert log_lines[-2] == "x" * 10**5
+
+
+def test_log_viewer_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_viewer, "PAGE_SIZE", 10)
+    path = tmp_path / "output.txt"
+    path.write_bytes(b"abc\ndef\nghi\n0123456789abcdef\nxy\n")
+    size = path.stat().st_size
+
+    # Pages contain whole lines, unless a line doesn't fit
+    assert log_viewer.find_page_end(path, 0, size) == len(b"abc\ndef\n")
+    assert log_viewer.find_page_end(path, 8, size) == len(b"abc\ndef\nghi\n")
+    assert log_viewer.find_page_end(path, 12, size) == 22
+    assert log_viewer.find_page_end(path, 22, size) == size
+
+    assert log_viewer.find_page_start(path, size) == len(b"abc\ndef\nghi\n0123456789abcdef\n")
+    assert log_viewer.find_page_start(path, 12) == len(b"abc\n")
+    assert log_viewer.find_page_start(path, 8) == 0
+
+
+def test_old_output_logs_deleted(tmp_path, monkeypatch):
+    monkeypatch.setattr(no_terminal, "OUTPUT_LOG_DIR", tmp_path)
+    monkeypatch.setattr(no_terminal, "KEEP_OUTPUT_LOGS", 3)
+    paths = [tmp_path / f"{n}.txt" for n in range(5)]
+    for n, path in enumerate(paths):
+        path.write_text("")
+        os.utime(path, (1000 + n, 1000 + n))
+
+    # The oldest log is shown in a runner, and its command may be still running
+    in_use = types.SimpleNamespace(executor=types.SimpleNamespace(output_log_path=paths[0]))
+    monkeypatch.setattr(no_terminal, "runners", [in_use])
+
+    new_path = no_terminal._create_output_log_path()
+    assert sorted(tmp_path.iterdir()) == [paths[0], paths[3], paths[4]]
+
+    # Zero-padded counter, so that the file names sort correctly
+    counter = new_path.stem.rsplit("_", 1)[1]
+    assert counter.isdigit() and len(counter) == 6
+
+
+def test_shorten_long_lines(monkeypatch):
+    monkeypatch.setattr(no_terminal, "MAX_LINE_LENGTH", 5)
+    assert no_terminal.shorten_long_lines("abc\n1234567\nxy", 0) == ("abc\n12345 [...]\nxy", 2)
+    assert no_terminal.shorten_long_lines("abcd", 3) == ("ab [...]", 7)
+    assert no_terminal.shorten_long_lines("ef\nok", 7) == ("\nok", 2)
+
+
 def test_crlf_on_any_platform(tmp_path, wait_until):
     (tmp_path / "crlf.py").write_text(r"import sys; sys.stdout.buffer.write(b'foo\r\nbar')")
     no_terminal.run_command(f"{utils.quote(sys.executable)} crlf.py", tmp_path)
@@ -497,3 +632,91 @@ while True:
     start = int(lines[0])
     assert start > 0
     assert lines == [str(i) for i in range(start, start + len(lines))]
+
+
+@pytest.fixture
+def close_job_tabs():
+    yield
+    for runner in no_terminal.runners.copy():
+        if runner is not no_terminal.runner:
+            runner.hide_button.event_generate("<Button-1>")
+
+
+def test_parallel_jobs(tmp_path, wait_until, close_job_tabs):
+    # Each command runs until the test creates a file, so timing doesn't matter
+    (tmp_path / "waiter.py").write_text(
+        "import os, sys, time\n"
+        "open(sys.argv[1] + '.started', 'w').close()\n"
+        "while not os.path.exists(sys.argv[1] + '.done'):\n"
+        "    time.sleep(0.01)\n"
+    )
+
+    def command(name):
+        return f"{utils.quote(sys.executable)} waiter.py {name}"
+
+    first = jobs.run_command(command("first"), tmp_path, jobs.PARALLEL)
+    second = jobs.run_command(command("second"), tmp_path, jobs.PARALLEL)
+    queued = jobs.run_command(command("queued"), tmp_path, jobs.QUEUE)
+    assert first.runner is not second.runner
+    assert (first.status, second.status, queued.status) == ("running", "running", "waiting")
+
+    # Both processes run at the same time, and neither can finish yet
+    wait_until(lambda: (tmp_path / "first.started").exists())
+    wait_until(lambda: (tmp_path / "second.started").exists())
+    wait_until(lambda: first.runner.executor.running and second.runner.executor.running)
+    assert (first.status, second.status, queued.status) == ("running", "running", "waiting")
+    assert not (tmp_path / "queued.started").exists()
+
+    # The queued job waits only for the job added just before it
+    (tmp_path / "second.done").touch()
+    wait_until(lambda: second.status == "succeeded")
+    assert (first.status, queued.status) == ("running", "running")
+
+    (tmp_path / "first.done").touch()
+    (tmp_path / "queued.done").touch()
+    wait_until(lambda: first.status == "succeeded")
+    wait_until(lambda: queued.status == "succeeded")
+
+
+def test_stopped_before_process_starts(tmp_path, monkeypatch):
+    # The thread doesn't get to start the process before stopping
+    monkeypatch.setattr(no_terminal.Executor, "_thread_target", (lambda self, command, env: None))
+    job = jobs.run_command("echo hello", tmp_path, jobs.STOP_PREVIOUS)
+    assert job.status == "running"
+
+    no_terminal.runner.stop_button.event_generate("<Button-1>")
+    assert job.status == "failed"
+    assert job not in jobs._jobs  # doesn't count against max_parallel_jobs
+
+
+def test_max_parallel_jobs(tmp_path, wait_until, close_job_tabs):
+    (tmp_path / "sleeper.py").write_text("import time; time.sleep(0.5)")
+    command = f"{utils.quote(sys.executable)} sleeper.py"
+
+    old_value = global_settings.get("max_parallel_jobs", int)
+    global_settings.set("max_parallel_jobs", 1)
+    try:
+        first = jobs.run_command(command, tmp_path, jobs.PARALLEL)
+        second = jobs.run_command(command, tmp_path, jobs.PARALLEL)
+        assert (first.status, second.status) == ("running", "waiting")
+        wait_until(lambda: second.status == "running")
+        assert first.status == "succeeded"
+    finally:
+        global_settings.set("max_parallel_jobs", old_value)
+
+
+def test_chained_jobs(tmp_path, wait_until, close_job_tabs):
+    (tmp_path / "fail.py").write_text("import sys; sys.exit(1)")
+    (tmp_path / "hello.py").write_text("print('hello')")
+
+    build = jobs.run_command(f"{utils.quote(sys.executable)} fail.py", tmp_path, jobs.CHAIN)
+    test = jobs.run_command(f"{utils.quote(sys.executable)} hello.py", tmp_path, jobs.CHAIN)
+    assert test.status == "waiting"
+    wait_until(lambda: test.status == "cancelled")
+    assert build.status == "failed"
+    assert "Not running" in test.runner.textwidget.get("1.0", "end")
+
+    # The failed command doesn't prevent running more commands
+    test = jobs.run_command(f"{utils.quote(sys.executable)} hello.py", tmp_path, jobs.CHAIN)
+    wait_until(lambda: test.status == "succeeded")
+    assert "hello" in test.runner.textwidget.get("1.0", "end")
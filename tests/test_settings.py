@@ -10,7 +10,7 @@ from typing import Optional
 import dacite
 import pytest
 
-from porcupine import settings, utils
+from porcupine import dirs, settings, utils
 from porcupine.settings import global_settings
 
 
@@ -207,6 +207,43 @@ def test_font_family_chooser():
     assert families == sorted(families), "wrong order"
 
 
+def test_font_family_chooser_with_fontconfig(monkeypatch):
+    [family, *junk] = sorted(tkinter.font.families())
+    monkeypatch.setattr(settings, "_uses_fontconfig", (lambda: True))
+    monkeypatch.setattr(settings, "_get_fontconfig_cache_timestamp", (lambda: 123.0))
+    monkeypatch.setattr(
+        settings, "_find_monospace_families_with_fontconfig", (lambda: {family, "Not installed"})
+    )
+    assert settings._get_monospace_font_families() == [family]
+
+    # Should now come from cache
+    monkeypatch.setattr(settings, "_find_monospace_families_with_fontconfig", (lambda: set()))
+    assert settings._get_monospace_font_families() == [family]
+
+    # Should notice when fonts are installed
+    monkeypatch.setattr(settings, "_get_fontconfig_cache_timestamp", (lambda: 456.0))
+    assert settings._get_monospace_font_families() == []
+
+    (dirs.user_cache_path / "font_cache.json").unlink()
+
+
+def test_add_custom_widgets():
+    calls = []
+    settings.add_custom_widgets(lambda: calls.append(settings.get_dialog_content()))
+    content = settings.get_dialog_content()  # creates the dialog if not created yet
+    assert calls == [content]
+
+
+def test_widget_callback():
+    content = settings.get_dialog_content()
+    labels = []
+    settings.add_label("Hello", widget_callback=labels.append)
+    [label] = labels  # created right away, because the dialog already exists
+    assert label["text"] == "Hello"
+    assert label.master is content
+    label.destroy()
+
+
 @pytest.fixture
 def toplevel():
     toplevel = tkinter.Toplevel()
@@ -1,9 +1,19 @@
+import gc
 import tkinter
 
 import pytest
 
-from porcupine import get_main_window, utils
-from porcupine.textutils import Change, Changes, change_batch, create_peer_widget, track_changes
+from porcupine import get_main_window, textutils, utils
+from porcupine.textutils import (
+    Change,
+    Changes,
+    change_batch,
+    create_peer_widget,
+    diff_lines,
+    replace_text_with_diff,
+    request_old_text,
+    track_changes,
+)
 
 
 @pytest.fixture(scope="function")
@@ -115,6 +125,25 @@ def test_undo(text_and_events):
     ]
 
 
+def test_changes_not_garbage_collected(text_and_events):
+    text, events = text_and_events
+    new_texts = []
+
+    def on_change(event):
+        gc.collect()
+        new_texts.append(event.data_class(Changes).change_list[0].new_text)
+
+    utils.bind_with_data(text, "<<ContentChanged>>", on_change, add=True)
+    text.tk.call("tk::TextInsert", text, "a")  # the <Key> binding does this
+    text.insert("end", "b")
+    text.update()
+
+    assert new_texts == ["a", "b"]
+    assert not textutils._change_trackers[text]._pending_change_events
+    assert [event.data_class(Changes).change_list[0].new_text for event in events] == ["a", "b"]
+    events.clear()
+
+
 def test_track_changes_twice():
     text = tkinter.Text(get_main_window())
     track_changes(text)
@@ -213,3 +242,91 @@ def test_embedded_window(text_and_events):
     assert events.pop().data_class(Changes).change_list == [
         Change(start=[1, 3], old_end=[1, 3], new_end=[1, 6], old_text="", new_text="xyz")
     ]
+
+
+def test_whole_document_replaced(text_and_events):
+    text, events = text_and_events
+    text.insert("1.0", "hello\nworld")
+    assert not events.pop().data_class(Changes).whole_document_replaced
+
+    text.replace("1.0", "end - 1 char", "hi")
+    changes = events.pop().data_class(Changes)
+    assert changes.whole_document_replaced
+    assert changes.change_list == [
+        Change(start=[1, 0], old_end=[2, 5], new_end=[1, 2], old_text="hello\nworld", new_text="hi")
+    ]
+
+    with change_batch(text):
+        text.insert("end", "!")
+        text.delete("1.0", "end")
+    changes = events.pop().data_class(Changes)
+    assert changes.whole_document_replaced
+    assert changes.change_list[-1].old_text == "hi!"
+
+
+def test_lazy_old_text():
+    text = tkinter.Text(get_main_window())
+    track_changes(text, lazy_old_text=True)
+    events = []
+    utils.bind_with_data(text, "<<ContentChanged>>", events.append, add=True)
+
+    text.insert("1.0", "hello world")
+    text.delete("1.0", "1.6")
+    assert events.pop().data_class(Changes).change_list[0].old_text == "hello "
+    text.delete("1.0", "end")
+    assert events.pop().data_class(Changes).change_list == [
+        Change(start=[1, 0], old_end=[1, 5], new_end=[1, 0], old_text="", new_text="")
+    ]
+
+    request_old_text(text)
+    text.insert("1.0", "hello")
+    text.delete("1.0", "end")
+    assert events.pop().data_class(Changes).change_list[0].old_text == "hello"
+
+
+def test_diff_lines():
+    assert diff_lines(["a", "b", "c"], ["a", "b", "c"]) == []
+    assert diff_lines(["a", "b", "c"], ["a", "x", "c"]) == [(1, 2, 1, 2)]
+    assert diff_lines(["a", "b", "c", "d"], ["b", "c", "d", "e"]) == [(0, 1, 0, 0), (4, 4, 3, 4)]
+    assert diff_lines([], ["a"]) == [(0, 0, 0, 1)]
+
+    # Too many edits, fall back to one big change
+    assert diff_lines(list("xabcdx"), list("xbadcx"), max_edits=2) == [(1, 5, 1, 5)]
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ("a\nb\nc", "a\nx\nc"),
+        ("a\nb\nc", "a\nb"),
+        ("a\nb", "a\nb\nc\nd"),
+        ("a\nb\nc\n", "b\nc\nd\n"),
+        ("", "hello\nworld\n"),
+        ("hello\nworld\n", ""),
+    ],
+)
+def test_replace_text_with_diff(text_and_events, old, new):
+    text, events = text_and_events
+    text.insert("1.0", old)
+    events.clear()
+
+    replace_text_with_diff(text, new)
+    assert text.get("1.0", "end - 1 char") == new
+    if old == new:
+        assert not events
+    else:
+        assert len(events) == 1  # one change_batch
+        events.clear()
+
+
+def test_replace_text_with_diff_keeps_tags(text_and_events):
+    text, events = text_and_events
+    text.insert("1.0", "first\nsecond\nthird\n")
+    text.tag_add("foo", "1.0", "1.5")
+    text.tag_add("foo", "3.0", "3.5")
+    replace_text_with_diff(text, "first\nSECOND\nthird\n")
+    assert [str(index) for index in text.tag_ranges("foo")] == ["1.0", "1.5", "3.0", "3.5"]
+    assert events.pop().data_class(Changes).change_list == [
+        Change(start=[2, 0], old_end=[2, 6], new_end=[2, 6], old_text="second", new_text="SECOND")
+    ]
+    events.clear()
@@ -0,0 +1,75 @@
+from porcupine.plugins import underlines
+
+
+def set_underlines(filetab, underline_id, underline_list):
+    filetab.event_generate(
+        "<<SetUnderlines>>",
+        data=underlines.Underlines(id=underline_id, underline_list=underline_list),
+    )
+
+
+def test_interval_index():
+    entries = [
+        underlines._Entry("x", (1, 0), (5, 0), underlines.Underline("1.0", "5.0", "long")),
+        underlines._Entry("x", (2, 3), (2, 6), underlines.Underline("2.3", "2.6", "short")),
+        underlines._Entry("x", (4, 0), (4, 2), underlines.Underline("4.0", "4.2", "other")),
+    ]
+    index = underlines._IntervalIndex(entries)
+
+    def tooltips(entries):
+        return sorted(entry.underline.tooltip_text for entry in entries)
+
+    assert tooltips(index.at((2, 3))) == ["long", "short"]
+    assert tooltips(index.at((2, 6))) == ["long"]
+    assert tooltips(index.at((5, 0))) == []
+    assert tooltips(index.overlapping((3, 0), (4, 1))) == ["long", "other"]
+    assert tooltips(index.overlapping((4, 2), (10, 0))) == ["long"]
+
+
+def test_underlines_move_when_text_changes(filetab):
+    filetab.textwidget.insert("1.0", "foo bar baz\nlol wat\n")
+    set_underlines(
+        filetab,
+        "test",
+        [
+            underlines.Underline("1.4", "1.7", "bar", "red"),
+            underlines.Underline("2.0", "2.3", "lol", "red"),
+        ],
+    )
+    assert filetab.textwidget.tag_ranges("underline:test:red")
+
+    filetab.textwidget.insert("1.0", "new line\n")
+    filetab.textwidget.insert("2.4", "xx")  # at start of "bar"
+    filetab.textwidget.delete("3.0", "3.3")  # delete "lol"
+
+    [bar] = underlines.get_underlines(filetab.textwidget, "test")
+    assert (bar.start, bar.end) == ("2.6", "2.9")
+    assert filetab.textwidget.get(bar.start, bar.end) == "bar"
+    assert [str(index) for index in filetab.textwidget.tag_ranges("underline:test:red")] == [
+        "2.6",
+        "2.9",
+    ]
+
+
+def test_unchanged_underlines_stay(filetab):
+    filetab.textwidget.insert("1.0", "aaa bbb ccc")
+    set_underlines(
+        filetab,
+        "test",
+        [underlines.Underline("1.0", "1.3", "a"), underlines.Underline("1.4", "1.7", "b")],
+    )
+    set_underlines(
+        filetab,
+        "test",
+        [underlines.Underline("1.4", "1.7", "b"), underlines.Underline("1.8", "1.11", "c")],
+    )
+    assert [str(index) for index in filetab.textwidget.tag_ranges("underline:test:default")] == [
+        "1.4",
+        "1.7",
+        "1.8",
+        "1.11",
+    ]
+    assert [u.tooltip_text for u in underlines.get_underlines(filetab.textwidget, "test")] == [
+        "b",
+        "c",
+    ]
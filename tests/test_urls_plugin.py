@@ -2,6 +2,7 @@ import tkinter
 
 import pytest
 
+from porcupine.plugins import underlines
 from porcupine.plugins.urls import find_urls
 
 simple_urls = [
@@ -75,3 +76,22 @@ def test_find_urls_with_parenthesized_urls(url, line):
 @pytest.mark.xfail(strict=True)
 def test_parenthesized_urls_in_parenthesized_text(url, line):
     check(url, line)
+
+
+def test_urls_update_when_text_changes(filetab):
+    filetab.textwidget.insert("1.0", "foo\nsee https://example.com/ bar\n")
+    filetab.update()
+
+    def get_urls():
+        return [
+            filetab.textwidget.get(underline.start, underline.end)
+            for underline in underlines.get_underlines(filetab.textwidget, "urls")
+        ]
+
+    assert get_urls() == ["https://example.com/"]
+
+    filetab.textwidget.insert("1.0", "http://a.org/ and\n")
+    assert get_urls() == ["http://a.org/", "https://example.com/"]
+
+    filetab.textwidget.insert("3.4", "x")  # "xhttps" isn't a url
+    assert get_urls() == ["http://a.org/"]
@@ -46,6 +46,49 @@ def test_bind_with_data_class():
     assert foo.num == 123
 
 
+def test_bind_with_data_class_shared_between_callbacks():
+    events = []
+    utils.bind_with_data(get_main_window(), "<<DataclassShared>>", events.append, add=True)
+    utils.bind_with_data(get_main_window(), "<<DataclassShared>>", events.append, add=True)
+    bar = Bar(foos=[Foo(message="abc", num=123)])
+    get_main_window().event_generate("<<DataclassShared>>", data=bar)
+
+    [event1, event2] = events
+    assert event1.data_class(Bar) is bar
+    assert event2.data_class(Bar) is bar
+
+
+def test_bind_with_data_class_json_fallback():
+    events = []
+    utils.bind_with_data(get_main_window(), "<<DataclassJson>>", events.append, add=True)
+    utils.bind_with_data(get_main_window(), "<<DataclassJson>>", events.append, add=True)
+    get_main_window().event_generate(
+        "<<DataclassJson>>", data=Bar(foos=[Foo(message="a#b", num=1)]).to_json_string()
+    )
+
+    [event1, event2] = events
+    assert event1.data_string.startswith('Bar{"foos": ')
+    assert event1.data_class(Bar) == Bar(foos=[Foo(message="a#b", num=1)])
+    assert event1.data_class(Bar) is event2.data_class(Bar)  # parsed only once
+
+
+def test_bind_with_data_class_lookalike_string():
+    events = []
+    utils.bind_with_data(get_main_window(), "<<DataclassLookalike>>", events.append, add=True)
+    bar = Bar(foos=[])
+    token = str(bar).rpartition("#")[2]
+
+    # Looks like what str() of a dataclass used to be, but it's just a string
+    get_main_window().event_generate("<<DataclassLookalike>>", data=f"Bar#{token}")
+    get_main_window().event_generate("<<DataclassLookalike>>", data=bar)
+
+    [string_event, bar_event] = events
+    assert string_event.data_string == f"Bar#{token}"
+    with pytest.raises(AssertionError):
+        string_event.data_class(Bar)
+    assert bar_event.data_class(Bar) is bar
+
+
 if sys.platform == "darwin":
     binding_test_cases = [
         ("<<Menubar:Edit/Anchors/Add or remove on this line>>", "⇧⌃A", "Shift-Control-A"),